@@ -0,0 +1,161 @@
+"""
+Load and latency benchmark of the API.
+
+Concurrent simulated users log in through the "test" provider (MockAuth, one distinct user each), then run a
+weighted mix of GET /users/me, note create/list/delete and name changes until the time is up. Requests per
+second and p50/p95/p99 latencies are reported per route and saved as JSON (see results.py).
+
+In process, against the database of the configured stage (for TEST a SQLite file in the temp directory,
+TEST_DATABASE_PATH, since the in-memory database can't take concurrent sessions; for DEV the local MariaDB):
+
+    STAGE=TEST python -m app.benchmarks.load --users 20 --duration 10
+    STAGE=TEST ASYNC_DB=true python -m app.benchmarks.load --compare benchmark-results/load-....json
+
+Against a running server (the full stack: uvicorn, network, workers):
+
+    python -m app.benchmarks.load --base-url http://localhost:8000 --users 100 --duration 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from urllib.parse import urlparse, parse_qs
+
+import httpx
+
+from app.benchmarks import results
+
+# (weight, action) of the requests of a simulated user after the login
+SCENARIO = [
+    (40, "get_me"),
+    (20, "create_note"),
+    (20, "list_notes"),
+    (10, "delete_note"),
+    (10, "change_name"),
+]
+
+class SimulatedUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: results.LatencyRecorder, name: str, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.name = name
+        self.rng = rng
+        self.headers = {}
+        self.note_ids: list[str] = []
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(route, time.perf_counter() - start, ok=False)
+            return None
+        self.recorder.record(route, time.perf_counter() - start, ok=response.status_code < 400)
+        return response
+
+    async def login(self) -> bool:
+        response = await self.request("GET /users/auth/{provider}/callback", "GET", "/users/auth/test/callback",
+                                      params={"code": f"test-code-{self.name}"}, headers={})
+        if response is None or response.status_code != 307:
+            return False
+        query = parse_qs(urlparse(response.headers["location"]).query)
+        self.headers = {"Authorization": f"Bearer {query['access_token'][0]}"}
+        return True
+
+    async def run(self, deadline: float, think_time: float):
+        if not await self.login():
+            return
+        weights, actions = zip(*SCENARIO)
+        while time.monotonic() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if action == "delete_note" and not self.note_ids:
+                action = "create_note"
+            await getattr(self, action)()
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    async def get_me(self):
+        await self.request("GET /users/me", "GET", "/users/me", headers=self.headers)
+
+    async def create_note(self):
+        content = f"benchmark note {uuid.uuid4().hex[:12]}"
+        response = await self.request("POST /users/me/notes", "POST", "/users/me/notes",
+                                      json={"content": content}, headers=self.headers)
+        if response is not None and response.status_code == 200:
+            self.note_ids.append(response.json()["id"])
+
+    async def list_notes(self):
+        await self.request("GET /users/me/notes", "GET", "/users/me/notes", params={"limit": 20}, headers=self.headers)
+
+    async def delete_note(self):
+        note_id = self.note_ids.pop(self.rng.randrange(len(self.note_ids)))
+        await self.request("DELETE /users/me/notes/{note_id}", "DELETE", f"/users/me/notes/{note_id}", headers=self.headers)
+
+    async def change_name(self):
+        await self.request("PUT /users/me/name", "PUT", "/users/me/name",
+                           params={"new_name": f"Bench User {self.rng.randrange(10**6)}"}, headers=self.headers)
+
+async def run(users: int = 10, duration: float = 10.0, base_url: str | None = None, think_time: float = 0.0,
+              seed: int | None = None) -> dict:
+    """
+    Runs the benchmark and returns the summary (see LatencyRecorder.summary) with the configuration.
+    Without a base_url the app is driven in process through its ASGI interface.
+    """
+    if base_url is None:
+        from app.main import app
+        from app.database import Base, engine, STAGE
+        if STAGE == "TEST":
+            # the lifespan doesn't run under the ASGI transport, the TEST database is created here
+            Base.metadata.create_all(bind=engine)
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+    else:
+        limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30)
+
+    recorder = results.LatencyRecorder()
+    rng = random.Random(seed)
+    # the user names are unique per run, so every run starts from new accounts without notes
+    run_id = uuid.uuid4().hex[:8]
+    simulated = [SimulatedUser(client, recorder, f"bench-{run_id}-{i}", random.Random(rng.random()))
+                 for i in range(users)]
+
+    async with client:
+        start = time.monotonic()
+        deadline = start + duration
+        await asyncio.gather(*(user.run(deadline, think_time) for user in simulated))
+        elapsed = time.monotonic() - start
+
+    return {
+        "config": {"users": users, "duration_s": duration, "think_time_s": think_time,
+                   "target": base_url or "in-process", "seed": seed},
+        **recorder.summary(elapsed),
+    }
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Load and latency benchmark of the API")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds each user waits between requests")
+    parser.add_argument("--base-url", help="a running server (default: the app in process)")
+    parser.add_argument("--seed", type=int, help="seed of the request mix")
+    parser.add_argument("--output", help="the JSON results file (default: benchmark-results/load-<timestamp>.json)")
+    parser.add_argument("--compare", help="an earlier results file to compare with")
+    args = parser.parse_args(argv)
+
+    if args.base_url is None and os.getenv("STAGE") == "TEST":
+        # read by app.database when the app is imported
+        os.environ.setdefault("TEST_DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "benchmark.db"))
+        os.environ.setdefault("SQL_ECHO", "false")
+
+    baseline = results.load(args.compare) if args.compare else None
+    summary = asyncio.run(run(args.users, args.duration, args.base_url, args.think_time, args.seed))
+
+    print(results.format_table(summary, baseline))
+    print(f"\nresults saved to {results.save('load', summary, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Per-request cost of the metrics middleware (app/utils/metrics.py).
+
+The same minimal FastAPI app (one route with a path parameter, like /users/me/notes/{note_id}) is called through
+its ASGI interface with and without MetricsMiddleware, without a server or a client in between, so the
+difference is the middleware alone:
+
+    python -m app.benchmarks.metrics_overhead --requests 2000 --rounds 50
+"""
+import argparse
+import asyncio
+import gc
+import time
+
+from fastapi import FastAPI
+
+from app.benchmarks import results
+from app.utils.metrics import Metrics, MetricsMiddleware
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware, metrics=Metrics())
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    return app
+
+async def _request(app, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": [],
+        "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+async def _time_requests(app, requests: int) -> float:
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for i in range(requests):
+            await _request(app, f"/items/{i}")
+        return (time.perf_counter() - start) / requests
+    finally:
+        gc.enable()
+
+async def run(requests: int = 2000, rounds: int = 50) -> dict:
+    """
+    Returns the mean time per request (the best of the rounds, in microseconds) with and without the middleware.
+    """
+    apps = {"without_metrics": build_app(False), "with_metrics": build_app(True)}
+    best = {name: float("inf") for name in apps}
+    for name, app in apps.items():
+        await _time_requests(app, 500)  # warm up (builds the middleware stack)
+    for _ in range(rounds):
+        # alternated, so both see the same machine noise
+        for name, app in apps.items():
+            best[name] = min(best[name], await _time_requests(app, requests))
+
+    per_request_us = {name: round(seconds * 1e6, 2) for name, seconds in best.items()}
+    overhead_us = round(per_request_us["with_metrics"] - per_request_us["without_metrics"], 2)
+    return {
+        "config": {"requests": requests, "rounds": rounds},
+        "per_request_us": per_request_us,
+        "overhead_us": overhead_us,
+        "overhead_percent": round(overhead_us / per_request_us["without_metrics"] * 100, 1),
+    }
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Per-request cost of the metrics middleware")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per round")
+    parser.add_argument("--rounds", type=int, default=50, help="rounds (the best one is kept)")
+    parser.add_argument("--output", help="the JSON results file (default: benchmark-results/metrics_overhead-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run(args.requests, args.rounds))
+    for name, us in summary["per_request_us"].items():
+        print(f"{name:<16} {us:>9.2f} us/request")
+    print(f"{'overhead':<16} {summary['overhead_us']:>9.2f} us/request ({summary['overhead_percent']:+.1f}%)")
+    print(f"\nresults saved to {results.save('metrics_overhead', summary, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+import os
+import platform
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.getenv("BENCHMARK_RESULTS_DIR", "benchmark-results")
+
+class LatencyRecorder:
+    """
+    Collects the latency of every request by route (the route template, e.g. "DELETE /users/me/notes/{note_id}",
+    so the percentiles are per endpoint and not per URL).
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {route: _route_summary(latencies, self.errors[route], elapsed)
+                  for route, latencies in sorted(self.latencies.items())}
+        every_latency = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "total": _route_summary(every_latency, sum(self.errors.values()), elapsed),
+            "routes": routes,
+        }
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile (p in 0-100) of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def _route_summary(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    def ms(seconds): return round(seconds * 1000, 3)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+def environment() -> dict:
+    """
+    What the numbers depend on, saved with them so runs can be compared.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "stage": os.getenv("STAGE"),
+        "async_db": os.getenv("ASYNC_DB", "false"),
+    }
+
+def save(name: str, results: dict, output: str | None = None) -> str:
+    """
+    Writes the results as JSON (by default to benchmark-results/<name>-<UTC timestamp>.json) and returns the path.
+    """
+    timestamp = datetime.now(timezone.utc)
+    document = {"benchmark": name, "timestamp": timestamp.isoformat(), "environment": environment(), **results}
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{timestamp:%Y%m%dT%H%M%SZ}.json")
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def format_table(summary: dict, baseline: dict | None = None) -> str:
+    """
+    The per route table of a summary. With a baseline (an earlier saved run) the rps and p95 changes are shown too.
+    """
+    header = f"{'route':<45} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if baseline:
+        header += f" {'rps Δ':>8} {'p95 Δ':>8}"
+    lines = [header, "-" * len(header)]
+
+    rows = list(summary["routes"].items()) + [("TOTAL", summary["total"])]
+    for route, row in rows:
+        line = (f"{route:<45} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+        if baseline:
+            before = baseline["total"] if route == "TOTAL" else baseline["routes"].get(route)
+            line += f" {_change(before and before['rps'], row['rps']):>8} {_change(before and before['p95_ms'], row['p95_ms']):>8}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _change(before: float | None, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
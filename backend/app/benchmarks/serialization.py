@@ -0,0 +1,121 @@
+"""
+CPU cost of building and serializing the GET /users/me and GET /users/me/notes responses.
+
+For a growing number of notes, three ways of producing the response body from the rows are timed:
+
+- stdlib: a model per note, the response model, FastAPI's validation of the returned value against the
+  route's response_model, then the stdlib json encoder (what the routes did before)
+- orjson: the same, with ORJSONResponse (the default response class now)
+- fast: the model built once (the notes through the prebuilt TypeAdapter) and returned as a ModelResponse
+
+No database is involved (the rows are stand-ins), so the numbers are the CPU spent per request on the response:
+
+    python -m app.benchmarks.serialization --notes 10 100 1000
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.benchmarks import results
+
+def _rows(count: int) -> list:
+    return [SimpleNamespace(id=uuid.uuid4(), content=f"note number {i} with some content", user_id=None)
+            for i in range(count)]
+
+async def _cpu_per_call(fn, min_seconds: float) -> float:
+    await fn()  # warm up
+    calls = 0
+    start = time.process_time()
+    while True:
+        await fn()
+        calls += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+async def run(note_counts: list[int], min_seconds: float = 0.5) -> dict:
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+
+    from app.routers.users import router
+    from app.schemas import users as schema_users
+    from app.utils import pagination
+    from app.utils.serialization import ModelResponse
+
+    def response_field(path):
+        return next(route.response_field for route in router.routes if route.path == path and "GET" in route.methods)
+
+    me_field, notes_field = response_field("/me"), response_field("/me/notes")
+    now = datetime.now(timezone.utc)
+    principal = schema_users.Principal(id=uuid.uuid4(), name="Benchmark User", email="bench@example.com",
+                                       created_date=now, last_login_date=now)
+
+    def legacy_me(rows):
+        return schema_users.User(id=principal.id, name=principal.name, email=principal.email,
+                                 created_date=principal.created_date, last_login_date=principal.last_login_date,
+                                 notes=[schema_users.Note(id=row.id, content=row.content) for row in rows])
+
+    def legacy_notes(rows):
+        return schema_users.NotesPage(items=[schema_users.Note(id=row.id, content=row.content) for row in rows])
+
+    def fast_me(rows):
+        return ModelResponse(schema_users.User(**dict(principal),
+                                               notes=schema_users.NOTES_ADAPTER.validate_python(rows, from_attributes=True)))
+
+    def fast_notes(rows):
+        return ModelResponse(schema_users.NotesPage(items=schema_users.NOTES_ADAPTER.validate_python(rows, from_attributes=True)))
+
+    routes = {
+        "GET /users/me": (me_field, legacy_me, fast_me, None),
+        "GET /users/me/notes": (notes_field, legacy_notes, fast_notes, pagination.MAX_PAGE_SIZE),
+    }
+
+    measurements = {}
+    for route, (field, legacy, fast, max_notes) in routes.items():
+        for count in note_counts:
+            rows = _rows(min(count, max_notes) if max_notes else count)
+
+            async def stdlib():
+                return JSONResponse(await serialize_response(field=field, response_content=legacy(rows))).body
+
+            async def orjson():
+                return ORJSONResponse(await serialize_response(field=field, response_content=legacy(rows))).body
+
+            async def fast_path():
+                return fast(rows).body
+
+            us = {name: round(await _cpu_per_call(fn, min_seconds) * 1e6, 1)
+                  for name, fn in (("stdlib", stdlib), ("orjson", orjson), ("fast", fast_path))}
+            measurements[f"{route} notes={len(rows)}"] = {
+                "cpu_us": us,
+                "saved_us": round(us["stdlib"] - us["fast"], 1),
+                "speedup": round(us["stdlib"] / us["fast"], 2),
+            }
+
+    return {"config": {"notes": note_counts, "min_seconds": min_seconds}, "measurements": measurements}
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="CPU cost of the /users/me and /users/me/notes responses")
+    parser.add_argument("--notes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="numbers of notes (a /users/me/notes page has at most MAX_PAGE_SIZE)")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="CPU time spent on every measurement")
+    parser.add_argument("--output", help="the JSON results file (default: benchmark-results/serialization-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    # only the routes' response models are used, the database is never opened
+    os.environ.setdefault("STAGE", "TEST")
+    os.environ.setdefault("SQL_ECHO", "false")
+
+    summary = asyncio.run(run(args.notes, args.min_seconds))
+    print(f"{'response':<32} {'stdlib us':>10} {'orjson us':>10} {'fast us':>10} {'saved us':>10} {'speedup':>8}")
+    for name, row in summary["measurements"].items():
+        us = row["cpu_us"]
+        print(f"{name:<32} {us['stdlib']:>10.1f} {us['orjson']:>10.1f} {us['fast']:>10.1f} {row['saved_us']:>10.1f} {row['speedup']:>7.2f}x")
+    print(f"\nresults saved to {results.save('serialization', summary, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Startup time of a worker: the import of app.main, then the time to the first successful GET /users/me.
+
+Every run is a fresh interpreter (what a new pod or a respawned worker pays). It imports the app, runs its
+lifespan (TEST stage: an in-memory database), logs in through the "test" provider and calls /users/me in process.
+One more run under `python -X importtime` gives the import time by top-level package, and the modules the import
+left unloaded (the lazily imported auth providers):
+
+    python -m app.benchmarks.startup --runs 5
+    python -m app.benchmarks.startup --eager-providers   # every provider made at import, as before
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlparse, parse_qs
+
+from app.benchmarks import results
+
+# imported only by a provider that isn't made before the first login with it
+LAZY_MODULES = ["app.utils.google_auth", "google.auth", "httpx"]
+
+async def _first_me(app) -> None:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/users/auth/test/callback", params={"code": "test-code-startup"})
+            access_token = parse_qs(urlparse(response.headers["location"]).query)["access_token"][0]
+            response = await client.get("/users/me", headers={"Authorization": f"Bearer {access_token}"})
+            response.raise_for_status()
+
+def child(eager_providers: bool, import_only: bool = False) -> dict:
+    # the loaded modules are read before the measured requests load anything (httpx is the benchmark's client)
+    start = time.perf_counter()
+    from app.main import app
+    from app.utils import providers
+    if eager_providers:
+        providers.preload()
+    imported = time.perf_counter()
+    loaded = {name: name in sys.modules for name in LAZY_MODULES}
+    modules = len(sys.modules)
+    if import_only:
+        return {"import_s": imported - start, "modules": modules, "loaded": loaded}
+
+    asyncio.run(_first_me(app))
+    return {
+        "import_s": imported - start,
+        "first_me_s": time.perf_counter() - start,
+        "modules": modules,
+        "loaded": loaded,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def _spawn(eager_providers: bool, importtime: bool = False) -> tuple[dict, str]:
+    # the import profile stops after the import: the requests would add the benchmark's own client
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+              ["-m", "app.benchmarks.startup", "--child"] + (["--eager-providers"] if eager_providers else []) + \
+              (["--import-only"] if importtime else [])
+    env = dict(os.environ, STAGE="TEST", SQL_ECHO="false", TEST_DATABASE_PATH="")
+    process = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+def import_profile(importtime_output: str, top: int = 12) -> dict[str, float]:
+    """
+    Self import time (ms) by top-level package, from the output of `python -X importtime`.
+    """
+    by_package = defaultdict(float)
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1000
+    return dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top])
+
+def run(runs: int = 5, eager_providers: bool = False) -> dict:
+    measurements = [_spawn(eager_providers)[0] for _ in range(runs)]
+    profiled, importtime_output = _spawn(eager_providers, importtime=True)
+    return {
+        "runs": runs,
+        "eager_providers": eager_providers,
+        "import_ms": round(statistics.median(m["import_s"] for m in measurements) * 1000, 1),
+        "first_me_ms": round(statistics.median(m["first_me_s"] for m in measurements) * 1000, 1),
+        "max_rss_mb": round(statistics.median(m["max_rss_mb"] for m in measurements), 1),
+        "modules": profiled["modules"],
+        "loaded_at_import": profiled["loaded"],
+        "import_profile_ms": {name: round(ms, 1) for name, ms in import_profile(importtime_output).items()},
+    }
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Import and time-to-first-request of a fresh worker")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters measured (the median is reported)")
+    parser.add_argument("--eager-providers", action="store_true", help="make every auth provider at import")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--import-only", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="the JSON results file (default: benchmark-results/startup-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.eager_providers, args.import_only)))
+        return
+
+    summary = run(args.runs, args.eager_providers)
+    print(f"import of app.main        {summary['import_ms']:>8.1f} ms")
+    print(f"first GET /users/me       {summary['first_me_ms']:>8.1f} ms")
+    print(f"max RSS                   {summary['max_rss_mb']:>8.1f} MB")
+    print(f"modules after the import  {summary['modules']:>8}")
+    print("lazy modules loaded       " + ", ".join(f"{name}={loaded}" for name, loaded in summary["loaded_at_import"].items()))
+    print("\nself import time by package (ms)")
+    for name, ms in summary["import_profile_ms"].items():
+        print(f"  {name:<24}{ms:>8.1f}")
+    print(f"\nresults saved to {results.save('startup', summary, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
+from sqlalchemy import bindparam, delete, func, insert, literal_column, select, table, text, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from uuid import UUID
 from datetime import datetime, timezone
 
-from app.models.users import User, Note
+from app.models.users import User, Note, RevokedToken
 from app.schemas.users import UserCreate, UserUpdate, NoteCreate
+from app.utils.principal_cache import invalidate_principal
+from app.utils import replicas, shards
+from app.utils.ids import uuid7
 
 def get_user_by_id(db: Session, user_id: UUID):
     return db.query(User).filter(User.id == user_id).first()
@@ -14,51 +20,260 @@ def get_user_by_name(db: Session, name: str):
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(User).offset(skip).limit(limit).all()
+def get_user_version(db: Session, user_id: UUID) -> int | None:
+    return db.scalar(select(User.version).where(User.id == user_id))
+
+def _after_write(user_id: UUID):
+    # the cached principal is stale, and the replicas may be for a moment: the user's next reads go to the primary
+    invalidate_principal(user_id)
+    replicas.REPLICAS.record_write(user_id)
+
+def _bump_version(db: Session, user_id: UUID):
+    # in the transaction of the write, so the new version is visible exactly when the change is
+    db.execute(update(User).where(User.id == user_id).values(version=User.version + 1))
+
+def get_notes_shard(db: Session, user_id: UUID) -> str | None:
+    return db.scalar(select(User.notes_shard).where(User.id == user_id))
+
+def _lock_notes(db: Session, notes_db: Session, user_id: UUID):
+    # with shards, the user's row is locked and the placement of their notes checked before the notes are written:
+    # a move of the notes (app.tools.reshard) waits for the write, and one done since notes_db was opened fails it
+    if not shards.SHARDS.enabled:
+        return
+    notes_shard = db.scalar(select(User.notes_shard).where(User.id == user_id).with_for_update())
+    if notes_shard != notes_db.info.get("shard"):
+        db.rollback()
+        raise shards.ShardMoved(user_id)
+
+def _commit_notes(db: Session, notes_db: Session, user_id: UUID, changed: bool = True):
+    # the notes of a sharded user are committed first: the new version must not be visible before the change is
+    if notes_db is not db:
+        notes_db.commit()
+    if changed:
+        _bump_version(db, user_id)
+    db.commit()
+    _after_write(user_id)
+
+def get_users(db: Session, after_id: UUID | None = None, limit: int = 10):
+    # keyset pagination: the page starts right after the last id of the previous one (primary key index)
+    query = db.query(User)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    return query.order_by(User.id).limit(limit).all()
 
 def create_user(db: Session, user: UserCreate):
+    user_id = uuid7()
     db_user = User(
+        id=user_id,
         name=user.name,
-        email=user.email
+        email=user.email,
+        notes_shard=shards.SHARDS.shard_for(user_id)
     )
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def upsert_user_by_email(db: Session, email: str, name: str, login_date: datetime) -> UUID:
+    # the login in one statement: creates the user, or only moves the last login date (and the version) of the
+    # existing one. Concurrent first logins with the same email all succeed: the unique index on email arbitrates.
+    dialect = db.get_bind().dialect
+    user_id = uuid7()
+    values = {"id": user_id, "email": email, "name": name, "created_date": login_date,
+              "last_login_date": login_date, "version": 1, "notes_shard": shards.SHARDS.shard_for(user_id)}
+    if dialect.name == "sqlite":
+        statement = sqlite.insert(User).values(values)
+        statement = statement.on_conflict_do_update(index_elements=[User.email],
+                                                    set_={"last_login_date": statement.excluded.last_login_date,
+                                                          "version": User.version + 1})
+    else:
+        statement = mysql.insert(User).values(values)
+        statement = statement.on_duplicate_key_update(last_login_date=statement.inserted.last_login_date,
+                                                      version=User.version + 1)
+
+    if dialect.insert_returning:
+        user_id = db.scalar(statement.returning(User.id))
+    else:
+        # no RETURNING (MySQL): a rowcount of 1 is an insert, of our id; otherwise the existing row was updated
+        result = db.execute(statement)
+        user_id = values["id"] if result.rowcount == 1 else db.scalar(select(User.id).where(User.email == email))
+    db.commit()
+    _after_write(user_id)
+    return user_id
+
 def update_user(db: Session, user_update: UserUpdate):
     db_user = get_user_by_id(db, user_update.id)
     if db_user:
         for key, value in user_update.model_dump(exclude_unset=True).items():
             setattr(db_user, key, value)
+        db_user.version = User.version + 1  # in the same UPDATE
         db.commit()
+        _after_write(db_user.id)
         db.refresh(db_user)
-    return db_user 
-
-def delete_user(db: Session, user_id: UUID):
-    db_user = get_user_by_id(db, user_id)
-    if db_user:
-        db.delete(db_user)
-        db.commit()
     return db_user
 
-def get_notes_by_user(db: Session, user_id: UUID):
-    return db.query(Note).filter(Note.user_id == user_id).all()
+def update_last_login_dates(db: Session, last_logins: dict[UUID, datetime]):
+    # one executemany UPDATE for all the buffered logins (see app.utils.login_buffer), in one transaction
+    if not last_logins:
+        return
+    statement = (update(User.__table__)
+                 .where(User.__table__.c.id == bindparam("user_id"))
+                 .values(last_login_date=bindparam("login_date"), version=User.__table__.c.version + 1))
+    db.execute(statement, [{"user_id": user_id, "login_date": login_date} for user_id, login_date in last_logins.items()])
+    db.commit()
+    for user_id in last_logins:
+        _after_write(user_id)
+
+def delete_user(db: Session, user_id: UUID, notes_db: Session | None = None) -> bool:
+    # one DELETE: the database deletes the notes with the user (ON DELETE CASCADE), none is loaded here
+    if notes_db is not None and notes_db is not db:
+        # the cascade doesn't reach a shard: the notes there are deleted first (a small account, or the rest of a purge)
+        _lock_notes(db, notes_db, user_id)
+        notes_db.execute(delete(Note).where(Note.user_id == user_id), execution_options={"synchronize_session": False})
+        notes_db.commit()
+    result = db.execute(delete(User).where(User.id == user_id), execution_options={"synchronize_session": False})
+    db.commit()
+    _after_write(user_id)
+    return result.rowcount > 0
+
+def mark_user_deleted(db: Session, user_id: UUID) -> bool:
+    # the account is gone for the API at once (no login, no token) while its notes are purged in batches;
+    # the email is freed so the same person can sign up again in the meantime
+    result = db.execute(update(User)
+                        .where(User.id == user_id, User.deleted_at.is_(None))
+                        .values(deleted_at=datetime.now(timezone.utc), email=f"{user_id.hex}@deleted.invalid",
+                                version=User.version + 1),
+                        execution_options={"synchronize_session": False})
+    db.commit()
+    _after_write(user_id)
+    return result.rowcount > 0
+
+def get_users_being_deleted(db: Session):
+    return db.execute(select(User.id, User.notes_shard).where(User.deleted_at.is_not(None))).all()
+
+def count_notes_by_user(db: Session, user_id: UUID, limit: int | None = None) -> int:
+    # with a limit the count stops there (an index range scan of at most limit rows)
+    notes = select(Note.id).where(Note.user_id == user_id)
+    if limit is not None:
+        notes = notes.limit(limit)
+    return db.scalar(select(func.count()).select_from(notes.subquery()))
+
+def delete_note_batch(db: Session, user_id: UUID, after_id: UUID | None = None,
+                      batch_size: int = 1000) -> tuple[int, UUID | None]:
+    # the next batch_size notes of the user by id (keyset, over the (user_id, id) index), deleted in their own
+    # short transaction; returns the count and the last id, where the next batch starts
+    query = select(Note.id).where(Note.user_id == user_id)
+    if after_id is not None:
+        query = query.where(Note.id > after_id)
+    note_ids = list(db.scalars(query.order_by(Note.id).limit(batch_size)))
+    if not note_ids:
+        return 0, None
+    db.execute(delete(Note).where(Note.id.in_(note_ids)), execution_options={"synchronize_session": False})
+    db.commit()
+    return len(note_ids), note_ids[-1]
+
+def get_notes_by_user(db: Session, user_id: UUID, after_id: UUID | None = None, limit: int | None = None):
+    # keyset pagination over the (user_id, id) index
+    query = db.query(Note).filter(Note.user_id == user_id)
+    if after_id is not None:
+        query = query.filter(Note.id > after_id)
+    query = query.order_by(Note.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def select_notes_by_user(user_id: UUID, batch_size: int):
+    # only the exported columns (no ORM objects in the session) read through a server side cursor, batch_size rows at a time
+    return (select(Note.id, Note.content)
+            .where(Note.user_id == user_id)
+            .order_by(Note.id)
+            .execution_options(yield_per=batch_size))
+
+def iter_note_batches_by_user(db: Session, user_id: UUID, batch_size: int = 500):
+    result = db.execute(select_notes_by_user(user_id, batch_size))
+    for batch in result.partitions():
+        yield batch
+
+def search_notes_by_user(db: Session, user_id: UUID, terms: list[str], limit: int = 20):
+    # ranked full-text search: the FULLTEXT index on MariaDB, the FTS5 table on SQLite (TEST stage)
+    if db.get_bind().dialect.name == "sqlite":
+        score = (-func.bm25(literal_column("notes_fts"))).label("score")
+        match = " OR ".join(f'"{term}"' for term in terms)
+        statement = (select(Note.id, Note.content, score)
+                     .select_from(table("notes_fts"))
+                     .join(Note, text("notes.rowid = notes_fts.rowid"))
+                     .where(text("notes_fts MATCH :match").bindparams(match=match), Note.user_id == user_id))
+    else:
+        relevance = mysql.match(Note.content, against=" ".join(terms)).in_natural_language_mode()
+        score = relevance.label("score")
+        statement = select(Note.id, Note.content, score).where(Note.user_id == user_id, relevance > 0)
+    return db.execute(statement.order_by(score.desc()).limit(limit)).all()
 
 def get_note_by_id(db: Session, note_id: UUID):
     return db.query(Note).filter(Note.id == note_id).first()
 
-def create_note_for_user(db: Session, user_id: UUID, note: NoteCreate):
+# The writes of notes take the session of the user's notes (notes_db: their shard, see app.utils.shards) besides
+# the one of the primary (db, for the version); without one the notes are on the primary.
+
+def create_note_for_user(db: Session, user_id: UUID, note: NoteCreate, notes_db: Session | None = None):
+    notes_db = db if notes_db is None else notes_db
+    _lock_notes(db, notes_db, user_id)
     db_note = Note(content=note.content, user_id=user_id)
-    db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    notes_db.add(db_note)
+    _commit_notes(db, notes_db, user_id)
+    notes_db.refresh(db_note)
     return db_note
 
-def delete_note_by_id(db: Session, note_id: UUID):
-    db_note = get_note_by_id(db, note_id)
+def create_notes_for_user(db: Session, user_id: UUID, notes: list[NoteCreate], notes_db: Session | None = None):
+    # one multi-row INSERT in one transaction (the ids are generated here so they can be returned without a SELECT)
+    notes_db = db if notes_db is None else notes_db
+    rows = [{"id": uuid7(), "content": note.content, "user_id": user_id} for note in notes]
+    if rows:
+        _lock_notes(db, notes_db, user_id)
+        notes_db.execute(insert(Note), rows)
+        _commit_notes(db, notes_db, user_id)
+    return rows
+
+def delete_notes_by_ids(db: Session, user_id: UUID, note_ids: list[UUID], notes_db: Session | None = None) -> set[UUID]:
+    # one DELETE for the whole batch, limited to the notes of the user; returns the ids that were actually deleted
+    if not note_ids:
+        return set()
+
+    notes_db = db if notes_db is None else notes_db
+    _lock_notes(db, notes_db, user_id)
+    statement = delete(Note).where(Note.user_id == user_id, Note.id.in_(note_ids))
+    options = {"synchronize_session": False}
+    if notes_db.get_bind().dialect.delete_returning:
+        deleted_ids = set(notes_db.scalars(statement.returning(Note.id), execution_options=options))
+    else:
+        deleted_ids = set(notes_db.scalars(select(Note.id).where(Note.user_id == user_id, Note.id.in_(note_ids))))
+        notes_db.execute(statement, execution_options=options)
+    _commit_notes(db, notes_db, user_id, changed=bool(deleted_ids))
+    return deleted_ids
+
+def delete_note_by_id(db: Session, user_id: UUID, note_id: UUID, notes_db: Session | None = None):
+    # only a note of the user: another user's note is not found (and their row is neither locked nor bumped)
+    notes_db = db if notes_db is None else notes_db
+    db_note = notes_db.query(Note).filter(Note.id == note_id, Note.user_id == user_id).first()
     if db_note:
-        db.delete(db_note)
+        _lock_notes(db, notes_db, user_id)
+        notes_db.delete(db_note)
+        _commit_notes(db, notes_db, user_id)
+    return db_note
+
+def revoke_token(db: Session, jti: UUID, user_id: UUID, expires_at: datetime) -> bool:
+    # the primary key makes this the atomic "use once" of a refresh token: False if it was already revoked
+    # (by another request or another worker)
+    try:
+        db.execute(insert(RevokedToken).values(jti=jti, user_id=user_id, expires_at=expires_at))
         db.commit()
-    return db_note
\ No newline at end of file
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+def delete_expired_revoked_tokens(db: Session, now: datetime) -> int:
+    # an expired refresh token is refused anyway, its revocation is no longer needed
+    result = db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+    db.commit()
+    return result.rowcount
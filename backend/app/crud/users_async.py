@@ -0,0 +1,107 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from uuid import UUID
+from datetime import datetime
+
+from app.crud import users as crud_users
+from app.database import run_db
+from app.schemas.users import UserCreate, UserUpdate, NoteCreate
+
+# Awaitable versions of app.crud.users. They accept either an AsyncSession (ASYNC_DB=true)
+# or a blocking Session, so the route handlers are the same for both database stacks.
+
+def _blocking(db: Session | AsyncSession | None) -> Session | None:
+    # a second session (notes_db) for a function run by run_db: with asyncio its blocking face, whose IO is still
+    # awaited on the asyncio driver (run_db runs the function in SQLAlchemy's greenlet bridge)
+    return db.sync_session if isinstance(db, AsyncSession) else db
+
+async def get_user_by_id(db: Session | AsyncSession, user_id: UUID):
+    return await run_db(db, crud_users.get_user_by_id, user_id)
+
+async def get_user_by_name(db: Session | AsyncSession, name: str):
+    return await run_db(db, crud_users.get_user_by_name, name)
+
+async def get_user_by_email(db: Session | AsyncSession, email: str):
+    return await run_db(db, crud_users.get_user_by_email, email)
+
+async def get_notes_shard(db: Session | AsyncSession, user_id: UUID) -> str | None:
+    return await run_db(db, crud_users.get_notes_shard, user_id)
+
+async def get_user_version(db: Session | AsyncSession, user_id: UUID) -> int | None:
+    return await run_db(db, crud_users.get_user_version, user_id)
+
+async def get_users(db: Session | AsyncSession, after_id: UUID | None = None, limit: int = 10):
+    return await run_db(db, crud_users.get_users, after_id=after_id, limit=limit)
+
+async def create_user(db: Session | AsyncSession, user: UserCreate):
+    return await run_db(db, crud_users.create_user, user)
+
+async def upsert_user_by_email(db: Session | AsyncSession, email: str, name: str, login_date: datetime) -> UUID:
+    return await run_db(db, crud_users.upsert_user_by_email, email, name, login_date)
+
+async def update_user(db: Session | AsyncSession, user_update: UserUpdate):
+    return await run_db(db, crud_users.update_user, user_update)
+
+async def update_last_login_dates(db: Session | AsyncSession, last_logins: dict[UUID, datetime]):
+    return await run_db(db, crud_users.update_last_login_dates, last_logins)
+
+async def delete_user(db: Session | AsyncSession, user_id: UUID, notes_db: Session | AsyncSession | None = None) -> bool:
+    return await run_db(db, crud_users.delete_user, user_id, notes_db=_blocking(notes_db))
+
+async def mark_user_deleted(db: Session | AsyncSession, user_id: UUID) -> bool:
+    return await run_db(db, crud_users.mark_user_deleted, user_id)
+
+async def get_users_being_deleted(db: Session | AsyncSession):
+    return await run_db(db, crud_users.get_users_being_deleted)
+
+async def count_notes_by_user(db: Session | AsyncSession, user_id: UUID, limit: int | None = None) -> int:
+    return await run_db(db, crud_users.count_notes_by_user, user_id, limit=limit)
+
+async def delete_note_batch(db: Session | AsyncSession, user_id: UUID, after_id: UUID | None = None,
+                            batch_size: int = 1000) -> tuple[int, UUID | None]:
+    return await run_db(db, crud_users.delete_note_batch, user_id, after_id=after_id, batch_size=batch_size)
+
+async def get_notes_by_user(db: Session | AsyncSession, user_id: UUID, after_id: UUID | None = None, limit: int | None = None):
+    return await run_db(db, crud_users.get_notes_by_user, user_id, after_id=after_id, limit=limit)
+
+async def iter_note_batches_by_user(db: Session | AsyncSession, user_id: UUID, batch_size: int = 500):
+    if isinstance(db, AsyncSession):
+        result = await db.stream(crud_users.select_notes_by_user(user_id, batch_size))
+        async for batch in result.partitions():
+            yield batch
+    else:
+        batches = crud_users.iter_note_batches_by_user(db, user_id, batch_size)
+        try:
+            while (batch := await run_in_threadpool(next, batches, None)) is not None:
+                yield batch
+        finally:
+            batches.close()
+
+async def search_notes_by_user(db: Session | AsyncSession, user_id: UUID, terms: list[str], limit: int = 20):
+    return await run_db(db, crud_users.search_notes_by_user, user_id, terms, limit=limit)
+
+async def get_note_by_id(db: Session | AsyncSession, note_id: UUID):
+    return await run_db(db, crud_users.get_note_by_id, note_id)
+
+async def create_note_for_user(db: Session | AsyncSession, user_id: UUID, note: NoteCreate,
+                              notes_db: Session | AsyncSession | None = None):
+    return await run_db(db, crud_users.create_note_for_user, user_id, note, notes_db=_blocking(notes_db))
+
+async def create_notes_for_user(db: Session | AsyncSession, user_id: UUID, notes: list[NoteCreate],
+                               notes_db: Session | AsyncSession | None = None):
+    return await run_db(db, crud_users.create_notes_for_user, user_id, notes, notes_db=_blocking(notes_db))
+
+async def delete_notes_by_ids(db: Session | AsyncSession, user_id: UUID, note_ids: list[UUID],
+                              notes_db: Session | AsyncSession | None = None):
+    return await run_db(db, crud_users.delete_notes_by_ids, user_id, note_ids, notes_db=_blocking(notes_db))
+
+async def delete_note_by_id(db: Session | AsyncSession, user_id: UUID, note_id: UUID,
+                            notes_db: Session | AsyncSession | None = None):
+    return await run_db(db, crud_users.delete_note_by_id, user_id, note_id, notes_db=_blocking(notes_db))
+
+async def revoke_token(db: Session | AsyncSession, jti: UUID, user_id: UUID, expires_at: datetime) -> bool:
+    return await run_db(db, crud_users.revoke_token, jti, user_id, expires_at)
+
+async def delete_expired_revoked_tokens(db: Session | AsyncSession, now: datetime) -> int:
+    return await run_db(db, crud_users.delete_expired_revoked_tokens, now)
@@ -1,40 +1,214 @@
 import os
 
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.pool_stats import InstrumentedAsyncQueuePool, InstrumentedQueuePool, InstrumentedStaticPool, instrument_pool
+from app.utils.query_stats import instrument_engine
 
 
 STAGE = os.getenv("STAGE")
 
+# When set to "true" the routes use an asyncio engine + AsyncSession instead of the blocking SessionLocal
+ASYNC_DB = os.getenv("ASYNC_DB", "false").lower() == "true"
+
+# Connection pool of the MariaDB engines (the recycle should stay below MariaDB's wait_timeout)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# TEST stage: a SQLite file instead of the in-memory database. The in-memory database has a single shared
+# connection, so it can't serve concurrent requests (the load benchmark); a file gets a pool of connections.
+TEST_DATABASE_PATH = os.getenv("TEST_DATABASE_PATH")
+# TEST stage: log every SQL statement
+SQL_ECHO = os.getenv("SQL_ECHO", "true").lower() == "true"
+
+# Read replicas (see app.utils.replicas), comma-separated: MariaDB hosts for DEV (same database and credentials
+# as the primary), SQLite files standing in for replicas for TEST
+MARIADB_REPLICA_HOSTS = [host.strip() for host in os.getenv("MARIADB_REPLICA_HOSTS", "").split(",") if host.strip()]
+TEST_REPLICA_DATABASE_PATHS = [path.strip() for path in os.getenv("TEST_REPLICA_DATABASE_PATHS", "").split(",") if path.strip()]
+
+# Shards of the notes (see app.utils.shards), comma-separated name=location: MariaDB hosts for DEV (same database
+# and credentials as the primary), SQLite files standing in for them for TEST. The consistent hashing places the
+# users by shard name, so a shard keeps its name as long as it holds notes.
+def _named_locations(value: str) -> dict[str, str]:
+    entries = (entry.split("=", 1) for entry in value.split(",") if entry.strip())
+    return {name.strip(): location.strip() for name, location in entries}
+
+MARIADB_SHARD_HOSTS = _named_locations(os.getenv("MARIADB_SHARD_HOSTS", ""))
+TEST_SHARD_DATABASE_PATHS = _named_locations(os.getenv("TEST_SHARD_DATABASE_PATHS", ""))
+
+async_engine = None
+# (blocking engine, asyncio engine or None) of every replica
+replica_engines = []
+# (blocking engine, asyncio engine or None) of every notes shard, by name
+shard_engines = {}
+
 if STAGE == "DEV":
     MARIADB_USER = os.getenv("MARIADB_USER")
     MARIADB_PASSWORD = os.getenv("MARIADB_PASSWORD")
     MARIADB_DATABASE = os.getenv("MARIADB_DATABASE")
     MARIADB_HOST = os.getenv("MARIADB_HOST")
-    DATABASE_URL = f"mariadb+mariadbconnector://{MARIADB_USER}:{MARIADB_PASSWORD}@{MARIADB_HOST}:3306/{MARIADB_DATABASE}"
-    
+
+    def _mariadb_url(driver: str, host: str) -> str:
+        return f"mariadb+{driver}://{MARIADB_USER}:{MARIADB_PASSWORD}@{host}:3306/{MARIADB_DATABASE}"
+
+    DATABASE_URL = _mariadb_url("mariadbconnector", MARIADB_HOST)
+    ASYNC_DATABASE_URL = _mariadb_url("asyncmy", MARIADB_HOST)
+
+    POOL_OPTIONS = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
     engine = create_engine(
-        DATABASE_URL
+        DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        **POOL_OPTIONS
     )
+    if ASYNC_DB:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS)
+
+    for replica_host in MARIADB_REPLICA_HOSTS:
+        replica_engines.append((
+            create_engine(_mariadb_url("mariadbconnector", replica_host), poolclass=InstrumentedQueuePool, **POOL_OPTIONS),
+            create_async_engine(_mariadb_url("asyncmy", replica_host), poolclass=InstrumentedAsyncQueuePool,
+                                **POOL_OPTIONS) if ASYNC_DB else None,
+        ))
+
+    for shard_name, shard_host in MARIADB_SHARD_HOSTS.items():
+        shard_engines[shard_name] = (
+            create_engine(_mariadb_url("mariadbconnector", shard_host), poolclass=InstrumentedQueuePool, **POOL_OPTIONS),
+            create_async_engine(_mariadb_url("asyncmy", shard_host), poolclass=InstrumentedAsyncQueuePool,
+                                **POOL_OPTIONS) if ASYNC_DB else None,
+        )
 elif STAGE == "TEST":
-    print("WARNING!!! THE IN_MEMORY_DATABASE IS SET FOR TEST PURPOSES !!!")
-    IN_MEMORY_SQLITE_URL = "sqlite:///:memory:"
-    
-    engine = create_engine(IN_MEMORY_SQLITE_URL, echo=True, connect_args={"check_same_thread": False}, 
-        poolclass=StaticPool)
+    if TEST_DATABASE_PATH:
+        print(f"WARNING!!! THE SQLITE DATABASE {TEST_DATABASE_PATH} IS SET FOR TEST PURPOSES !!!")
+        POOL_OPTIONS = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+
+        engine = create_engine(f"sqlite:///{TEST_DATABASE_PATH}", echo=SQL_ECHO, connect_args={"check_same_thread": False},
+            poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
+        if ASYNC_DB:
+            async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}", echo=SQL_ECHO,
+                poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS)
+
+        for replica_path in TEST_REPLICA_DATABASE_PATHS:
+            replica_engines.append((
+                create_engine(f"sqlite:///{replica_path}", echo=SQL_ECHO, connect_args={"check_same_thread": False},
+                    poolclass=InstrumentedQueuePool, **POOL_OPTIONS),
+                create_async_engine(f"sqlite+aiosqlite:///{replica_path}", echo=SQL_ECHO,
+                    poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS) if ASYNC_DB else None,
+            ))
+
+        for shard_name, shard_path in TEST_SHARD_DATABASE_PATHS.items():
+            shard_engines[shard_name] = (
+                create_engine(f"sqlite:///{shard_path}", echo=SQL_ECHO, connect_args={"check_same_thread": False},
+                    poolclass=InstrumentedQueuePool, **POOL_OPTIONS),
+                create_async_engine(f"sqlite+aiosqlite:///{shard_path}", echo=SQL_ECHO,
+                    poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS) if ASYNC_DB else None,
+            )
+
+        def _enable_wal(dbapi_connection, _):
+            # the readers don't wait for the writer
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.close()
+
+        for sqlite_engine in filter(None, (engine, async_engine and async_engine.sync_engine)):
+            event.listen(sqlite_engine, "connect", _enable_wal)
+    else:
+        print("WARNING!!! THE IN_MEMORY_DATABASE IS SET FOR TEST PURPOSES !!!")
+        # shared cache so the blocking engine (used by the tests for create_all) and the asyncio engine see the same database
+        IN_MEMORY_SQLITE_URL = "sqlite:///file:testdb?mode=memory&cache=shared&uri=true"
+        ASYNC_IN_MEMORY_SQLITE_URL = "sqlite+aiosqlite:///file:testdb?mode=memory&cache=shared&uri=true"
+
+        engine = create_engine(IN_MEMORY_SQLITE_URL, echo=SQL_ECHO, connect_args={"check_same_thread": False},
+            poolclass=InstrumentedStaticPool)
+        if ASYNC_DB:
+            async_engine = create_async_engine(ASYNC_IN_MEMORY_SQLITE_URL, echo=SQL_ECHO, poolclass=InstrumentedStaticPool)
 else:
     raise ValueError("ERROR: PLEASE SET THE STAGE ENV VARIABLE TO 'DEV' OR 'TEST'")
 
+def _enable_foreign_keys(dbapi_connection, _):
+    # SQLite only enforces the foreign keys (and their ON DELETE CASCADE) when asked to, on every connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+if STAGE == "TEST":
+    for sqlite_engine in filter(None, (engine, async_engine and async_engine.sync_engine)):
+        event.listen(sqlite_engine, "connect", _enable_foreign_keys)
+
+instrument_pool("primary", engine.pool)
+instrument_engine(engine)
+if async_engine:
+    instrument_pool("primary_async", async_engine.sync_engine.pool)
+    instrument_engine(async_engine.sync_engine)
+for index, (replica_engine, replica_async_engine) in enumerate(replica_engines):
+    instrument_pool(f"replica_{index}", replica_engine.pool)
+    instrument_engine(replica_engine)
+    if replica_async_engine:
+        instrument_pool(f"replica_{index}_async", replica_async_engine.sync_engine.pool)
+        instrument_engine(replica_async_engine.sync_engine)
+for shard_name, (shard_engine, shard_async_engine) in shard_engines.items():
+    instrument_pool(shard_name, shard_engine.pool)
+    instrument_engine(shard_engine)
+    if shard_async_engine:
+        instrument_pool(f"{shard_name}_async", shard_async_engine.sync_engine.pool)
+        instrument_engine(shard_async_engine.sync_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) if async_engine else None
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-Base = declarative_base()
\ No newline at end of file
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+get_db = get_async_db if ASYNC_DB else get_sync_db
+
+@asynccontextmanager
+async def open_db():
+    """
+    Opens a session of the configured kind outside of the request dependencies, for work that outlives them
+    (e.g. a streamed response, whose body is produced after the dependencies are closed).
+    """
+    if ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def run_db(db: Session | AsyncSession, fn, *args, **kwargs):
+    """
+    Runs a blocking CRUD function with either kind of session without blocking the event loop.
+
+    With an AsyncSession the function runs inside SQLAlchemy's greenlet bridge so the IO is awaited on the
+    asyncio driver; with a blocking Session it is sent to Starlette's thread pool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+Base = declarative_base()
@@ -1,14 +1,44 @@
-from fastapi import FastAPI
-from app.routers import users
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Annotated
+
+from fastapi import FastAPI, Header, Response, status
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from app.routers import users, internal
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.database import Base, engine
+from app.crud import users_async as crud_users
+from app.database import Base, engine, open_db, STAGE
+from app.utils import account_purge, etag, login_buffer, providers, replicas, shards
+from app.utils import jwt as app_jwt
+from app.utils.metrics import METRICS, MetricsMiddleware
+from app.utils.query_stats import QueryStatsMiddleware
+from app.utils.signing_keys import JWKS_MAX_AGE
 
 import os
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The schema is managed by the Alembic migrations (alembic upgrade head), the workers don't run DDL.
+    # The in-memory TEST database can't be migrated beforehand, so it is created here.
+    if STAGE == "TEST":
+        Base.metadata.create_all(bind=engine)
+        shards.SHARDS.create_schemas()
+    # the revocations of the refresh tokens that expired since the last start aren't needed anymore
+    async with open_db() as db:
+        await crud_users.delete_expired_revoked_tokens(db, datetime.now(timezone.utc))
+    await replicas.REPLICAS.start()
+    await account_purge.ACCOUNT_PURGES.resume()
+    if login_buffer.LAST_LOGIN_WRITE_BEHIND:
+        login_buffer.LAST_LOGINS.start()
+    yield
+    await account_purge.ACCOUNT_PURGES.stop()
+    await replicas.REPLICAS.stop()
+    await login_buffer.LAST_LOGINS.stop()
+    await providers.aclose()
 
-app = FastAPI()
+# orjson encodes the responses of the routes (see ModelResponse for the ones returning a built model)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,10 +46,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"], 
+    expose_headers=["ETag"],
 )
+app.add_middleware(QueryStatsMiddleware)
+# added last so it is the outermost middleware: the latencies include the CORS handling
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(users.router, prefix="/users", tags=["users"])
+app.include_router(internal.router, prefix="/internal", tags=["internal"])
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the FastAPI OAuth2 app!"}
\ No newline at end of file
+    return {"message": "Welcome to the FastAPI OAuth2 app!"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """
+    Request counts, status classes, latency histograms (by route template) and in-flight requests of this
+    worker, in the Prometheus text format.
+    """
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/.well-known/jwks.json", summary="Token Signing Keys", tags=["Authentication"],
+         responses={200: {"description": "The JWKS document."}, 304: {"description": "Not modified since the ETag in If-None-Match."}})
+async def get_jwks(if_none_match: Annotated[str | None, Header()] = None):
+    """
+    The public keys that verify the access tokens (RS256/EdDSA), by kid, so other services can check the
+    tokens themselves. Empty with a shared secret (HS256).
+
+    Returns:
+        - The JSON Web Key Set, cacheable for JWKS_MAX_AGE seconds.
+    """
+    jwks, jwks_etag = app_jwt.SIGNING_KEYS.jwks()
+    headers = {"ETag": jwks_etag, "Cache-Control": f"public, max-age={JWKS_MAX_AGE}"}
+    if etag.if_none_match(if_none_match, jwks_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(jwks, media_type="application/json", headers=headers)
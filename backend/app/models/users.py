@@ -1,27 +1,79 @@
-from sqlalchemy import Column, Integer, String, DateTime, UUID, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, DDL, MetaData, Table, event
 from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 
 from ..database import Base
-
-import uuid
+from ..utils.ids import uuid7
+from .types import BinaryUUID
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
+    # time-ordered (UUIDv7) 16-byte keys: the inserts append to the clustered index of InnoDB
+    id = Column(BinaryUUID, primary_key=True, index=True, default=uuid7)
     email = Column(String(100), unique=True, index=True, nullable=False)
     name = Column(String(100), nullable=False)
     created_date = Column(DateTime, default=datetime.now(timezone.utc))
     last_login_date = Column(DateTime, default=datetime.now(timezone.utc))
+    # bumped by every write to the user or to their notes: the ETag of GET /me and /me/notes
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # set when the account is deleted but its notes are still being purged (see app.utils.account_purge)
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    # the shard holding the user's notes (see app.utils.shards), NULL: in the notes table of this database
+    notes_shard = Column(String(50), nullable=True)
 
-    notes = relationship("Note", back_populates="user", cascade="all, delete-orphan")
+    # the database deletes the notes with the user (ON DELETE CASCADE): the ORM never loads them for it
+    notes = relationship("Note", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class Note(Base):
     __tablename__ = "notes"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
+    id = Column(BinaryUUID, primary_key=True, index=True, default=uuid7)
     content = Column(String(100), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    user_id = Column(BinaryUUID, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
-    user = relationship("User", back_populates="notes")
\ No newline at end of file
+    user = relationship("User", back_populates="notes")
+
+    # backs the keyset pagination of a user's notes (WHERE user_id = ? AND id > ? ORDER BY id)
+    __table_args__ = (
+        Index("ix_notes_user_id_id", "user_id", "id"),
+        # full-text search of the notes (GET /me/notes/search)
+        Index("ix_notes_content_fulltext", "content", mysql_prefix="FULLTEXT", mariadb_prefix="FULLTEXT").ddl_if(dialect=("mysql", "mariadb")),
+    )
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    # the jti of a refresh token that was used (rotation); kept until the token would have expired anyway
+    jti = Column(BinaryUUID, primary_key=True)
+    user_id = Column(BinaryUUID, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# The notes table of a shard (see app.utils.shards), created by `python -m app.tools.reshard init`: the same as
+# Note's but for the foreign key, the users being on the primary
+SHARD_METADATA = MetaData()
+SHARD_NOTES = Table(
+    "notes", SHARD_METADATA,
+    Column("id", BinaryUUID, primary_key=True, index=True),
+    Column("content", String(100), nullable=False),
+    Column("user_id", BinaryUUID, nullable=False),
+    Index("ix_notes_user_id_id", "user_id", "id"),
+    Index("ix_notes_content_fulltext", "content", mysql_prefix="FULLTEXT", mariadb_prefix="FULLTEXT").ddl_if(dialect=("mysql", "mariadb")),
+)
+
+# SQLite (the TEST stage) has no FULLTEXT index: an external content FTS5 table, kept current by triggers, stands in for it
+NOTES_FTS_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE notes_fts USING fts5(content, content='notes', content_rowid='rowid')",
+    "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END",
+    "CREATE TRIGGER notes_fts_update AFTER UPDATE OF content ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+]
+
+for notes_table in (Note.__table__, SHARD_NOTES):
+    for statement in NOTES_FTS_SQLITE_DDL:
+        event.listen(notes_table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(notes_table, "before_drop", DDL("DROP TABLE IF EXISTS notes_fts").execute_if(dialect="sqlite"))
\ No newline at end of file
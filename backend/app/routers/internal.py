@@ -0,0 +1,63 @@
+import os
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from app.schemas import responses as schema_responses
+from app.utils import account_purge, replicas, token_cache
+from app.utils.pool_stats import POOL_STATS
+
+# the secret of the X-Internal-Token header the internal routes require (empty: the routes refuse every request)
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+def require_internal_token(x_internal_token: Annotated[str | None, Header()] = None):
+    # the routes are on the public app: they show the pools, the caches and the user ids of the deleted accounts
+    if not INTERNAL_API_TOKEN or x_internal_token is None or \
+            not secrets.compare_digest(x_internal_token.encode(), INTERNAL_API_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+@router.get("/account-purges", response_model=dict[str, schema_responses.AccountPurgeResponse], summary="Account Purges", tags=["Internal"])
+def get_account_purges():
+    """
+    Reports the background purges of the deleted accounts of this worker, running and recently finished.
+
+    Returns:
+        - For each account (by user id): the notes it had, the notes deleted so far, the status ("running",
+          "done" or "failed") and when the purge started and finished.
+    """
+    return account_purge.ACCOUNT_PURGES.stats()
+
+@router.get("/pool", response_model=dict[str, schema_responses.PoolStatsResponse], summary="Connection Pool Statistics", tags=["Internal"])
+def get_pool_stats():
+    """
+    Reports the live state of every database connection pool, used to size the workers against the database.
+
+    Returns:
+        - For each pool (by name): checked out, idle and overflow connections, checkout count, timeouts and
+          the time spent waiting for a connection.
+    """
+    return {name: stats.snapshot() for name, stats in POOL_STATS.items()}
+
+@router.get("/replicas", response_model=schema_responses.ReplicaStatsResponse, summary="Read Replica Statistics", tags=["Internal"])
+def get_replica_stats():
+    """
+    Reports the read replicas as last checked and where the read-only sessions went.
+
+    Returns:
+        - For each replica (by name): whether it is up and its lag in seconds; the reads sent to a replica,
+          to the primary after a write of the user (sticky), and to the primary for want of a usable replica.
+    """
+    return replicas.REPLICAS.stats()
+
+@router.get("/token-cache", response_model=schema_responses.TokenCacheStatsResponse, summary="Token Cache Statistics", tags=["Internal"])
+def get_token_cache_stats():
+    """
+    Reports the verified-token cache used by the JWT decoding.
+
+    Returns:
+        - The number of cached tokens, the capacity and the hit / miss counters.
+    """
+    return token_cache.stats()
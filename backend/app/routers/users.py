@@ -1,28 +1,29 @@
 from datetime import datetime, timezone
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Path, Response, status
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import RedirectResponse, StreamingResponse
 from typing import Annotated
 
 from app.database import get_db
-from app.utils import google_auth, mock_auth
-from app.crud import users as crud_users
+from app.utils import account_purge, etag, login_buffer, pagination, principal_cache, providers, replicas, search, shards
+from app.crud import users_async as crud_users
 from app.schemas import users as schema_users
 from app.schemas import responses as schema_responses
-from app.utils.jwt import create_access_token, create_refresh_token, get_user_from_token
+from app.utils.jwt import CREDENTIALS_EXCEPTION, create_access_token, create_refresh_token, decode_refresh_token, get_principal, get_user_from_token, principal_from_user
+from app.utils.serialization import ModelResponse
 
+import jwt
+import orjson
 import os
 
 router = APIRouter()
 
-# TODO: maybe I should add this as a "dependecy" in each route that uses it
-PROVIDERS = {
-    "google": google_auth,
-    "test": mock_auth.MockAuth()
-}
-
 FRONTEND_URL = os.getenv("FRONTEND_URL","http://localhost:3000")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+NOTES_BATCH_MAX_SIZE = int(os.getenv("NOTES_BATCH_MAX_SIZE", "1000"))
 
 @router.get("/login/{provider}", response_model=schema_responses.OAuth2LoginResponse, summary="Initiate OAuth2 Login", tags=["Authentication"])
 def login_oauth(provider: Annotated[str, Path(..., description="The OAuth2 provider")]):
@@ -37,10 +38,11 @@ def login_oauth(provider: Annotated[str, Path(..., description="The OAuth2 provi
         :return state: A unique state parameter to help prevent CSRF attacks.
     """
 
-    if provider not in PROVIDERS:
+    oauth_provider = providers.get_provider(provider)
+    if oauth_provider is None:
         raise HTTPException(status_code=400, detail="Unsupported OAuth2 provider")
 
-    authorization_url, state = PROVIDERS[provider].get_authorization_url()
+    authorization_url, state = oauth_provider.get_authorization_url()
 
     return schema_responses.OAuth2LoginResponse(
         authorization_url=authorization_url,
@@ -74,9 +76,9 @@ def login_oauth(provider: Annotated[str, Path(..., description="The OAuth2 provi
                 },
             }
         )
-def auth_oauth_callback(provider: Annotated[str, Path(..., description="The OAuth2 provider")], 
+async def auth_oauth_callback(provider: Annotated[str, Path(..., description="The OAuth2 provider")], 
                         code: Annotated[str, Query()], 
-                        db: Session = Depends(get_db)):
+                        db: Session | AsyncSession = Depends(get_db)):
     """
     Handles the callback from the OAuth2 provider and exchanges the code for user information and JWT tokens.
 
@@ -89,11 +91,12 @@ def auth_oauth_callback(provider: Annotated[str, Path(..., description="The OAut
         - **500 Internal Server Error**: If user creation or token generation fails.
         """
 
-    if provider not in PROVIDERS:
+    oauth_provider = providers.get_provider(provider)
+    if oauth_provider is None:
         raise HTTPException(status_code=400, detail="Unsupported OAuth2 provider")
 
     try:
-        id_info = PROVIDERS[provider].exchange_authorization_code(code)
+        id_info = await oauth_provider.exchange_authorization_code(code)
     except ValueError:
         raise HTTPException(status_code=400, detail="Failed to exchange authorization code")
     
@@ -103,27 +106,24 @@ def auth_oauth_callback(provider: Annotated[str, Path(..., description="The OAut
     if not email or not name:
         raise HTTPException(status_code=400, detail="Failed to retrieve user information from Google")
 
-    user = crud_users.get_user_by_email(db, email=email)
-    if not user:
-        
-		#User needs to be created
-        user_create = schema_users.UserCreate(name=name, email=email)
-        user = crud_users.create_user(db, user=user_create)
-        if not user:
-            raise HTTPException(status_code=500, detail="Failed to create a new user")
-   
-
-    else:
-        #User logged in and the account was already created
-        user_update = schema_users.UserUpdate(id = user.id,
-                                          last_login_date=datetime.now(timezone.utc))
-        user = crud_users.update_user(db, user_update)
-        if not user:
-            raise HTTPException(status_code=500, detail="Failed to update the user when trying to log in")
-   
+    login_date = datetime.now(timezone.utc)
+    user_id = None
+    if login_buffer.LAST_LOGIN_WRITE_BEHIND:
+        # an existing user only gets their login buffered (a read, no write), unless the buffer is full
+        user = await crud_users.get_user_by_email(db, email=email)
+        if user and login_buffer.LAST_LOGINS.record(user.id, login_date):
+            user_id = user.id
+
+    if user_id is None:
+        # creates the user or moves their last login date, in one statement (safe with concurrent first logins)
+        try:
+            user_id = await crud_users.upsert_user_by_email(db, email=email, name=name, login_date=login_date)
+        except SQLAlchemyError:
+            raise HTTPException(status_code=500, detail="Failed to create or update the user when trying to log in")
+
     try:
-        access_token = create_access_token(data=str(user.id))
-        refresh_token = create_refresh_token(data=str(user.id))
+        access_token = create_access_token(data=str(user_id))
+        refresh_token = create_refresh_token(data=str(user_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create tokens")
 
@@ -131,26 +131,120 @@ def auth_oauth_callback(provider: Annotated[str, Path(..., description="The OAut
     redirect_url = f"{FRONTEND_URL}/auth-success?access_token={access_token}&refresh_token={refresh_token}"
     return RedirectResponse(url=redirect_url)
 
-@router.get("/me", response_model=schema_users.User, summary="Get Current User", tags=["Me"])
-def protected_route(user: schema_users.User = Depends(get_user_from_token)):
+@router.post("/token/refresh", response_model=schema_responses.TokenResponse, summary="Refresh the Tokens", tags=["Authentication"],
+             responses={401: {"description": "The refresh token is invalid, expired or was already used."}})
+async def refresh_tokens(body: schema_responses.TokenRefreshRequest, db: Session | AsyncSession = Depends(get_db)):
+    """
+    Exchanges a refresh token for a new access token and a new refresh token (rotation: each refresh token
+    can be used once).
+
+    Parameters:
+        :param refresh_token: The refresh token received at login or from the previous refresh.
+
+    Returns:
+        :return access_token: The new access token.
+        :return refresh_token: The refresh token to use next time.
+    """
+    try:
+        user_id, jti, expires_at = decode_refresh_token(body.refresh_token)
+    except jwt.PyJWTError:
+        raise CREDENTIALS_EXCEPTION
+
+    # no new tokens for a deleted account (raises CREDENTIALS_EXCEPTION, as for an access token)
+    await get_principal(db, user_id)
+
+    # the rotation revokes the used token; the primary key refuses the write if it was already used (maybe by
+    # another worker), so a reused token costs the same single INSERT as a valid one
+    try:
+        first_use = await crud_users.revoke_token(db, jti, user_id, expires_at)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="Failed to revoke the refresh token")
+    if not first_use:
+        raise CREDENTIALS_EXCEPTION
+
+    return schema_responses.TokenResponse(
+        access_token=create_access_token(data=str(user_id)),
+        refresh_token=create_refresh_token(data=str(user_id))
+    )
+
+async def get_read_db(user: schema_users.Principal = Depends(get_user_from_token),
+                      db: Session | AsyncSession = Depends(get_db)):
+    # the session of the read-only routes: a replica, unless the user just wrote (see app.utils.replicas)
+    async with replicas.REPLICAS.open_read_db(user.id, primary=db) as read_db:
+        yield read_db
+
+async def get_notes_db(user: schema_users.Principal = Depends(get_user_from_token),
+                       db: Session | AsyncSession = Depends(get_db)):
+    # the session of the user's notes for the writes: their shard (see app.utils.shards) as the primary has it now
+    notes_shard = await crud_users.get_notes_shard(db, user.id) if shards.SHARDS.enabled else None
+    async with shards.SHARDS.open_notes_db(notes_shard, primary=db) as notes_db:
+        try:
+            yield notes_db
+        except shards.ShardMoved:
+            # moved in the meantime by the resharding tool, nothing was written
+            raise HTTPException(status_code=503, detail="The notes are being moved, retry", headers={"Retry-After": "1"})
+
+async def get_read_notes_db(user: schema_users.Principal = Depends(get_user_from_token),
+                            db: Session | AsyncSession = Depends(get_read_db)):
+    # the session of the user's notes for the reads: their shard as the principal has it (the resharding tool keeps
+    # the notes it moved on the old shard longer than a principal is cached), a replica for the unsharded notes
+    async with shards.SHARDS.open_notes_db(user.notes_shard, primary=db) as notes_db:
+        yield notes_db
+
+async def _user_etag(db: Session | AsyncSession, user: schema_users.Principal) -> str:
+    # read before the data it labels: a write in between makes the ETag older than the data, never newer
+    version = await crud_users.get_user_version(db, user.id)
+    if version is None:
+        raise CREDENTIALS_EXCEPTION
+    return etag.user_etag(user.id, version)
+
+async def _current_principal(db: Session | AsyncSession, user: schema_users.Principal) -> schema_users.Principal:
+    # the body of /me is the principal, which may have been cached before a write handled by another worker:
+    # when db has a newer version, the user is read again (the ETag always labels the body sent).
+    # db may be a lagging replica: an older version than the principal's keeps the principal (read on the primary)
+    version = await crud_users.get_user_version(db, user.id)
+    if version is None:
+        raise CREDENTIALS_EXCEPTION
+    if user.version is not None and version <= user.version:
+        return user
+    user_db = await crud_users.get_user_by_id(db, user.id)
+    if not user_db or user_db.deleted_at is not None:
+        raise CREDENTIALS_EXCEPTION
+    fresh_user = principal_from_user(user_db)
+    if user.version is not None and fresh_user.version < user.version:
+        return user
+    principal_cache.set_principal(fresh_user)
+    return fresh_user
+
+@router.get("/me", response_model=schema_users.User, summary="Get Current User", tags=["Me"],
+            responses={304: {"description": "Not modified since the version in If-None-Match."}})
+async def protected_route(user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_read_db),
+                          notes_db: Session | AsyncSession = Depends(get_read_notes_db),
+                          if_none_match: Annotated[str | None, Header()] = None):
     """
     Gets the info of the logged user
     
     Parameters:
-        None (the user is identified by the token).
+        :param If-None-Match: The ETag of a copy already held: 304 if it is still current
+                              (the user is identified by the token).
     
     Returns:
-        - The user information.
+        - The user information, with its ETag.
     """
-    return schema_users.User(id=user.id,
-                             name=user.name,
-                             email=user.email,
-                             created_date=user.created_date,
-                             last_login_date=user.last_login_date,
-                             notes=user.notes)
+    user = await _current_principal(db, user)
+    user_etag = etag.user_etag(user.id, user.version)
+    headers = {"ETag": user_etag, "Cache-Control": etag.CACHE_CONTROL}
+    if etag.if_none_match(if_none_match, user_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    notes = await crud_users.get_notes_by_user(notes_db, user_id=user.id)
+
+    return ModelResponse(schema_users.User(**dict(user),
+                                           notes=schema_users.NOTES_ADAPTER.validate_python(notes, from_attributes=True)),
+                         headers=headers)
 
 @router.put("/me/name", response_model=schema_users.User, summary="Change My Name", tags=["Me"])
-def change_my_name(new_name: Annotated[str, Query(min_length=5,max_length=100)], user: schema_users.User = Depends(get_user_from_token), db: Session = Depends(get_db)):
+async def change_my_name(new_name: Annotated[str, Query(min_length=5,max_length=100)], user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db)):
     """
     Allows the authenticated user to change their name.
 
@@ -162,35 +256,51 @@ def change_my_name(new_name: Annotated[str, Query(min_length=5,max_length=100)],
     """
 
     user_update = schema_users.UserUpdate(id=user.id, name=new_name)
-    updated_user = crud_users.update_user(db, user_update)
+    updated_user = await crud_users.update_user(db, user_update)
 
     if not updated_user:
         raise HTTPException(status_code=500, detail="Failed to update user name")
     
-    return schema_users.User(id=updated_user.id,
-                             name=updated_user.name,
-                             email=updated_user.email,
-                             created_date=updated_user.created_date,
-                             last_login_date=updated_user.last_login_date)
-
-@router.delete("/me", response_model=schema_responses.DeleteAccountResponse, summary="Delete My Account", tags=["Me"])
-def delete_my_account(user: schema_users.User = Depends(get_user_from_token), db: Session = Depends(get_db)):
+    return ModelResponse(schema_users.User(id=updated_user.id,
+                                           name=updated_user.name,
+                                           email=updated_user.email,
+                                           created_date=updated_user.created_date,
+                                           last_login_date=updated_user.last_login_date))
+
+@router.delete("/me", response_model=schema_responses.DeleteAccountResponse, summary="Delete My Account", tags=["Me"],
+               responses={202: {"description": "The account is deleted, its notes are being purged in the background."}})
+async def delete_my_account(response: Response, user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db),
+                            notes_db: Session | AsyncSession = Depends(get_notes_db)):
     """
    	Allows the authenticated user to delete their account.
 
+    An account with at most ACCOUNT_PURGE_THRESHOLD notes is deleted at once. A larger one is closed at once
+    (its tokens stop working) and its notes are deleted in the background, in batches.
+
     Returns:
-        :return message: Confirmation message.
+        :return message: Confirmation message (202 when the notes are still being purged).
     """
-    deleted_user = crud_users.delete_user(db, user.id)
-    if not deleted_user:
+    note_count = await crud_users.count_notes_by_user(notes_db, user.id, limit=account_purge.ACCOUNT_PURGE_THRESHOLD + 1)
+    if note_count <= account_purge.ACCOUNT_PURGE_THRESHOLD:
+        if not await crud_users.delete_user(db, user.id, notes_db):
+            raise HTTPException(status_code=500, detail="Failed to delete user")
+        return schema_responses.DeleteAccountResponse(
+            message="User account deleted successfully"
+        )
+
+    if not await crud_users.mark_user_deleted(db, user.id):
         raise HTTPException(status_code=500, detail="Failed to delete user")
-    
+    # the exact count, for the progress report
+    total = await crud_users.count_notes_by_user(notes_db, user.id)
+    account_purge.ACCOUNT_PURGES.start(user.id, total)
+    response.status_code = status.HTTP_202_ACCEPTED
     return schema_responses.DeleteAccountResponse(
-        message="User account deleted successfully"
+        message="User account deleted, its notes are being purged"
     )
 
 @router.post("/me/notes", response_model=schema_users.Note, summary="Add a Note", tags=["Me, Notes"])
-def add_note_for_user(note: schema_users.NoteCreate, user: schema_users.User = Depends(get_user_from_token), db: Session = Depends(get_db)):
+async def add_note_for_user(note: schema_users.NoteCreate, user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db),
+                            notes_db: Session | AsyncSession = Depends(get_notes_db)):
     """
     Allows the authenticated user to add a note.
 
@@ -200,29 +310,149 @@ def add_note_for_user(note: schema_users.NoteCreate, user: schema_users.User = D
     Returns:
         :return: The created note.
     """
-    note =  crud_users.create_note_for_user(db, user_id=user.id, note=note)
+    note =  await crud_users.create_note_for_user(db, user_id=user.id, note=note, notes_db=notes_db)
     if not note:
         raise HTTPException(status_code=500, detail="Failed to create note for user")
     
-    return schema_users.Note(content=note.content,
-                             id=note.id)
+    return ModelResponse(schema_users.Note(content=note.content,
+                                           id=note.id))
+
+
+@router.post("/me/notes/batch", response_model=schema_responses.NoteBatchResponse, summary="Add Notes in Bulk", tags=["Me", "Notes"])
+async def add_notes_for_user(notes: list[schema_users.NoteCreate], user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db),
+                             notes_db: Session | AsyncSession = Depends(get_notes_db)):
+    """
+    Allows the authenticated user to add many notes at once, in a single INSERT and transaction.
+
+    Parameters:
+        :param notes: The notes to add (at most NOTES_BATCH_MAX_SIZE).
+
+    Returns:
+        :return results: For every note (by its position in the request), the id it was created with.
+    """
+    if len(notes) > NOTES_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Too many notes in the batch (the maximum is {NOTES_BATCH_MAX_SIZE})")
+
+    created = await crud_users.create_notes_for_user(db, user_id=user.id, notes=notes, notes_db=notes_db)
 
+    return schema_responses.NoteBatchResponse(
+        results=[schema_responses.NoteBatchItemResult(index=index, id=row["id"], status="created")
+                 for index, row in enumerate(created)]
+    )
+
+@router.post("/me/notes/batch-delete", response_model=schema_responses.NoteBatchResponse, summary="Delete Notes in Bulk", tags=["Me", "Notes"])
+async def delete_notes_for_user(batch: schema_users.NoteBatchDelete, user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db),
+                                notes_db: Session | AsyncSession = Depends(get_notes_db)):
+    """
+    Deletes many notes of the authenticated user at once, in a single DELETE and transaction.
+
+    Parameters:
+        :param ids: The IDs of the notes to delete (at most NOTES_BATCH_MAX_SIZE).
 
-@router.get("/me/notes", response_model=list[schema_users.Note], summary="Get My Notes", tags=["Me", "Notes"])
-def get_my_notes(user: schema_users.User = Depends(get_user_from_token), db: Session = Depends(get_db)):
+    Returns:
+        :return results: For every id, "deleted" or "not_found" (missing or not owned by the user).
     """
-    Retrieves all notes for the authenticated user.
+    if len(batch.ids) > NOTES_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Too many notes in the batch (the maximum is {NOTES_BATCH_MAX_SIZE})")
+
+    deleted_ids = await crud_users.delete_notes_by_ids(db, user_id=user.id, note_ids=batch.ids, notes_db=notes_db)
+
+    return schema_responses.NoteBatchResponse(
+        results=[schema_responses.NoteBatchItemResult(index=index, id=note_id,
+                                                      status="deleted" if note_id in deleted_ids else "not_found")
+                 for index, note_id in enumerate(batch.ids)]
+    )
+
+@router.get("/me/notes", response_model=schema_users.NotesPage, summary="Get My Notes", tags=["Me", "Notes"],
+            responses={304: {"description": "Not modified since the version in If-None-Match."}})
+async def get_my_notes(user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_read_db),
+                       notes_db: Session | AsyncSession = Depends(get_read_notes_db),
+                       cursor: Annotated[str | None, Query(description="The next_cursor of the previous page")] = None,
+                       limit: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = pagination.DEFAULT_PAGE_SIZE,
+                       if_none_match: Annotated[str | None, Header()] = None):
+    """
+    Retrieves the notes of the authenticated user, one page at a time.
     
     Parameters:
-        None (the user is identified by the token).
+        :param cursor: The cursor returned with the previous page (omit it for the first page).
+        :param limit: The maximum number of notes in the page.
+        :param If-None-Match: The ETag of a copy of the page already held: 304 if it is still current.
     
     Returns:
-        - A list of notes.
+        - A page of notes and the cursor of the next page (null on the last page), with its ETag.
+    """
+    try:
+        after_id = pagination.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # the ETag is per URL, so the same one labels every page (the cursor and limit are in the URL)
+    user_etag = await _user_etag(db, user)
+    headers = {"ETag": user_etag, "Cache-Control": etag.CACHE_CONTROL}
+    if etag.if_none_match(if_none_match, user_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    notes = await crud_users.get_notes_by_user(notes_db, user_id=user.id, after_id=after_id, limit=limit + 1)
+
+    next_cursor = pagination.encode_cursor(notes[limit - 1].id) if len(notes) > limit else None
+    return ModelResponse(schema_users.NotesPage(items=schema_users.NOTES_ADAPTER.validate_python(notes[:limit], from_attributes=True),
+                                                next_cursor=next_cursor),
+                         headers=headers)
+
+@router.get("/me/notes/export", response_class=StreamingResponse, summary="Export My Notes", tags=["Me", "Notes"],
+            responses={200: {"description": "The notes, one JSON object per line.", "content": {"application/x-ndjson": {}}}})
+async def export_my_notes(user: schema_users.Principal = Depends(get_user_from_token)):
+    """
+    Exports all the notes of the authenticated user as newline-delimited JSON.
+
+    The notes are read from the database in batches while the response is being sent,
+    so the memory used does not depend on the number of notes.
+
+    Returns:
+        - A stream of `{"id": ..., "content": ...}` lines.
+    """
+    async def notes_ndjson():
+        # the request session is already closed when the body is produced, the stream has its own: on the shard
+        # of the notes, or on a replica for the unsharded ones
+        notes_db = shards.SHARDS.open_notes_db(user.notes_shard) if user.notes_shard is not None \
+            else replicas.REPLICAS.open_read_db(user.id)
+        async with notes_db as db:
+            async for batch in crud_users.iter_note_batches_by_user(db, user.id, batch_size=EXPORT_BATCH_SIZE):
+                yield b"".join(orjson.dumps({"id": note.id, "content": note.content}) + b"\n" for note in batch)
+
+    return StreamingResponse(notes_ndjson(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'})
+
+@router.get("/me/notes/search", response_model=list[schema_users.NoteSearchResult], summary="Search My Notes", tags=["Me", "Notes"])
+async def search_my_notes(q: Annotated[str, Query(min_length=1, max_length=200, description="The words to look for")],
+                          user: schema_users.Principal = Depends(get_user_from_token), notes_db: Session | AsyncSession = Depends(get_read_notes_db),
+                          limit: Annotated[int, Query(ge=1, le=search.MAX_SEARCH_LIMIT)] = search.DEFAULT_SEARCH_LIMIT):
     """
-    return crud_users.get_notes_by_user(db, user_id=user.id)
+    Searches the notes of the authenticated user by content, using the full-text index.
+
+    Parameters:
+        :param q: The words to look for (a note matches if it contains any of them).
+        :param limit: The maximum number of results.
+
+    Returns:
+        - The matching notes, best first, with their score and the content highlighted with <mark> (HTML-escaped).
+    """
+    terms = search.search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="The search query has no words")
+
+    rows = await crud_users.search_notes_by_user(notes_db, user_id=user.id, terms=terms, limit=limit)
+
+    results = [schema_users.NoteSearchResult(id=row.id,
+                                             content=row.content,
+                                             score=row.score,
+                                             highlight=search.highlight(row.content, terms))
+               for row in rows]
+    return ModelResponse(results, adapter=schema_users.NOTE_SEARCH_RESULTS_ADAPTER)
 
 @router.delete("/me/notes/{note_id}", response_model=schema_responses.DeleteAccountResponse, summary="Delete a Note", tags=["User"])
-def delete_note(note_id: UUID, user: schema_users.User = Depends(get_user_from_token), db: Session = Depends(get_db)):
+async def delete_note(note_id: UUID, user: schema_users.Principal = Depends(get_user_from_token), db: Session | AsyncSession = Depends(get_db),
+                      notes_db: Session | AsyncSession = Depends(get_notes_db)):
     """
     Deletes a note by its ID for the authenticated user.
     
@@ -232,7 +462,7 @@ def delete_note(note_id: UUID, user: schema_users.User = Depends(get_user_from_t
     Returns:
         - Confirmation message.
     """
-    note = crud_users.delete_note_by_id(db, note_id=note_id)
+    note = await crud_users.delete_note_by_id(db, user_id=user.id, note_id=note_id, notes_db=notes_db)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
@@ -1,13 +1,66 @@
+import uuid
+
+from datetime import datetime
 from pydantic import BaseModel
 
 class TokenResponse(BaseModel):
     access_token: str
     refresh_token: str
     token_type: str = "bearer"
+
+class TokenRefreshRequest(BaseModel):
+    refresh_token: str
     
 class OAuth2LoginResponse(BaseModel):
     authorization_url: str
     state: str
     
 class DeleteAccountResponse(BaseModel):
-    message: str
\ No newline at end of file
+    message: str
+
+class AccountPurgeResponse(BaseModel):
+    total: int
+    deleted: int
+    status: str
+    started_at: datetime
+    finished_at: datetime | None
+
+class PoolStatsResponse(BaseModel):
+    pool_size: int | None
+    opened: int
+    checked_out: int
+    idle: int
+    overflow: int
+    checkouts: int
+    invalidated: int
+    timeouts: int
+    wait_total_ms: float
+    wait_avg_ms: float
+    wait_max_ms: float
+
+
+class ReplicaStateResponse(BaseModel):
+    healthy: bool
+    lag: float | None
+
+class ReplicaStatsResponse(BaseModel):
+    replicas: dict[str, ReplicaStateResponse]
+    replica_reads: int
+    sticky_reads: int
+    fallback_reads: int
+
+
+class TokenCacheStatsResponse(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+
+
+class NoteBatchItemResult(BaseModel):
+    index: int
+    id: uuid.UUID
+    status: str
+
+class NoteBatchResponse(BaseModel):
+    results: list[NoteBatchItemResult]
@@ -1,6 +1,6 @@
 from datetime import datetime
 import uuid
-from pydantic import BaseModel, constr
+from pydantic import BaseModel, Field, TypeAdapter, constr
 
 class NoteBase(BaseModel):
     content: constr(min_length=10, max_length=500) 
@@ -17,6 +17,17 @@ class Note(NoteBase):
     class Config:
         orm_mode = True
 
+class NoteSearchResult(Note):
+    score: float
+    highlight: str
+
+class NoteBatchDelete(BaseModel):
+    ids: list[uuid.UUID]
+
+class NotesPage(BaseModel):
+    items: list[Note]
+    next_cursor: str | None = None
+
 class UserBase(BaseModel):
     pass
 
@@ -30,15 +41,26 @@ class UserUpdate(UserBase):
     last_login_date: datetime | None = None 
     name: str | None = None
 
-class User(UserBase):
+class Principal(UserBase):
     id: uuid.UUID
     name: str
     email: str
     created_date: datetime
     last_login_date: datetime
-    notes: list[Note] = []
+    # where the notes are (see app.utils.shards), not part of the responses
+    notes_shard: str | None = Field(default=None, exclude=True)
+    # users.version of the row this was read from: the ETag of a response built from it (None: unknown)
+    version: int | None = Field(default=None, exclude=True)
 
     class Config:
         orm_mode = True
 
+class User(Principal):
+    notes: list[Note] = []
+
+    class Config:
+        orm_mode = True
 
+# Adapters of the list types of the responses, built once: building one compiles its validator and serializer
+NOTES_ADAPTER = TypeAdapter(list[Note])
+NOTE_SEARCH_RESULTS_ADAPTER = TypeAdapter(list[NoteSearchResult])
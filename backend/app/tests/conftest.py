@@ -0,0 +1,48 @@
+import pytest
+
+from urllib.parse import urlparse, parse_qs
+from fastapi.testclient import TestClient
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.main import app
+from app.database import Base, engine
+from app.routers import internal
+from app.utils import principal_cache
+
+INTERNAL_API_TOKEN = "test-internal-token"
+
+@pytest.fixture(scope="session")
+def client():
+    # without its lifespan: the tests that need the startup and shutdown open their own `with TestClient(app)`
+    return TestClient(app)
+
+@pytest.fixture(scope="function")
+def setup_test_db():
+    # an empty database for every test, and no user cached by a previous one
+    principal_cache.clear()
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    principal_cache.clear()
+
+@pytest.fixture(scope="function")
+def login(client):
+    def login(suffix: str | None = None, client: TestClient = client) -> dict[str, str]:
+        """
+        Logs in through the "test" provider and returns the Authorization header of the access token: the same
+        user for the same suffix ("testuser-<suffix>@example.com"), the provider's one test user without one.
+        """
+        code = "test-code" if suffix is None else f"test-code-{suffix}"
+        response = client.get(f"/users/auth/test/callback?code={code}", follow_redirects=False)
+        assert response.status_code == 307
+        access_token = parse_qs(urlparse(response.headers["location"]).query)["access_token"][0]
+        return {"Authorization": f"Bearer {access_token}"}
+    return login
+
+@pytest.fixture(scope="function")
+def internal_headers(monkeypatch):
+    # the headers of an allowed request to the /internal routes
+    monkeypatch.setattr(internal, "INTERNAL_API_TOKEN", INTERNAL_API_TOKEN)
+    return {"X-Internal-Token": INTERNAL_API_TOKEN}
@@ -0,0 +1,79 @@
+import time
+import pytest
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, text
+
+from app.main import app
+from app.crud import users as crud_users
+from app.database import SessionLocal
+from app.models.users import Note, User
+from app.utils import account_purge
+
+@pytest.fixture(scope="function")
+def small_purges(setup_test_db, monkeypatch):
+    monkeypatch.setattr(account_purge, "ACCOUNT_PURGE_THRESHOLD", 3)
+    monkeypatch.setattr(account_purge, "ACCOUNT_PURGES", account_purge.AccountPurger(batch_size=2, pause=0.05))
+
+def add_notes(client, headers, count):
+    response = client.post("/users/me/notes/batch", json=[{"content": f"purged note {i}"} for i in range(count)], headers=headers)
+    assert response.status_code == 200
+
+def count_rows():
+    with SessionLocal() as db:
+        return (db.scalar(select(func.count()).select_from(User)),
+                db.scalar(select(func.count()).select_from(Note)),
+                db.scalar(text("SELECT count(*) FROM notes_fts WHERE notes_fts MATCH 'purged'")))
+
+def wait_for_purges(client, internal_headers):
+    for _ in range(100):
+        purges = client.get("/internal/account-purges", headers=internal_headers).json()
+        if all(purge["status"] != "running" for purge in purges.values()):
+            return purges
+        time.sleep(0.05)
+    raise AssertionError("The purges didn't finish")
+
+def test_a_small_account_is_deleted_with_its_notes(small_purges, client, login):
+    headers = login("small-account")
+    add_notes(client, headers, 3)
+
+    response = client.delete("/users/me", headers=headers)
+    assert response.status_code == 200
+    # the database deleted the notes (and the full-text index followed)
+    assert count_rows() == (0, 0, 0)
+
+def test_a_large_account_is_purged_in_the_background(small_purges, login, internal_headers):
+    # no other request uses the database during the purge (the in-memory TEST database has one connection),
+    # the pause before the first batch lets the DELETE request finish
+    with TestClient(app) as client:
+        headers = login("large-account", client=client)
+        add_notes(client, headers, 5)
+        user_id = client.get("/users/me", headers=headers).json()["id"]
+
+        response = client.delete("/users/me", headers=headers)
+        assert response.status_code == 202
+
+        purges = wait_for_purges(client, internal_headers)
+        assert purges[user_id]["status"] == "done"
+        assert (purges[user_id]["total"], purges[user_id]["deleted"]) == (5, 5)
+    assert count_rows() == (0, 0, 0)
+
+def test_unfinished_purges_are_resumed_at_start(small_purges, client, login, internal_headers):
+    headers = login("interrupted-purge")
+    add_notes(client, headers, 5)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    with SessionLocal() as db:
+        user = crud_users.get_user_by_email(db, "testuser-interrupted-purge@example.com")
+        crud_users.mark_user_deleted(db, user.id)
+        # stopped after a first batch
+        assert crud_users.delete_note_batch(db, user.id, batch_size=2)[0] == 2
+
+    # the account is closed while it is purged, and its email is free again
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.get("/users/me", headers=login("interrupted-purge")).json()["id"] != user_id
+
+    with TestClient(app) as client_with_lifespan:
+        purges = wait_for_purges(client_with_lifespan, internal_headers)
+    assert purges[user_id]["status"] == "done"
+    assert purges[user_id]["deleted"] == 3
+    assert count_rows() == (1, 0, 0)
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from app.benchmarks import keys, load, results, startup
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert results.percentile(values, 50) == 50.0
+    assert results.percentile(values, 95) == 95.0
+    assert results.percentile(values, 99) == 99.0
+    assert results.percentile([3.0], 99) == 3.0
+    assert results.percentile([], 50) == 0.0
+
+def test_load_benchmark_runs_the_scenario_in_process(setup_test_db, tmp_path):
+    # a single user: the in-memory TEST database can't take concurrent sessions
+    summary = asyncio.run(load.run(users=1, duration=0.5, seed=1))
+
+    assert summary["total"]["requests"] > 1
+    assert summary["total"]["errors"] == 0
+    assert summary["routes"]["GET /users/auth/{provider}/callback"]["requests"] == 1
+    assert set(summary["routes"]) <= {
+        "GET /users/auth/{provider}/callback", "GET /users/me", "POST /users/me/notes",
+        "GET /users/me/notes", "DELETE /users/me/notes/{note_id}", "PUT /users/me/name",
+    }
+
+    path = results.save("load", summary, str(tmp_path / "load.json"))
+    saved = json.loads(open(path).read())
+    assert saved["benchmark"] == "load"
+    assert saved["routes"] == summary["routes"]
+    assert "git_commit" in saved["environment"]
+    assert "TOTAL" in results.format_table(summary, baseline=saved)
+
+def test_startup_benchmark_imports_the_app_without_the_auth_providers():
+    summary = startup.run(runs=1)
+
+    # the Google provider (google.auth, httpx) is only imported by the first Google login
+    assert summary["loaded_at_import"] == {name: False for name in startup.LAZY_MODULES}
+    assert 0 < summary["import_ms"] < summary["first_me_ms"]
+    assert "sqlalchemy" in summary["import_profile_ms"]
+
+def test_keys_benchmark_compares_random_and_time_ordered_keys():
+    summary = keys.run(rows=2000, batch_size=200, users=10, scanned_users=2)
+
+    assert set(summary["schemes"]) == {"uuid4", "uuid4_binary", "uuid7"}
+    uuid4, uuid4_binary, uuid7 = (summary["schemes"][scheme] for scheme in ("uuid4", "uuid4_binary", "uuid7"))
+    assert all(scheme["rows_per_s"] > 0 for scheme in (uuid4, uuid4_binary, uuid7))
+    # on SQLite the width alone: 16 bytes take less room than 32 characters, ordered or not
+    assert uuid4_binary["table_bytes"] < uuid4["table_bytes"]
+    assert uuid4_binary["index_bytes"] < uuid4["index_bytes"]
+    assert uuid7["table_bytes"] < uuid4["table_bytes"]
+    assert uuid7["index_bytes"] < uuid4["index_bytes"]
+    assert uuid4["pages_scanned"] == uuid4_binary["pages_scanned"] == uuid7["pages_scanned"] == 2 * 5
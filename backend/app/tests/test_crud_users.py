@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import users as crud_users
+from app.database import Base, SessionLocal
+
+def test_upsert_user_by_email_creates_then_moves_the_login(setup_test_db):
+    first_login = datetime(2024, 5, 1, 8, 0)
+    db = SessionLocal()
+    try:
+        user_id = crud_users.upsert_user_by_email(db, email="upsert@example.com", name="Upsert User", login_date=first_login)
+        user = crud_users.get_user_by_id(db, user_id)
+        assert (user.name, user.created_date, user.last_login_date, user.version) == ("Upsert User", first_login, first_login, 1)
+
+        second_login = first_login + timedelta(days=1)
+        assert crud_users.upsert_user_by_email(db, email="upsert@example.com", name="Another Name", login_date=second_login) == user_id
+        db.expire_all()
+        user = crud_users.get_user_by_id(db, user_id)
+        # only the login date (and the version) change, like a login did before
+        assert (user.name, user.created_date, user.last_login_date, user.version) == ("Upsert User", first_login, second_login, 2)
+    finally:
+        db.close()
+
+def test_concurrent_first_logins_get_the_same_user(tmp_path):
+    # a file database: every thread has its own connection (the in-memory TEST database has only one)
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'logins.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=file_engine)
+    FileSession = sessionmaker(bind=file_engine)
+
+    def first_login(_):
+        with FileSession() as db:
+            return crud_users.upsert_user_by_email(db, email="race@example.com", name="Racing User", login_date=datetime.now())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        user_ids = list(pool.map(first_login, range(8)))
+
+    assert len(set(user_ids)) == 1
+    with FileSession() as db:
+        assert crud_users.get_user_by_email(db, "race@example.com").version == 8
+    file_engine.dispose()
@@ -0,0 +1,126 @@
+import asyncio
+import httpx
+import pytest
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.utils import google_auth
+from app.utils.certs_cache import CertsCache
+from app.utils.fake_oidc import FakeOIDCIssuer
+
+AUDIENCE = "test-client-id"
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture(scope="function")
+def issuer():
+    return FakeOIDCIssuer(max_age=600)
+
+def make_cache(issuer, clock, **kwargs):
+    return CertsCache(issuer.CERTS_URL, client=httpx.Client(transport=issuer.transport), clock=clock, **kwargs)
+
+def test_certificates_are_fetched_once_per_max_age(issuer):
+    clock = FakeClock()
+    cache = make_cache(issuer, clock)
+    token = issuer.issue_id_token(AUDIENCE, "someone@example.com", "Someone")
+
+    for _ in range(3):
+        id_info = google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+        assert id_info["email"] == "someone@example.com"
+    assert issuer.certs_requests == 1
+
+    clock.now += 601
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+    assert issuer.certs_requests == 2
+
+def test_stale_certificates_are_served_during_an_outage(issuer):
+    clock = FakeClock()
+    cache = make_cache(issuer, clock, max_stale=300)
+    token = issuer.issue_id_token(AUDIENCE, "someone@example.com", "Someone")
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+
+    issuer.available = False
+    clock.now += 700
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+    assert cache.stale_served == 1
+
+    clock.now += 300
+    with pytest.raises(ValueError):
+        google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+
+def test_certificates_are_refreshed_ahead_and_on_key_rotation(issuer):
+    clock = FakeClock()
+    cache = make_cache(issuer, clock, refresh_ahead=60, min_refetch_interval=0)
+    token = issuer.issue_id_token(AUDIENCE, "someone@example.com", "Someone")
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+
+    # in the refresh window the cached copy is used and a background fetch is started
+    clock.now += 550
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+    deadline = time.monotonic() + 5
+    while issuer.certs_requests < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert issuer.certs_requests == 2
+
+    # a token signed with a key the cache doesn't know yet triggers a fetch
+    issuer.rotate_key()
+    requests_before = issuer.certs_requests
+    token = issuer.issue_id_token(AUDIENCE, "someone@example.com", "Someone")
+    google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+    assert issuer.certs_requests == requests_before + 1
+
+def test_wrong_audience_is_rejected(issuer):
+    cache = make_cache(issuer, FakeClock())
+    token = issuer.issue_id_token("another-client", "someone@example.com", "Someone")
+    with pytest.raises(ValueError):
+        google_auth.verify_id_token(token, audience=AUDIENCE, certs_cache=cache)
+
+def make_provider(issuer):
+    certs_cache = CertsCache(issuer.CERTS_URL, client=httpx.Client(transport=issuer.transport))
+    return google_auth.GoogleAuth(client_config=issuer.client_config(),
+                                  http_client=httpx.AsyncClient(transport=issuer.transport),
+                                  certs_cache=certs_cache)
+
+def test_code_exchange_against_the_local_token_endpoint(issuer):
+    provider = make_provider(issuer)
+
+    async def exchange():
+        code = issuer.authorize("someone@example.com", "Someone")
+        id_info = await provider.exchange_authorization_code(code)
+
+        with pytest.raises(ValueError):
+            await provider.exchange_authorization_code("unknown-code")
+        await provider.aclose()
+        return id_info
+
+    id_info = asyncio.run(exchange())
+    assert id_info["email"] == "someone@example.com"
+    assert id_info["name"] == "Someone"
+
+    url, state = provider.get_authorization_url()
+    assert url.startswith(issuer.AUTH_URL) and f"state={state}" in url
+
+def test_code_exchanges_wait_concurrently(issuer):
+    issuer.latency = 0.2
+    provider = make_provider(issuer)
+
+    async def exchange_many():
+        codes = [issuer.authorize(f"user{i}@example.com", f"User {i}") for i in range(10)]
+        results = await asyncio.gather(*(provider.exchange_authorization_code(code) for code in codes))
+        await provider.aclose()
+        return results
+
+    start = time.monotonic()
+    results = asyncio.run(exchange_many())
+    elapsed = time.monotonic() - start
+
+    assert sorted(result["email"] for result in results) == sorted(f"user{i}@example.com" for i in range(10))
+    # 10 exchanges of 0.2s each (plus one certificates fetch) overlap instead of taking 2s
+    assert elapsed < 1.5
@@ -0,0 +1,24 @@
+import time
+import uuid
+
+from app.models.types import BinaryUUID
+from app.utils.ids import uuid7, uuid7_time
+
+def test_uuid7_ids_are_time_ordered_version_7_uuids():
+    before = time.time()
+    ids = [uuid7() for _ in range(10000)]
+
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids)
+    # strictly increasing within the process, even within a millisecond, in the order of their bytes too
+    assert ids == sorted(set(ids))
+    assert [value.bytes for value in ids] == sorted(value.bytes for value in ids)
+    assert before - 0.001 <= uuid7_time(ids[0]) <= uuid7_time(ids[-1]) <= time.time()
+
+def test_binary_uuid_stores_the_16_bytes():
+    column_type = BinaryUUID()
+    value = uuid7()
+
+    assert column_type.process_bind_param(value, None) == value.bytes
+    assert column_type.process_bind_param(str(value), None) == value.bytes
+    assert column_type.process_result_value(value.bytes, None) == value
+    assert column_type.process_bind_param(None, None) is None
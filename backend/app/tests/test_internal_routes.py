@@ -0,0 +1,50 @@
+import pytest
+
+from sqlalchemy import create_engine
+
+from app.routers import internal
+from app.utils.pool_stats import POOL_STATS, InstrumentedQueuePool, instrument_pool
+
+def test_pool_stats_endpoint(setup_test_db, client, login, internal_headers):
+    login()
+
+    response = client.get("/internal/pool", headers=internal_headers)
+    assert response.status_code == 200
+    stats = response.json()
+    assert "primary" in stats
+    assert stats["primary"]["checkouts"] > 0
+    assert stats["primary"]["checked_out"] == 0
+
+def test_internal_routes_refuse_requests_without_the_token(client, monkeypatch):
+    for path in ["/internal/pool", "/internal/replicas", "/internal/token-cache", "/internal/account-purges"]:
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={"X-Internal-Token": "wrong-token"}).status_code == 403
+
+    # no token configured: nothing is allowed, not even an empty header
+    monkeypatch.setattr(internal, "INTERNAL_API_TOKEN", "")
+    assert client.get("/internal/pool", headers={"X-Internal-Token": ""}).status_code == 403
+
+def test_pool_stats_track_checkouts_and_overflow(tmp_path):
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                                pool_size=1, max_overflow=1, pool_timeout=0.1)
+    stats = instrument_pool("test_pool", test_engine.pool)
+
+    first = test_engine.connect()
+    second = test_engine.connect()
+    snapshot = stats.snapshot()
+    assert snapshot["checked_out"] == 2
+    assert snapshot["overflow"] == 1
+    assert snapshot["idle"] == 0
+
+    with pytest.raises(Exception):
+        test_engine.connect()
+    assert stats.snapshot()["timeouts"] == 1
+
+    first.close()
+    second.close()
+    snapshot = stats.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["idle"] == snapshot["opened"]
+    assert snapshot["wait_max_ms"] >= 100
+    test_engine.dispose()
+    POOL_STATS.pop("test_pool")
@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+
+from datetime import datetime
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.crud import users as crud_users
+from app.database import SessionLocal
+from app.utils import login_buffer
+from app.utils.query_stats import capture_queries
+
+def stored_user(email):
+    db = SessionLocal()
+    try:
+        return crud_users.get_user_by_email(db, email)
+    finally:
+        db.close()
+
+def test_logins_are_written_behind_and_flushed_at_shutdown(setup_test_db, login, monkeypatch):
+    buffer = login_buffer.LastLoginBuffer(max_size=100, max_staleness=3600)
+    monkeypatch.setattr(login_buffer, "LAST_LOGIN_WRITE_BEHIND", True)
+    monkeypatch.setattr(login_buffer, "LAST_LOGINS", buffer)
+
+    with TestClient(app) as client:
+        login("buffered", client=client)
+        created = stored_user("testuser-buffered@example.com")
+
+        # Test that the login of an existing user doesn't write
+        with capture_queries() as queries:
+            login("buffered", client=client)
+        assert not [statement for statement in queries.statements if not statement.startswith("SELECT")]
+        assert len(buffer) == 1
+        assert stored_user("testuser-buffered@example.com").last_login_date == created.last_login_date
+
+    # Test that the shutdown wrote the buffered date
+    flushed = stored_user("testuser-buffered@example.com")
+    assert flushed.last_login_date > created.last_login_date
+    assert flushed.version == created.version + 1
+    assert len(buffer) == 0
+    assert buffer.flushed == 1
+
+def test_a_full_buffer_falls_back_to_a_direct_write(setup_test_db, client, login, monkeypatch):
+    buffer = login_buffer.LastLoginBuffer(max_size=1, max_staleness=3600)
+    monkeypatch.setattr(login_buffer, "LAST_LOGIN_WRITE_BEHIND", True)
+    monkeypatch.setattr(login_buffer, "LAST_LOGINS", buffer)
+
+    # without the lifespan (no background flushes) the buffer stays full
+    login("first")
+    login("second")
+    login("first")
+    assert len(buffer) == 1
+
+    second = stored_user("testuser-second@example.com")
+    with capture_queries() as queries:
+        login("second")
+    assert any(statement.startswith("INSERT INTO users") for statement in queries.statements)
+    assert buffer.overflows == 1
+    assert stored_user("testuser-second@example.com").version == second.version + 1
+
+def test_a_failed_flush_keeps_at_most_max_size_dates(monkeypatch):
+    buffer = login_buffer.LastLoginBuffer(max_size=3, max_staleness=3600)
+    user_ids = [uuid.uuid4() for _ in range(5)]
+    dates = [datetime(2026, 1, 1, hour) for hour in range(5)]
+    for user_id, date in zip(user_ids[:3], dates[:3]):
+        buffer.record(user_id, date)
+
+    async def database_down(db, pending):
+        # logins recorded while the write is under way
+        for user_id, date in zip(user_ids[3:], dates[3:]):
+            buffer.record(user_id, date)
+        raise ConnectionError("the database is down")
+    monkeypatch.setattr(login_buffer.crud_users, "update_last_login_dates", database_down)
+    asyncio.run(buffer.flush())
+
+    # Test that the newest dates are kept for the next flush, and the oldest counted as dropped
+    assert len(buffer) == 3
+    assert buffer.dropped == 2
+    written = {}
+    async def database_up(db, pending):
+        written.update(pending)
+    monkeypatch.setattr(login_buffer.crud_users, "update_last_login_dates", database_up)
+    asyncio.run(buffer.flush())
+    assert written == dict(zip(user_ids[2:], dates[2:]))
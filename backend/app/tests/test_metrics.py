@@ -0,0 +1,44 @@
+import pytest
+
+from app.utils.metrics import METRICS, Metrics
+
+@pytest.fixture(scope="function")
+def empty_metrics(setup_test_db):
+    METRICS.clear()
+
+def test_metrics_are_labelled_by_route_template(empty_metrics, client, login):
+    headers = login()
+    note = client.post("/users/me/notes", json={"content": "a note to be deleted"}, headers=headers).json()
+    assert client.delete(f"/users/me/notes/{note['id']}", headers=headers).status_code == 200
+    assert client.delete(f"/users/me/notes/{note['id']}", headers=headers).status_code == 404
+    assert client.get("/no/such/path").status_code == 404
+    client.request("MADEUP", "/users/me")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    assert 'http_requests_total{method="DELETE",route="/users/me/notes/{note_id}",status="2xx"} 1' in text
+    assert 'http_requests_total{method="DELETE",route="/users/me/notes/{note_id}",status="4xx"} 1' in text
+    assert 'http_requests_total{method="GET",route="/users/auth/{provider}/callback",status="3xx"} 1' in text
+    assert 'http_requests_total{method="GET",route="<unmatched>",status="4xx"} 1' in text
+    assert 'method="other"' in text and "MADEUP" not in text
+    assert note["id"] not in text
+
+    assert 'http_request_duration_seconds_bucket{method="DELETE",route="/users/me/notes/{note_id}",le="+Inf"} 2' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/users/me/notes"} 1' in text
+    # the scrape itself is in flight while the page is rendered
+    assert 'http_requests_in_progress{method="GET"} 1' in text
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for seconds in (0.001, 0.02, 0.02, 20.0):
+        metrics.observe("GET", "/users/me", 200, seconds)
+
+    text = metrics.render()
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/me",le="0.005"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/me",le="0.025"} 3' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/me",le="10.0"} 3' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/me",le="+Inf"} 4' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/me"} 4' in text
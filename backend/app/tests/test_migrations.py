@@ -0,0 +1,73 @@
+import uuid
+from pathlib import Path
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.database import Base
+from app.models import users
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+def alembic_config(connection) -> Config:
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    config.attributes["connection"] = connection
+    return config
+
+def include_object(object, name, type_, reflected, compare_to):
+    # same filter as migrations/env.py on SQLite: no FTS5 tables in the models, no FULLTEXT index in the database
+    if type_ == "table" and name.startswith("notes_fts"):
+        return False
+    return not (type_ == "index" and name == "ix_notes_content_fulltext")
+
+def test_migrations_match_the_models(tmp_path):
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    with test_engine.begin() as connection:
+        command.upgrade(alembic_config(connection), "head")
+
+        # SQLite reflects the UUID columns as NUMERIC, so only the tables, columns and indexes are compared
+        migration_context = MigrationContext.configure(connection, opts={"compare_type": False,
+                                                                         "include_object": include_object})
+        diff = compare_metadata(migration_context, Base.metadata)
+        assert diff == []
+
+        note_indexes = {index["name"]: index["column_names"] for index in inspect(connection).get_indexes("notes")}
+        assert note_indexes["ix_notes_user_id_id"] == ["user_id", "id"]
+        assert "notes_fts" in inspect(connection).get_table_names()
+    test_engine.dispose()
+
+def test_the_existing_ids_are_converted_to_binary(tmp_path):
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    user_id, note_id, jti = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    with test_engine.begin() as connection:
+        command.upgrade(alembic_config(connection), "0007")
+        # the UUID columns before 0008: 32 hex characters
+        connection.execute(text("INSERT INTO users (id, email, name) VALUES (:id, 'old@example.com', 'Old')"),
+                           {"id": user_id.hex})
+        connection.execute(text("INSERT INTO notes (id, content, user_id) VALUES (:id, 'an old note', :user_id)"),
+                           {"id": note_id.hex, "user_id": user_id.hex})
+        connection.execute(text("INSERT INTO revoked_tokens (jti, user_id, expires_at) "
+                                "VALUES (:jti, :user_id, '2099-01-01 00:00:00')"), {"jti": jti.hex, "user_id": user_id.hex})
+        command.upgrade(alembic_config(connection), "head")
+
+    # the same ids, now 16 bytes, read back by the models; the foreign key and the full-text index still hold
+    with Session(test_engine) as db:
+        assert db.execute(select(users.Note.id, users.Note.user_id)).all() == [(note_id, user_id)]
+        assert db.scalar(text("SELECT typeof(user_id) FROM notes")) == "blob"
+        assert db.execute(select(users.RevokedToken.jti, users.RevokedToken.user_id)).all() == [(jti, user_id)]
+        assert db.execute(text("PRAGMA foreign_key_check")).all() == []
+        assert db.scalar(text("SELECT count(*) FROM notes_fts WHERE notes_fts MATCH 'old'")) == 1
+
+    with test_engine.begin() as connection:
+        command.downgrade(alembic_config(connection), "0007")
+        assert connection.execute(text("SELECT id, user_id FROM notes")).all() == [(note_id.hex, user_id.hex)]
+        assert connection.execute(text("SELECT jti, user_id FROM revoked_tokens")).all() == [(jti.hex, user_id.hex)]
+    test_engine.dispose()
@@ -0,0 +1,51 @@
+from app.database import SessionLocal
+from app.crud import users as crud_users
+from app.schemas import users as schema_users
+
+def test_notes_are_paginated_with_a_cursor(setup_test_db, client, login):
+    headers = login()
+    for i in range(5):
+        client.post("/users/me/notes", json={"content": f"This is test note {i}"}, headers=headers)
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/users/me/notes", params=params, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen += [note["id"] for note in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert len(seen) == 5
+    assert seen == sorted(seen)
+
+def test_invalid_cursor_and_page_size(setup_test_db, client, login):
+    headers = login()
+    response = client.get("/users/me/notes", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.get("/users/me/notes", params={"limit": 100000}, headers=headers)
+    assert response.status_code == 422
+
+def test_users_keyset_listing(setup_test_db):
+    db = SessionLocal()
+    try:
+        for i in range(3):
+            crud_users.create_user(db, schema_users.UserCreate(name=f"user {i}", email=f"user{i}@example.com"))
+
+        first_page = crud_users.get_users(db, limit=2)
+        second_page = crud_users.get_users(db, after_id=first_page[-1].id, limit=2)
+        assert len(first_page) == 2
+        assert len(second_page) == 1
+        assert first_page[-1].id < second_page[0].id
+    finally:
+        db.close()
@@ -0,0 +1,62 @@
+import uuid
+
+from app.crud import users as crud_users
+from app.database import SessionLocal
+from app.schemas.users import UserUpdate
+from app.utils import principal_cache
+from app.utils.jwt import decode_token
+
+def user_id_of(headers):
+    return uuid.UUID(decode_token(headers["Authorization"].removeprefix("Bearer "))["sub"])
+
+def test_principal_is_cached_without_notes(setup_test_db, client, login):
+    headers = login()
+    user_id = user_id_of(headers)
+    client.post("/users/me/notes", json={"content": "This is a test note"}, headers=headers)
+
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()["notes"]) == 1
+
+    principal = principal_cache.get_principal(user_id)
+    assert principal is not None
+    assert not hasattr(principal, "notes")
+
+def test_writes_invalidate_the_principal(setup_test_db, client, login):
+    headers = login()
+    user_id = user_id_of(headers)
+    client.get("/users/me", headers=headers)
+    assert principal_cache.get_principal(user_id) is not None
+
+    response = client.put("/users/me/name?new_name=another-name", headers=headers)
+    assert response.status_code == 200
+    assert principal_cache.get_principal(user_id) is None
+
+    response = client.get("/users/me", headers=headers)
+    assert response.json()["name"] == "another-name"
+
+    client.delete("/users/me", headers=headers)
+    assert principal_cache.get_principal(user_id) is None
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 401
+
+def test_a_stale_principal_is_not_sent_with_a_current_etag(setup_test_db, client, login, monkeypatch):
+    headers = login()
+    user_id = user_id_of(headers)
+    response = client.get("/users/me", headers=headers)
+    old_etag, old_name = response.headers["etag"], response.json()["name"]
+
+    # a rename handled by another worker: this worker's cached principal isn't invalidated
+    monkeypatch.setattr(crud_users, "invalidate_principal", lambda user_id: None)
+    with SessionLocal() as db:
+        crud_users.update_user(db, UserUpdate(id=user_id, name="Renamed Elsewhere"))
+    assert principal_cache.get_principal(user_id).name == old_name
+
+    response = client.get("/users/me", headers={**headers, "If-None-Match": old_etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed Elsewhere"
+    assert principal_cache.get_principal(user_id).name == "Renamed Elsewhere"
+
+    # the new ETag labels the new name
+    revalidated = client.get("/users/me", headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
@@ -0,0 +1,58 @@
+import logging
+import pytest
+
+from app.utils import query_stats
+from app.utils.query_stats import assert_max_queries
+
+def test_hot_paths_query_budget(setup_test_db, client, login):
+    # the number of statements of every hot path: going over fails (N+1 and extra round trip regressions)
+    # the login is a single upsert
+    with assert_max_queries(1):
+        headers = login()
+    with assert_max_queries(1):
+        headers = login()
+    # the user (then cached), their version (the ETag) and the notes
+    with assert_max_queries(3):
+        assert client.get("/users/me", headers=headers).status_code == 200
+    with assert_max_queries(3):
+        note = client.post("/users/me/notes", json={"content": "a note for the query budget"}, headers=headers).json()
+    # adding a note invalidated the cached principal: the user is loaded again
+    with assert_max_queries(3):
+        response = client.get("/users/me/notes", headers=headers)
+        assert response.status_code == 200
+    # a conditional GET of an unchanged page: only the version is read
+    with assert_max_queries(1):
+        assert client.get("/users/me/notes", headers={**headers, "If-None-Match": response.headers["etag"]}).status_code == 304
+    with assert_max_queries(4):
+        assert client.put("/users/me/name?new_name=Budget User", headers=headers).status_code == 200
+    with assert_max_queries(4):
+        assert client.delete(f"/users/me/notes/{note['id']}", headers=headers).status_code == 200
+
+def test_assert_max_queries_lists_the_statements(setup_test_db, client, login):
+    headers = login()
+    with pytest.raises(AssertionError, match=r"3 queries, expected at most 1:\n  1\. SELECT"):
+        with assert_max_queries(1):
+            client.get("/users/me", headers=headers)
+
+def test_query_stats_headers(setup_test_db, client, login, monkeypatch):
+    headers = login()
+    assert "x-db-query-count" not in client.get("/users/me/notes", headers=headers).headers
+
+    monkeypatch.setattr(query_stats, "QUERY_STATS_HEADERS", True)
+    response = client.get("/users/me/notes", headers=headers)
+    assert response.headers["x-db-query-count"] == "2"
+    assert float(response.headers["x-db-time-ms"]) > 0
+
+def test_slow_queries_are_logged_with_parameters_and_plan(setup_test_db, client, login, monkeypatch, caplog):
+    headers = login()
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_THRESHOLD_MS", 0)
+
+    with caplog.at_level(logging.WARNING, logger="app.utils.query_stats"):
+        assert client.get("/users/me/notes", headers=headers).status_code == 200
+
+    slow = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Slow query")]
+    assert slow
+    assert "FROM notes" in slow[-1]
+    assert "Parameters:" in slow[-1]
+    # SQLite's EXPLAIN QUERY PLAN: the notes are found through the (user_id, id) index
+    assert "ix_notes_user_id_id" in slow[-1]
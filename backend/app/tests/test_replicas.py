@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+
+from types import SimpleNamespace
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.crud import users as crud_users
+from app.database import ASYNC_DB, Base, SessionLocal
+from app.models.users import Note, User
+from app.utils import replicas
+
+def sqlite_replica(path):
+    # a SQLite file stands in for a replica (the primary is the in-memory TEST database)
+    replica_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_replica_engine = create_async_engine(f"sqlite+aiosqlite:///{path}") if ASYNC_DB else None
+    return replicas.Replica("replica_0", replica_engine, async_replica_engine)
+
+@pytest.fixture(scope="function")
+def clock():
+    return SimpleNamespace(now=0.0)
+
+@pytest.fixture(scope="function")
+def replica_set(setup_test_db, tmp_path, monkeypatch, clock):
+    replica = sqlite_replica(tmp_path / "replica.db")
+    routing = replicas.ReplicaSet([replica], max_lag=2, read_your_writes_window=5, clock=lambda: clock.now)
+    monkeypatch.setattr(replicas, "REPLICAS", routing)
+    Base.metadata.create_all(bind=replica.engine)
+    yield routing
+    replica.engine.dispose()
+    if replica.async_engine is not None:
+        asyncio.run(replica.async_engine.dispose())
+
+def replicate_user(replica, note_content):
+    # the replica's copy of the user, with a note only the replica has (it tells which database was read)
+    with SessionLocal() as db:
+        user = crud_users.get_user_by_email(db, "testuser-replica@example.com")
+        row = {column.name: getattr(user, column.name) for column in User.__table__.columns}
+    with replica.engine.begin() as connection:
+        connection.execute(insert(User), row)
+        connection.execute(insert(Note), {"content": note_content, "user_id": row["id"]})
+
+def note_contents(client, headers):
+    response = client.get("/users/me/notes", headers=headers)
+    assert response.status_code == 200
+    return [note["content"] for note in response.json()["items"]]
+
+def test_reads_go_to_the_replica_except_just_after_a_write(replica_set, clock, client, login, internal_headers):
+    replica_set.check()
+    headers = login("replica")
+    replicate_user(replica_set.replicas[0], "only on the replica")
+
+    # Test that the login (a write) makes the user's reads sticky to the primary
+    assert note_contents(client, headers) == []
+    assert replica_set.sticky_reads == 1
+
+    clock.now += 6
+    assert note_contents(client, headers) == ["only on the replica"]
+    assert replica_set.replica_reads == 1
+
+    # Test that a lagging replica isn't read from
+    replica_set.replicas[0].probe = lambda: 10.0
+    replica_set.check()
+    assert note_contents(client, headers) == []
+    assert replica_set.fallback_reads == 1
+
+    response = client.get("/internal/replicas", headers=internal_headers)
+    assert response.json()["replicas"] == {"replica_0": {"healthy": True, "lag": 10.0}}
+
+def test_a_lagging_replica_does_not_replace_a_newer_principal(replica_set, clock, client, login):
+    replica_set.check()
+    headers = login("replica")
+    replicate_user(replica_set.replicas[0], "only on the replica")
+
+    # a rename the replica hasn't received yet; the principal read on the primary is cached
+    assert client.put("/users/me/name", params={"new_name": "Renamed Here"}, headers=headers).status_code == 200
+    assert client.get("/users/me", headers=headers).json()["name"] == "Renamed Here"
+
+    # Test that once /me reads the replica, its older row neither undoes the rename nor gets cached
+    clock.now += 6
+    response = client.get("/users/me", headers=headers)
+    assert response.json()["notes"][0]["content"] == "only on the replica"
+    assert response.json()["name"] == "Renamed Here"
+    assert client.get("/users/me", headers=headers).json()["name"] == "Renamed Here"
+
+def test_a_replica_that_is_down_falls_back_to_the_primary(replica_set, clock, tmp_path, client, login):
+    down = sqlite_replica(tmp_path / "missing-directory" / "replica.db")
+    down.healthy, down.lag = True, 0.0  # it was up at the last check
+    replica_set.replicas = [down]
+    headers = login("replica")
+    clock.now += 6
+
+    assert note_contents(client, headers) == []
+    assert not down.healthy
+    assert replica_set.fallback_reads == 1
+
+    # the next check doesn't bring it back
+    replica_set.check()
+    assert not down.healthy
+    down.engine.dispose()
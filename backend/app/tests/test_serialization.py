@@ -0,0 +1,32 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas import users as schema_users
+from app.utils.serialization import ModelResponse
+
+def test_model_response_matches_fastapi_encoding():
+    rows = [SimpleNamespace(id=uuid.uuid4(), content=f"a note number {i}") for i in range(3)]
+    user = schema_users.User(id=uuid.uuid4(), name="Serialized User", email="serialized@example.com",
+                             created_date=datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+                             last_login_date=datetime(2024, 5, 2, 8, 0),
+                             notes=schema_users.NOTES_ADAPTER.validate_python(rows, from_attributes=True))
+
+    response = ModelResponse(user)
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == jsonable_encoder(user)
+    assert b'"created_date":"2024-05-01T12:30:15.123456Z"' in response.body
+
+def test_model_response_of_a_list_uses_the_adapter():
+    results = [schema_users.NoteSearchResult(id=uuid.uuid4(), content="a searched note", score=1.5, highlight="a <mark>searched</mark> note")]
+
+    response = ModelResponse(results, adapter=schema_users.NOTE_SEARCH_RESULTS_ADAPTER)
+
+    assert json.loads(response.body) == jsonable_encoder(results)
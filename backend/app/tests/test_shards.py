@@ -0,0 +1,169 @@
+import asyncio
+import uuid
+import pytest
+
+from sqlalchemy import UUID, Column, MetaData, String, Table, create_engine, func, insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.crud import users as crud_users, users_async
+from app.database import ASYNC_DB, SessionLocal, engine
+from app.models.users import Note
+from app.schemas.users import NoteCreate
+from app.tools import reshard
+from app.utils import principal_cache, shards
+
+def sqlite_shard(name, path):
+    # a SQLite file stands in for a shard
+    shard_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_shard_engine = create_async_engine(f"sqlite+aiosqlite:///{path}") if ASYNC_DB else None
+    return shards.Shard(name, shard_engine, async_shard_engine)
+
+@pytest.fixture(scope="function")
+def shard_files(setup_test_db, tmp_path, monkeypatch):
+    files = [sqlite_shard(name, tmp_path / f"{name}.db") for name in ("shard_a", "shard_b")]
+    shards.ShardSet(files).create_schemas()
+    monkeypatch.setattr(shards, "SHARDS", shards.ShardSet([]))
+    yield files
+    for shard in files:
+        shard.engine.dispose()
+        if shard.async_engine is not None:
+            asyncio.run(shard.async_engine.dispose())
+
+def use_shards(monkeypatch, *shard_list):
+    monkeypatch.setattr(shards, "SHARDS", shards.ShardSet(list(shard_list)))
+    principal_cache.clear()
+
+def add_notes(client, headers, *contents):
+    response = client.post("/users/me/notes/batch", json=[{"content": content} for content in contents], headers=headers)
+    assert response.status_code == 200
+    return [result["id"] for result in response.json()["results"]]
+
+def notes_on(shard_engine, user_id):
+    with shard_engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(Note).where(Note.user_id == user_id))
+
+def user_id_of(client, headers):
+    return uuid.UUID(client.get("/users/me", headers=headers).json()["id"])
+
+def test_the_hash_ring_only_moves_the_keys_of_a_new_shard():
+    keys = [uuid.uuid4().bytes for _ in range(4000)]
+    three = shards.HashRing(["a", "b", "c"])
+    four = shards.HashRing(["a", "b", "c", "d"])
+
+    moved = [key for key in keys if three.node_for(key) != four.node_for(key)]
+    assert all(four.node_for(key) == "d" for key in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    assert shards.HashRing([]).node_for(keys[0]) is None
+
+def test_the_notes_are_on_the_shard_of_the_user(shard_files, monkeypatch, client, login):
+    use_shards(monkeypatch, *shard_files)
+    headers = login("sharded")
+    user_id = user_id_of(client, headers)
+    shard_name = shards.SHARDS.shard_for(user_id)
+    shard_engine, other_engine = (shard.engine for shard in sorted(shard_files, key=lambda shard: shard.name != shard_name))
+
+    ids = add_notes(client, headers, "first sharded note", "second sharded note", "third sharded note")
+    response = client.post("/users/me/notes", json={"content": "a single sharded note"}, headers=headers)
+    assert response.status_code == 200
+    assert client.delete(f"/users/me/notes/{ids[0]}", headers=headers).status_code == 200
+    response = client.post("/users/me/notes/batch-delete", json={"ids": [ids[1]]}, headers=headers)
+    assert [result["status"] for result in response.json()["results"]] == ["deleted"]
+
+    assert (notes_on(shard_engine, user_id), notes_on(other_engine, user_id), notes_on(engine, user_id)) == (2, 0, 0)
+    contents = [note["content"] for note in client.get("/users/me/notes", headers=headers).json()["items"]]
+    assert sorted(contents) == ["a single sharded note", "third sharded note"]
+    response = client.get("/users/me/notes/search", params={"q": "single"}, headers=headers)
+    assert [result["content"] for result in response.json()] == ["a single sharded note"]
+    assert len(client.get("/users/me/notes/export", headers=headers).text.splitlines()) == 2
+
+    # the account goes with its notes on the shard
+    assert client.delete("/users/me", headers=headers).status_code == 200
+    assert notes_on(shard_engine, user_id) == 0
+
+def test_rebalance_moves_the_users_whose_shard_changed(shard_files, monkeypatch, client, login):
+    shard_a, shard_b = shard_files
+    # a user from before the sharding, then users placed on the only shard
+    legacy = login("legacy")
+    add_notes(client, legacy, "legacy note one", "legacy note two")
+    use_shards(monkeypatch, shard_a)
+    users = [login(f"placed-{index}") for index in range(12)]
+    for headers in users:
+        add_notes(client, headers, "placed note one", "placed note two")
+
+    use_shards(monkeypatch, shard_a, shard_b)
+    with SessionLocal() as db:
+        planned = list(reshard.plan(db))
+    summary = reshard.rebalance(grace=0, log=lambda line: None)
+    assert summary["moved"] == len(planned) >= 2
+    with SessionLocal() as db:
+        assert list(reshard.plan(db)) == []
+
+    # every user has their 2 notes on their shard on the ring, and only there
+    engines = {None: engine, "shard_a": shard_a.engine, "shard_b": shard_b.engine}
+    for headers in [legacy, *users]:
+        user_id = user_id_of(client, headers)
+        placement = shards.SHARDS.shard_for(user_id)
+        assert {name: notes_on(shard_engine, user_id) for name, shard_engine in engines.items()} == \
+               {name: 2 if name == placement else 0 for name in engines}
+        assert len(client.get("/users/me/notes", headers=headers).json()["items"]) == 2
+
+def test_a_write_routed_to_the_old_shard_is_refused(shard_files, monkeypatch, client, login):
+    shard_a, shard_b = shard_files
+    headers = login("moved")
+    add_notes(client, headers, "note before the move")
+    user_id = user_id_of(client, headers)
+    use_shards(monkeypatch, shard_a, shard_b)
+    assert reshard.move_user(user_id, None, "shard_b")
+
+    # the placement was read just before the switch
+    with SessionLocal() as db:
+        with pytest.raises(shards.ShardMoved):
+            crud_users.create_note_for_user(db, user_id, NoteCreate(content="note after the move"))
+    async def stale_placement(db, user_id):
+        return None
+    monkeypatch.setattr(users_async, "get_notes_shard", stale_placement)
+    response = client.post("/users/me/notes", json={"content": "note after the move"}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    # nothing was written, and the old copy is still there until the cleanup
+    assert (notes_on(engine, user_id), notes_on(shard_b.engine, user_id)) == (1, 1)
+    assert reshard.cleanup(log=lambda line: None) == 1
+    assert notes_on(engine, user_id) == 0
+
+def test_cleanup_pages_through_the_users_of_a_shard(shard_files, monkeypatch, client, login):
+    shard_a, shard_b = shard_files
+    # users moved without their cleanup: their old copies stay on the primary, next to a user who wasn't moved
+    stays = login("stays")
+    add_notes(client, stays, "a note that stays")
+    moved = [login(f"interrupted-{index}") for index in range(5)]
+    for headers in moved:
+        add_notes(client, headers, "copied note one", "copied note two")
+    use_shards(monkeypatch, shard_a, shard_b)
+    for headers in moved:
+        assert reshard.move_user(user_id_of(client, headers), None, "shard_b")
+
+    # Test that pages of 2 users find every old copy
+    assert reshard.cleanup(batch_size=2, log=lambda line: None) == 10
+    assert [notes_on(engine, user_id_of(client, headers)) for headers in moved] == [0] * 5
+    assert notes_on(engine, user_id_of(client, stays)) == 1
+    assert notes_on(shard_b.engine, user_id_of(client, moved[0])) == 2
+
+def test_init_converts_the_keys_of_an_existing_shard(tmp_path):
+    # a shard made before the 16-byte keys: the notes table with UUID columns (32 hex characters on SQLite)
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    old_notes = Table("notes", MetaData(), Column("id", UUID(as_uuid=True), primary_key=True),
+                      Column("content", String(100), nullable=False), Column("user_id", UUID(as_uuid=True), nullable=False))
+    old_notes.create(old_engine)
+    rows = [{"id": uuid.uuid4(), "content": f"old note {index}", "user_id": uuid.uuid4()} for index in range(5)]
+    with old_engine.begin() as connection:
+        connection.execute(insert(old_notes), rows)
+
+    # Test that the notes are converted in batches, read back by the model, and only once
+    assert reshard.convert_keys(old_engine, batch_size=2) == 5
+    with old_engine.connect() as connection:
+        assert sorted(connection.execute(select(Note.id, Note.user_id)).all()) == \
+               sorted((row["id"], row["user_id"]) for row in rows)
+        assert connection.scalar(text("SELECT count(*) FROM notes WHERE typeof(id) = 'blob'")) == 5
+    assert reshard.convert_keys(old_engine) == 0
+    old_engine.dispose()
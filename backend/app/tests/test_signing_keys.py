@@ -0,0 +1,89 @@
+import base64
+import hmac
+import jwt
+import pytest
+
+from cryptography.hazmat.primitives import serialization
+
+from app.utils import jwt as app_jwt
+from app.utils import signing_keys, token_cache
+
+def write_key(keys_dir, kid, algorithm):
+    pem = signing_keys.generate_key(algorithm).private_bytes(serialization.Encoding.PEM,
+                                                             serialization.PrivateFormat.PKCS8,
+                                                             serialization.NoEncryption())
+    (keys_dir / f"{kid}.pem").write_bytes(pem)
+
+@pytest.fixture(scope="function")
+def key_ring(setup_test_db, tmp_path, monkeypatch):
+    write_key(tmp_path, "2026-01", "RS256")
+    write_key(tmp_path, "2026-02", "EdDSA")
+    ring = signing_keys.load_key_ring("EdDSA", "unused", keys_dir=str(tmp_path), signing_kid="")
+    monkeypatch.setattr(app_jwt, "SIGNING_KEYS", ring)
+    token_cache.clear()
+    return ring
+
+def base64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def test_tokens_are_signed_with_the_last_key_and_verifiable_from_the_jwks(key_ring, client, login):
+    headers = login("keys")
+    access_token = headers["Authorization"].removeprefix("Bearer ")
+    assert jwt.get_unverified_header(access_token) == {"alg": "EdDSA", "kid": "2026-02", "typ": "JWT"}
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    response = client.get("/.well-known/jwks.json")
+    assert response.headers["cache-control"] == f"public, max-age={signing_keys.JWKS_MAX_AGE}"
+    jwks = response.json()
+    assert [(key["kid"], key["alg"]) for key in jwks["keys"]] == [("2026-01", "RS256"), ("2026-02", "EdDSA")]
+    assert all("d" not in key for key in jwks["keys"])  # no private part
+
+    # Test that another service can verify the token with the published key only
+    public_key = jwt.PyJWKSet.from_dict(jwks)["2026-02"]
+    assert jwt.decode(access_token, public_key.key, algorithms=["EdDSA"])["type"] == "access"
+
+    # Test that the JWKS is revalidated with its ETag
+    revalidated = client.get("/.well-known/jwks.json", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+def test_rotation_keeps_the_tokens_of_the_previous_key(key_ring, tmp_path, client, login):
+    old_headers = login("keys")
+
+    # a new key is added to the directory: a worker finds it with the first token that names it
+    write_key(tmp_path, "2026-03", "RS256")
+    new_ring = signing_keys.load_key_ring("EdDSA", "unused", keys_dir=str(tmp_path), signing_kid="2026-03")
+    new_token = jwt.encode({"sub": "someone", "exp": 4102444800}, new_ring.signing_key.private_key,
+                           algorithm="RS256", headers={"kid": "2026-03"})
+    key_ring.min_reload_interval = 0
+    assert app_jwt.decode_token(new_token)["sub"] == "someone"
+    assert "2026-03" in [key["kid"] for key in client.get("/.well-known/jwks.json").json()["keys"]]
+
+    # and still verifies the tokens of the key it signed with before
+    assert client.get("/users/me", headers=old_headers).status_code == 200
+
+def test_the_algorithm_of_the_token_is_not_trusted(key_ring, client):
+    # a HS256 token "signed" with the public key of an RSA kid (algorithm confusion) and one of an unknown kid
+    public_pem = key_ring.get("2026-01").public_key.public_bytes(serialization.Encoding.PEM,
+                                                                 serialization.PublicFormat.SubjectPublicKeyInfo)
+    signing_input = b".".join(base64url(part) for part in (b'{"alg":"HS256","kid":"2026-01","typ":"JWT"}',
+                                                           b'{"sub":"someone","exp":4102444800}'))
+    forged = (signing_input + b"." + base64url(hmac.digest(public_pem, signing_input, "sha256"))).decode()
+    unknown = jwt.encode({"sub": "someone", "exp": 4102444800}, "secret", algorithm="HS256", headers={"kid": "nope"})
+
+    for token in (forged, unknown):
+        assert client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+def test_a_shared_secret_publishes_no_keys():
+    ring = signing_keys.load_key_ring("HS256", "a-secret")
+
+    assert ring.signing_key.kid is None
+    assert ring.jwks()[0] == b'{"keys":[]}'
+
+def test_missing_keys_refuse_to_start_unless_a_temporary_key_is_allowed(tmp_path):
+    # an empty or wrong JWT_KEYS_DIR
+    for keys_dir in ("", str(tmp_path), str(tmp_path / "missing")):
+        with pytest.raises(ValueError, match="JWT_KEYS_DIR"):
+            signing_keys.load_key_ring("RS256", "unused", keys_dir=keys_dir, allow_temporary_key=False)
+
+    ring = signing_keys.load_key_ring("RS256", "unused", keys_dir=str(tmp_path), allow_temporary_key=True)
+    assert ring.signing_key.kid.startswith("temporary-")
@@ -0,0 +1,36 @@
+import jwt
+import pytest
+import time
+
+from datetime import timedelta
+
+from app.utils import token_cache
+from app.utils.jwt import create_access_token, decode_token
+
+@pytest.fixture(scope="function")
+def empty_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+def test_repeated_tokens_are_served_from_the_cache(empty_token_cache, client, internal_headers):
+    token = create_access_token(data="some-user", expires_delta=timedelta(minutes=5))
+
+    first = decode_token(token)
+    second = decode_token(token)
+    assert first == second
+    assert first["sub"] == "some-user"
+
+    stats = client.get("/internal/token-cache", headers=internal_headers).json()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["size"] == 1
+
+def test_cached_claims_never_outlive_the_token(empty_token_cache):
+    token_cache.set_claims("expired-token", {"sub": "some-user", "exp": time.time() - 1})
+    assert token_cache.get_claims("expired-token") is None
+
+    token = create_access_token(data="some-user", expires_delta=timedelta(seconds=-1))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_token(token)
+    assert token_cache.stats()["size"] == 0
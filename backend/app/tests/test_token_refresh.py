@@ -0,0 +1,54 @@
+from urllib.parse import urlparse, parse_qs
+
+from app.utils.query_stats import capture_queries
+
+def login_tokens(client):
+    # the refresh token too, which the login fixture doesn't give
+    response = client.get("/users/auth/test/callback?code=test-code-refresh", follow_redirects=False)
+    query_params = parse_qs(urlparse(response.headers["location"]).query)
+    return query_params["access_token"][0], query_params["refresh_token"][0]
+
+def refresh(client, refresh_token):
+    return client.post("/users/token/refresh", json={"refresh_token": refresh_token})
+
+def test_refresh_rotates_the_tokens(setup_test_db, client):
+    _, refresh_token = login_tokens(client)
+
+    # Test that the only write is the revocation of the used token
+    with capture_queries() as queries:
+        response = refresh(client, refresh_token)
+    assert response.status_code == 200
+    writes = [statement.split()[:3] for statement in queries.statements if not statement.startswith("SELECT")]
+    assert writes == [["INSERT", "INTO", "revoked_tokens"]]
+
+    tokens = response.json()
+    assert tokens["token_type"] == "bearer"
+    assert tokens["refresh_token"] != refresh_token
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert me.json()["email"] == "testuser-refresh@example.com"
+
+    # Test that the new refresh token works once
+    assert refresh(client, tokens["refresh_token"]).status_code == 200
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+def test_a_used_refresh_token_is_refused(setup_test_db, client):
+    _, refresh_token = login_tokens(client)
+    assert refresh(client, refresh_token).status_code == 200
+
+    # Test that the primary key of the revocations refuses the second use, without a lookup of the revocations
+    with capture_queries() as queries:
+        assert refresh(client, refresh_token).status_code == 401
+    assert not any("revoked_tokens" in statement for statement in queries.statements if statement.startswith("SELECT"))
+
+def test_a_deleted_account_gets_no_new_tokens(setup_test_db, client):
+    access_token, refresh_token = login_tokens(client)
+    assert client.delete("/users/me", headers={"Authorization": f"Bearer {access_token}"}).status_code == 200
+
+    assert refresh(client, refresh_token).status_code == 401
+
+def test_tokens_are_not_interchangeable(setup_test_db, client):
+    access_token, refresh_token = login_tokens(client)
+
+    assert refresh(client, access_token).status_code == 401
+    assert refresh(client, "not-a-token").status_code == 401
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {refresh_token}"}).status_code == 401
@@ -1,24 +1,16 @@
+import asyncio
+import json
+import os
 import pytest
+import subprocess
+import sys
 
 from urllib.parse import urlparse, parse_qs
-from fastapi.testclient import TestClient
 
-from dotenv import load_dotenv
-load_dotenv()
+from app.utils import providers
+from app.utils.mock_auth import MockAuth
 
-from app.main import app  
-from app.database import Base, engine
-
-# Initialize the test client
-client = TestClient(app)
-
-@pytest.fixture(scope="function")
-def setup_test_db():
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
-
-def test_create_user_and_get_auth_token(setup_test_db):
+def test_create_user_and_get_auth_token(setup_test_db, client):
     # Simulate a login callback to create a user and get tokens
 
     TEST_AUTH_CODE = "test-code"
@@ -36,26 +28,22 @@ def test_create_user_and_get_auth_token(setup_test_db):
     access_token = query_params["access_token"][0]
     assert access_token
 
-    return access_token
-
-def test_getting_user_info(setup_test_db):
+def test_getting_user_info(setup_test_db, client, login):
     
     # Prepare user
-    access_token = test_create_user_and_get_auth_token(setup_test_db)
+    headers = login()
 
     # Test getting the user info
-    headers = {"Authorization": f"Bearer {access_token}"}
     response = client.get("/users/me", headers=headers)
     assert response.status_code == 200
     user_data = response.json()
     email = user_data["email"]
     assert email.startswith("testuser") and email.endswith("@example.com") 
 
-def test_notes_for_user(setup_test_db):
+def test_notes_for_user(setup_test_db, client, login):
     
     # Prepare user
-    access_token = test_create_user_and_get_auth_token(setup_test_db)
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = login()
 
     # Test getting all notes from the user
     response = client.get("/users/me", headers=headers)
@@ -92,11 +80,32 @@ def test_notes_for_user(setup_test_db):
     notes_received = user_data["notes"]
     assert len(notes_received) == 0
 
-def test_delete_user(setup_test_db):
+def test_the_suffixed_test_codes_are_refused_outside_the_test_stage():
+    provider = MockAuth(suffixed_codes=False)
+
+    assert asyncio.run(provider.exchange_authorization_code("test-code")) == provider.fake_user_data
+    with pytest.raises(ValueError):
+        asyncio.run(provider.exchange_authorization_code("test-code-anyone"))
+
+def test_notes_of_another_user_cannot_be_deleted(setup_test_db, client, login):
+    alice, bob = login("alice"), login("bob")
+    note_id = client.post("/users/me/notes", json={"content": "Alice's own note"}, headers=alice).json()["id"]
+    alice_etag = client.get("/users/me", headers=alice).headers["etag"]
+
+    # Test that Bob's deletes don't find Alice's note, one by one or in a batch
+    assert client.delete(f"/users/me/notes/{note_id}", headers=bob).status_code == 404
+    response = client.post("/users/me/notes/batch-delete", json={"ids": [note_id]}, headers=bob)
+    assert [result["status"] for result in response.json()["results"]] == ["not_found"]
+
+    # Test that Alice still has her note, and her version didn't move
+    response = client.get("/users/me", headers={**alice, "If-None-Match": alice_etag})
+    assert response.status_code == 304
+    assert [note["id"] for note in client.get("/users/me", headers=alice).json()["notes"]] == [note_id]
+
+def test_delete_user(setup_test_db, client, login):
     
     # Prepare user
-    access_token = test_create_user_and_get_auth_token(setup_test_db)
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = login()
 
     # Test deleting the user
     response = client.delete("/users/me", headers=headers)
@@ -108,10 +117,9 @@ def test_delete_user(setup_test_db):
     response = client.delete("/users/me", headers=headers)
     assert response.status_code == 401
 
-def test_change_name_user(setup_test_db):
+def test_change_name_user(setup_test_db, client, login):
     # Prepare user
-    access_token = test_create_user_and_get_auth_token(setup_test_db)
-    headers = {"Authorization": f"Bearer {access_token}"}
+    headers = login()
 
     # Test deleting the user
     NEW_NAME = "new-test-name"
@@ -119,3 +127,131 @@ def test_change_name_user(setup_test_db):
     assert response.status_code == 200
     user_data = response.json()
     assert user_data["name"] == NEW_NAME
+
+def test_export_notes(setup_test_db, client, login):
+    # Prepare user
+    headers = login()
+
+    contents = [f"This is exported note {i}" for i in range(3)]
+    for content in contents:
+        client.post("/users/me/notes", json={"content": content}, headers=headers)
+
+    # Test exporting the notes as NDJSON
+    response = client.get("/users/me/notes/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(note["content"] for note in exported) == contents
+    assert all(note["id"] for note in exported)
+
+def test_batch_notes(setup_test_db, client, login):
+    # Prepare user
+    headers = login()
+
+    # Test adding notes in bulk
+    notes_to_add = [{"content": f"This is bulk note {i}"} for i in range(3)]
+    response = client.post("/users/me/notes/batch", json=notes_to_add, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created"] * 3
+
+    response = client.get("/users/me", headers=headers)
+    assert len(response.json()["notes"]) == 3
+
+    # Test that one invalid note rejects the whole batch
+    response = client.post("/users/me/notes/batch", json=[{"content": "This is fine"}, {"content": "short"}], headers=headers)
+    assert response.status_code == 422
+
+    # Test deleting notes in bulk, with an id that does not exist
+    ids = [result["id"] for result in results[:2]] + ["00000000-0000-0000-0000-000000000000"]
+    response = client.post("/users/me/notes/batch-delete", json={"ids": ids}, headers=headers)
+    assert response.status_code == 200
+    statuses = [result["status"] for result in response.json()["results"]]
+    assert statuses == ["deleted", "deleted", "not_found"]
+
+    response = client.get("/users/me", headers=headers)
+    notes_received = response.json()["notes"]
+    assert [note["id"] for note in notes_received] == [results[2]["id"]]
+
+def test_search_notes(setup_test_db, client, login):
+    # Prepare user
+    headers = login()
+
+    for content in ["Buy bananas and apples", "Call the bank about <the> loan", "Bananas are yellow, bananas"]:
+        client.post("/users/me/notes", json={"content": content}, headers=headers)
+
+    # Test searching, best match first and highlighted
+    response = client.get("/users/me/notes/search", params={"q": "bananas"}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["content"] for result in results] == ["Bananas are yellow, bananas", "Buy bananas and apples"]
+    assert results[0]["highlight"] == "<mark>Bananas</mark> are yellow, <mark>bananas</mark>"
+
+    response = client.get("/users/me/notes/search", params={"q": "loan"}, headers=headers)
+    results = response.json()
+    assert results[0]["highlight"] == "Call the bank about &lt;the&gt; <mark>loan</mark>"
+
+    # Test that deleted notes are not found anymore
+    client.delete(f"/users/me/notes/{results[0]['id']}", headers=headers)
+    response = client.get("/users/me/notes/search", params={"q": "loan"}, headers=headers)
+    assert response.json() == []
+
+    response = client.get("/users/me/notes/search", params={"q": "!!!"}, headers=headers)
+    assert response.status_code == 400
+
+def test_conditional_get(setup_test_db, client, login):
+    # Prepare user
+    headers = login()
+
+    # Test that an unchanged user is not sent again
+    response = client.get("/users/me", headers=headers)
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    response = client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    notes_etag = client.get("/users/me/notes", headers=headers).headers["etag"]
+    assert client.get("/users/me/notes", headers={**headers, "If-None-Match": f'"other", W/{notes_etag}'}).status_code == 304
+
+    # Test that every write changes the ETag
+    note = client.post("/users/me/notes", json={"content": "Changes the version"}, headers=headers).json()
+    response = client.get("/users/me/notes", headers={**headers, "If-None-Match": notes_etag})
+    assert response.status_code == 200
+    assert response.json()["items"][0]["id"] == note["id"]
+    notes_etag = response.headers["etag"]
+
+    client.delete(f"/users/me/notes/{note['id']}", headers=headers)
+    assert client.get("/users/me/notes", headers={**headers, "If-None-Match": notes_etag}).status_code == 200
+
+    etag = client.get("/users/me", headers=headers).headers["etag"]
+    client.put("/users/me/name?new_name=Version Bump", headers=headers)
+    response = client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Version Bump"
+
+# run in a new interpreter: this one already loaded httpx for the test client
+FIRST_USE_SCRIPT = """
+import json, sys
+import app.main
+from app.utils import providers
+before = {name: name in sys.modules for name in ("google.auth", "httpx")}
+providers.get_provider("google")
+print(json.dumps([before, {name: name in sys.modules for name in ("google.auth", "httpx")}]))
+"""
+
+def test_providers_are_made_on_first_use(client):
+    # Test that importing the app doesn't load the Google client, and that the first use does
+    env = dict(os.environ, STAGE="TEST", SQL_ECHO="false", TEST_DATABASE_PATH="")
+    process = subprocess.run([sys.executable, "-c", FIRST_USE_SCRIPT], env=env, capture_output=True, text=True,
+                             check=True)
+    before, after = json.loads(process.stdout.splitlines()[-1])
+    assert before == {"google.auth": False, "httpx": False}
+    assert after == {"google.auth": True, "httpx": True}
+
+    assert client.get("/users/login/unknown").status_code == 400
+
+    response = client.get("/users/login/test")
+    assert response.status_code == 200
+    assert providers.get_provider("test") is providers.get_provider("test")
@@ -0,0 +1,275 @@
+"""
+Moves the notes of the users between the shards (see app.utils.shards), online: the API keeps serving the users
+being moved.
+
+The shards are configured by name (MARIADB_SHARD_HOSTS, TEST_SHARD_DATABASE_PATHS); the new users are placed by
+the hash ring, the others stay where users.notes_shard says until this tool moves them:
+
+    python -m app.tools.reshard init        # the notes table on every shard (new shards), keys converted to 16 bytes
+    python -m app.tools.reshard plan        # how many users would move, from where to where
+    python -m app.tools.reshard rebalance   # every user to their shard on the ring (and the unsharded ones)
+    python -m app.tools.reshard cleanup     # the copies left by an interrupted rebalance
+
+To add a shard: configure it everywhere, `init`, restart the workers, `rebalance` (only the users the new shard
+takes on the ring move). To remove one: list it in NOTES_SHARDS_DRAINING, restart, `rebalance`, then drop it.
+
+A user moves in three steps:
+  1. copy: their notes are copied to the target in batches, while they keep using the source;
+  2. switch: their row on the primary is locked (the writes of notes take the same lock, app.crud.users), the
+     notes written or deleted during the copy are synced, and users.notes_shard is set to the target;
+  3. cleanup, `--grace` seconds later: the copy on the source is deleted. Until then the workers that cached the
+     user before the switch (PRINCIPAL_CACHE_TTL) still read the source; their writes are refused (503, retried).
+"""
+import argparse
+import time
+from collections import deque
+from uuid import UUID
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from app.crud import users as crud_users
+from app.database import SessionLocal
+from app.models.users import Note, User
+from app.utils import shards
+from app.utils.principal_cache import PRINCIPAL_CACHE_TTL
+
+PRIMARY = "primary"  # the notes table of the primary, in the output
+
+def open_notes_db(shard_name: str | None) -> Session:
+    return SessionLocal() if shard_name is None else shards.SHARDS.get(shard_name).session_factory()
+
+def _convert_sqlite_keys(shard_engine, batch_size: int) -> int:
+    # UUID and BINARY(16) have the same affinity: only the stored values change, from 32 hex characters to
+    # 16 bytes. A batch per transaction; the notes still in text form are the ones left (it can be run again).
+    converted = 0
+    after_rowid = 0
+    with shard_engine.connect() as connection:
+        while True:
+            rows = connection.execute(text("SELECT rowid, id, user_id FROM notes WHERE rowid > :after "
+                                           "AND typeof(id) = 'text' ORDER BY rowid LIMIT :limit"),
+                                      {"after": after_rowid, "limit": batch_size}).all()
+            if not rows:
+                return converted
+            connection.execute(text("UPDATE notes SET id = :id, user_id = :user_id WHERE rowid = :rowid"),
+                               [{"rowid": rowid, "id": UUID(note_id).bytes, "user_id": UUID(user_id).bytes}
+                                for rowid, note_id, user_id in rows])
+            connection.commit()
+            converted += len(rows)
+            after_rowid = rows[-1][0]
+
+def _convert_mariadb_keys(shard_engine) -> int:
+    # new columns filled from the text form of the old ones, then swapped in with one ALTER TABLE (one rebuild)
+    with shard_engine.begin() as connection:
+        data_type = connection.scalar(text("SELECT data_type FROM information_schema.columns WHERE table_schema = "
+                                           "DATABASE() AND table_name = 'notes' AND column_name = 'id'"))
+        if data_type == "binary":
+            return 0
+        connection.execute(text("ALTER TABLE notes ADD COLUMN id_new BINARY(16) NULL, "
+                                "ADD COLUMN user_id_new BINARY(16) NULL"))
+        converted = connection.execute(text("UPDATE notes SET id_new = UNHEX(REPLACE(CAST(id AS CHAR(36)), '-', '')), "
+                                            "user_id_new = UNHEX(REPLACE(CAST(user_id AS CHAR(36)), '-', ''))")).rowcount
+        connection.execute(text("ALTER TABLE notes DROP PRIMARY KEY, DROP INDEX ix_notes_id, DROP INDEX ix_notes_user_id_id, "
+                                "DROP COLUMN id, CHANGE COLUMN id_new id BINARY(16) NOT NULL FIRST, "
+                                "DROP COLUMN user_id, CHANGE COLUMN user_id_new user_id BINARY(16) NOT NULL AFTER content, "
+                                "ADD PRIMARY KEY (id), ADD INDEX ix_notes_id (id), ADD INDEX ix_notes_user_id_id (user_id, id)"))
+    return converted
+
+def convert_keys(shard_engine, batch_size: int = 1000) -> int:
+    """
+    Converts the notes table of a shard made before the 16-byte keys (UUID columns) to them, as migration 0008
+    does on the primary, which doesn't know the shards. Returns the number of notes converted: 0 when the shard
+    already has the new keys.
+    """
+    if shard_engine.dialect.name == "sqlite":
+        return _convert_sqlite_keys(shard_engine, batch_size)
+    return _convert_mariadb_keys(shard_engine)
+
+def plan(db: Session, batch_size: int = 1000):
+    """
+    Yields (user id, current shard, shard on the ring) of every user who isn't on their shard, by id (None: the
+    primary). The accounts being deleted stay where they are.
+    """
+    after_id = None
+    while True:
+        query = select(User.id, User.notes_shard).where(User.deleted_at.is_(None))
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        users = db.execute(query.order_by(User.id).limit(batch_size)).all()
+        for user_id, notes_shard in users:
+            target = shards.SHARDS.shard_for(user_id)
+            if target != notes_shard:
+                yield user_id, notes_shard, target
+        if len(users) < batch_size:
+            return
+        after_id = users[-1].id
+
+def _insert_ignoring_existing(db: Session, rows: list[dict]):
+    # a note already on the target (a move run again) is kept
+    if db.get_bind().dialect.name == "sqlite":
+        statement = sqlite.insert(Note).on_conflict_do_nothing()
+    else:
+        statement = mysql.insert(Note).prefix_with("IGNORE")
+    db.execute(statement, rows)
+
+def copy_notes(source_db: Session, target_db: Session, user_id: UUID, batch_size: int = 1000) -> int:
+    # keyset batches of the source, each committed on the target
+    copied = 0
+    after_id = None
+    while True:
+        query = select(Note.id, Note.content, Note.user_id).where(Note.user_id == user_id)
+        if after_id is not None:
+            query = query.where(Note.id > after_id)
+        rows = [row._asdict() for row in source_db.execute(query.order_by(Note.id).limit(batch_size))]
+        source_db.rollback()
+        if rows:
+            _insert_ignoring_existing(target_db, rows)
+            target_db.commit()
+            copied += len(rows)
+        if len(rows) < batch_size:
+            return copied
+        after_id = rows[-1]["id"]
+
+def _sync_notes(source_db: Session, target_db: Session, user_id: UUID, batch_size: int):
+    # the changes made on the source during the copy (notes are never modified, only added or deleted)
+    source_ids = set(source_db.scalars(select(Note.id).where(Note.user_id == user_id)))
+    target_ids = set(target_db.scalars(select(Note.id).where(Note.user_id == user_id)))
+    missing = list(source_ids - target_ids)
+    for start in range(0, len(missing), batch_size):
+        rows = source_db.execute(select(Note.id, Note.content, Note.user_id)
+                                 .where(Note.id.in_(missing[start:start + batch_size]))).all()
+        _insert_ignoring_existing(target_db, [row._asdict() for row in rows])
+    extra = list(target_ids - source_ids)
+    for start in range(0, len(extra), batch_size):
+        target_db.execute(delete(Note).where(Note.id.in_(extra[start:start + batch_size])),
+                          execution_options={"synchronize_session": False})
+    target_db.commit()
+
+def move_user(user_id: UUID, source: str | None, target: str | None, batch_size: int = 1000) -> bool:
+    """
+    Copies the notes of the user to the target and makes it their shard (steps 1 and 2). False if the user
+    isn't on the source any more (moved, deleted): nothing is switched.
+    """
+    with open_notes_db(source) as source_db, open_notes_db(target) as target_db:
+        copy_notes(source_db, target_db, user_id, batch_size)
+
+        with SessionLocal() as db:
+            # held until the switch is committed: no write of the user's notes in between (MariaDB; SQLite has
+            # a single writer)
+            user = db.execute(select(User.notes_shard, User.deleted_at)
+                              .where(User.id == user_id).with_for_update()).first()
+            if user is None or user.deleted_at is not None or user.notes_shard != source:
+                return False
+            _sync_notes(source_db, target_db, user_id, batch_size)
+            db.execute(update(User).where(User.id == user_id).values(notes_shard=target))
+            db.commit()
+    return True
+
+def delete_copy(user_id: UUID, shard_name: str | None, batch_size: int = 1000) -> int:
+    """
+    Deletes the notes of the user on a shard that isn't theirs (step 3), in batches.
+    """
+    with SessionLocal() as db:
+        user = db.execute(select(User.notes_shard).where(User.id == user_id)).first()
+    if user is not None and user.notes_shard == shard_name:
+        return 0
+    deleted = 0
+    with open_notes_db(shard_name) as notes_db:
+        while True:
+            count, _ = crud_users.delete_note_batch(notes_db, user_id, batch_size=batch_size)
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+def rebalance(batch_size: int = 1000, grace: float = PRINCIPAL_CACHE_TTL + 5, limit: int | None = None,
+              clock=time.monotonic, sleep=time.sleep, log=print) -> dict:
+    """
+    Moves every user to their shard on the ring, then deletes the old copies once `grace` seconds passed.
+    """
+    with SessionLocal() as db:
+        moves = list(plan(db))
+    if limit is not None:
+        moves = moves[:limit]
+
+    moved = skipped = 0
+    to_delete = deque()  # (switched at, user id, old shard)
+    for user_id, source, target in moves:
+        if move_user(user_id, source, target, batch_size):
+            moved += 1
+            to_delete.append((clock(), user_id, source))
+            log(f"moved {user_id}: {source or PRIMARY} -> {target or PRIMARY}")
+        else:
+            skipped += 1
+        while to_delete and clock() - to_delete[0][0] >= grace:
+            _, old_user_id, old_shard = to_delete.popleft()
+            delete_copy(old_user_id, old_shard, batch_size)
+
+    while to_delete:
+        switched_at, user_id, source = to_delete.popleft()
+        sleep(max(0.0, switched_at + grace - clock()))
+        delete_copy(user_id, source, batch_size)
+    return {"planned": len(moves), "moved": moved, "skipped": skipped}
+
+def cleanup(batch_size: int = 1000, log=print) -> int:
+    """
+    Deletes the notes every shard (and the primary) holds for users whose notes are elsewhere: the old copies of
+    a rebalance stopped before their cleanup, the partial copies of one stopped before its switch. Not to be run
+    within the grace period of a running rebalance.
+    """
+    deleted = 0
+    for shard_name in [None, *shards.SHARDS.shards]:
+        # keyset pages of the users with notes on the shard, their placements looked up a page at a time
+        after_id = None
+        while True:
+            query = select(Note.user_id).distinct()
+            if after_id is not None:
+                query = query.where(Note.user_id > after_id)
+            with open_notes_db(shard_name) as notes_db:
+                user_ids = list(notes_db.scalars(query.order_by(Note.user_id).limit(batch_size)))
+            if not user_ids:
+                break
+            with SessionLocal() as db:
+                placements = dict(db.execute(select(User.id, User.notes_shard).where(User.id.in_(user_ids))).all())
+            for user_id in user_ids:
+                if user_id not in placements or placements[user_id] != shard_name:
+                    count = delete_copy(user_id, shard_name, batch_size)
+                    deleted += count
+                    log(f"deleted {count} notes of {user_id} on {shard_name or PRIMARY}")
+            if len(user_ids) < batch_size:
+                break
+            after_id = user_ids[-1]
+    return deleted
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Moves the notes of the users between the shards, online")
+    parser.add_argument("command", choices=["init", "plan", "rebalance", "cleanup"])
+    parser.add_argument("--batch-size", type=int, default=1000, help="notes copied or deleted per transaction")
+    parser.add_argument("--grace", type=float, default=PRINCIPAL_CACHE_TTL + 5,
+                        help="seconds between the switch of a user and the deletion of their old copy")
+    parser.add_argument("--limit", type=int, help="move at most this many users")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        shards.SHARDS.create_schemas()
+        for shard_name, shard in shards.SHARDS.shards.items():
+            print(f"{shard_name}: notes table ready, {convert_keys(shard.engine, args.batch_size)} notes converted "
+                  "to 16-byte keys")
+        if not shards.SHARDS.shards:
+            print("no shard")
+    elif args.command == "plan":
+        counts = {}
+        with SessionLocal() as db:
+            for _, source, target in plan(db):
+                counts[(source, target)] = counts.get((source, target), 0) + 1
+        for (source, target), count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"{source or PRIMARY:>20} -> {target or PRIMARY:<20}{count:>10} users")
+        print(f"{sum(counts.values())} users to move")
+    elif args.command == "rebalance":
+        summary = rebalance(args.batch_size, args.grace, args.limit)
+        print(f"{summary['moved']} users moved, {summary['skipped']} skipped (moved or deleted meanwhile)")
+    else:
+        print(f"{cleanup(args.batch_size)} notes deleted")
+
+if __name__ == "__main__":
+    main()
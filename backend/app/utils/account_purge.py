@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from uuid import UUID
+
+from app.crud import users_async as crud_users
+from app.database import open_db
+from app.utils import shards
+
+logger = logging.getLogger(__name__)
+
+# DELETE /me deletes an account with at most this many notes at once (one DELETE, the notes go by ON DELETE
+# CASCADE); a larger one is marked deleted and its notes are purged in the background
+ACCOUNT_PURGE_THRESHOLD = int(os.getenv("ACCOUNT_PURGE_THRESHOLD", "1000"))
+# the notes deleted per transaction by a purge, and the pause before each batch (seconds)
+ACCOUNT_PURGE_BATCH_SIZE = int(os.getenv("ACCOUNT_PURGE_BATCH_SIZE", "1000"))
+ACCOUNT_PURGE_PAUSE = float(os.getenv("ACCOUNT_PURGE_PAUSE", "0"))
+# the finished purges kept for the progress report
+ACCOUNT_PURGE_HISTORY = 100
+
+class AccountPurge:
+    def __init__(self, user_id: UUID, total: int):
+        self.user_id = user_id
+        self.total = total
+        self.deleted = 0
+        self.status = "running"  # then "done", or "failed" (resumed at the next start)
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: datetime | None = None
+
+    def snapshot(self) -> dict:
+        return {"total": self.total, "deleted": self.deleted, "status": self.status,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+
+class AccountPurger:
+    """
+    Deletes the notes of the accounts marked deleted, batch_size at a time in short transactions (no long lock,
+    no request thread held, the memory doesn't depend on the account), then the user row.
+
+    The purges are tasks of the worker that accepted the deletion. One interrupted by a shutdown or a crash
+    leaves the user marked deleted: every worker resumes those at start (two workers purging the same account
+    only repeat some SELECTs, a note is deleted once).
+    """
+
+    def __init__(self, batch_size: int = ACCOUNT_PURGE_BATCH_SIZE, pause: float = ACCOUNT_PURGE_PAUSE):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.purges: dict[UUID, AccountPurge] = {}
+        self._tasks: dict[UUID, asyncio.Task] = {}
+
+    def start(self, user_id: UUID, total: int) -> AccountPurge:
+        """
+        Starts purging the account (already marked deleted) unless it is being purged.
+        """
+        if user_id in self._tasks:
+            return self.purges[user_id]
+        purge = AccountPurge(user_id, total)
+        self.purges[user_id] = purge
+        self._tasks[user_id] = asyncio.create_task(self._purge(purge))
+        self._forget_finished()
+        return purge
+
+    async def _purge(self, purge: AccountPurge):
+        logger.info("Purging the %d notes of the deleted account %s", purge.total, purge.user_id)
+        try:
+            await asyncio.sleep(self.pause)
+            # where the notes are can't change any more: the resharding tool doesn't move a deleted account
+            async with open_db() as db:
+                notes_shard = await crud_users.get_notes_shard(db, purge.user_id)
+            after_id = None
+            while True:
+                async with shards.SHARDS.open_notes_db(notes_shard) as notes_db:
+                    deleted, after_id = await crud_users.delete_note_batch(notes_db, purge.user_id, after_id=after_id,
+                                                                           batch_size=self.batch_size)
+                purge.deleted += deleted
+                if deleted < self.batch_size:
+                    break
+                logger.debug("Account %s: %d of %d notes purged", purge.user_id, purge.deleted, purge.total)
+                await asyncio.sleep(self.pause)
+            # the notes added since the count, if any, go with the user
+            async with open_db() as db, shards.SHARDS.open_notes_db(notes_shard, primary=db) as notes_db:
+                await crud_users.delete_user(db, purge.user_id, notes_db)
+        except Exception:
+            purge.status = "failed"
+            logger.exception("Failed to purge the deleted account %s (%d of %d notes purged)",
+                             purge.user_id, purge.deleted, purge.total)
+        else:
+            purge.status = "done"
+            logger.info("Purged the deleted account %s (%d notes)", purge.user_id, purge.deleted)
+        finally:
+            purge.finished_at = datetime.now(timezone.utc)
+            self._tasks.pop(purge.user_id, None)
+
+    def _forget_finished(self):
+        finished = [user_id for user_id, purge in self.purges.items() if purge.status != "running"]
+        for user_id in finished[:max(0, len(finished) - ACCOUNT_PURGE_HISTORY)]:
+            del self.purges[user_id]
+
+    async def resume(self):
+        """
+        Restarts the purges left unfinished (at startup).
+        """
+        async with open_db() as db:
+            users = await crud_users.get_users_being_deleted(db)
+        for user_id, notes_shard in users:
+            async with shards.SHARDS.open_notes_db(notes_shard) as notes_db:
+                total = await crud_users.count_notes_by_user(notes_db, user_id)
+            self.start(user_id, total)
+
+    async def stop(self):
+        # the unfinished purges are resumed at the next start
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {str(user_id): purge.snapshot() for user_id, purge in self.purges.items()}
+
+ACCOUNT_PURGES = AccountPurger()
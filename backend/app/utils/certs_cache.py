@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+
+import httpx
+
+DEFAULT_MAX_AGE = 300
+
+class CertsCache:
+    """
+    Shared cache of an issuer's signing certificates (the `{"key id": "x509 certificate"}` document).
+
+    - The certificates are kept for the max-age of the Cache-Control header of the response.
+    - In the last `refresh_ahead` seconds of that lifetime a request still gets the cached copy and a
+      background thread fetches the new one, so the logins never wait for the fetch.
+    - If a fetch fails, the expired copy is still served for up to `max_stale` seconds (short outages).
+    - A token signed with a key id that is not in the cached copy (keys rotated early) triggers a
+      refetch, at most once every `min_refetch_interval` seconds.
+    """
+
+    def __init__(self, url: str, client: httpx.Client, refresh_ahead: float = 60, max_stale: float = 3600,
+                 min_refetch_interval: float = 30, clock=time.monotonic):
+        self.url = url
+        self.client = client
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.min_refetch_interval = min_refetch_interval
+        self.clock = clock
+
+        self._certs: dict[str, str] | None = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+        self.stale_served = 0
+
+    def get(self, kid: str | None = None) -> dict[str, str]:
+        """
+        Returns the certificates, fetching them only when needed. Raises ValueError when there is
+        no usable copy and they can't be fetched.
+        """
+        now = self.clock()
+        certs = self._certs
+        fresh = certs is not None and now < self._expires_at
+
+        if fresh and (kid is None or kid in certs):
+            self.hits += 1
+            if now >= self._expires_at - self.refresh_ahead:
+                self._refresh_in_background()
+            return certs
+
+        if fresh and now - self._fetched_at < self.min_refetch_interval:
+            # unknown key id, but the certificates were just fetched: the token is not from this issuer
+            return certs
+
+        try:
+            return self._refresh()
+        except (httpx.HTTPError, ValueError) as e:
+            self.failures += 1
+            if certs is not None and now < self._expires_at + self.max_stale:
+                self.stale_served += 1
+                return certs
+            raise ValueError(f"Could not fetch the signing certificates: {e}")
+
+    def is_fresh(self, kid: str | None = None) -> bool:
+        """
+        True if get() would answer from the cache, without any IO.
+        """
+        certs = self._certs
+        return certs is not None and self.clock() < self._expires_at and (kid is None or kid in certs)
+
+    def _refresh(self) -> dict[str, str]:
+        fetched_at = self._fetched_at
+        with self._fetch_lock:
+            # another thread fetched them while this one was waiting for the lock
+            if self._fetched_at != fetched_at and self.clock() < self._expires_at:
+                return self._certs
+
+            response = self.client.get(self.url)
+            response.raise_for_status()
+            certs = response.json()
+            if not isinstance(certs, dict):
+                raise ValueError("Unexpected certificates document")
+
+            now = self.clock()
+            self.fetches += 1
+            self._certs = certs
+            self._fetched_at = now
+            self._expires_at = now + _max_age(response.headers)
+            return certs
+
+    def _refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def refresh():
+            try:
+                self._refresh()
+            except (httpx.HTTPError, ValueError):
+                self.failures += 1
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "stale_served": self.stale_served,
+            "expires_in": round(max(0.0, self._expires_at - self.clock()), 3) if self._certs is not None else 0.0,
+        }
+
+def _max_age(headers: httpx.Headers) -> float:
+    match = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+    max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+    # the Age header is the time the response already spent in a shared cache
+    age = headers.get("age", "0")
+    return max(0, max_age - (int(age) if age.isdigit() else 0))
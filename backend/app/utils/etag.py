@@ -0,0 +1,21 @@
+from uuid import UUID
+
+# the browser revalidates on every use (If-None-Match) and doesn't share the response with other users
+CACHE_CONTROL = "private, no-cache"
+
+def user_etag(user_id: UUID, version: int) -> str:
+    """
+    Strong ETag of a representation that only changes with the user's version. The user id is part of it:
+    the URLs are the same for every user, a version number alone could match another user's cached copy.
+    """
+    return f'"{user_id.hex}-{version}"'
+
+def if_none_match(header: str | None, etag: str) -> bool:
+    """
+    True if the If-None-Match header matches the ETag (weak comparison, as required for If-None-Match).
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
@@ -0,0 +1,145 @@
+import asyncio
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+
+class FakeOIDCIssuer:
+    """
+    Local stand-in for Google's OpenID Connect endpoints, so the login path can be tested and benchmarked offline.
+
+    It signs ID tokens like Google does, serves its certificates (`{"key id": "x509 certificate"}`, with a
+    Cache-Control max-age) and has a token endpoint that exchanges the codes made by `authorize`. Everything
+    goes through `transport`, an httpx transport (sync and async) to give to the HTTP clients instead of the
+    network. Every request waits `latency` seconds, the requests are counted and an outage can be simulated.
+    """
+
+    ISSUER = "https://accounts.google.com"
+    AUTH_URL = "https://fake-oidc.local/o/oauth2/auth"
+    TOKEN_URL = "https://fake-oidc.local/token"
+    CERTS_URL = "https://fake-oidc.local/oauth2/v1/certs"
+
+    def __init__(self, max_age: int = 3600, latency: float = 0.0):
+        self.max_age = max_age
+        self.latency = latency
+        self.available = True
+        self.certs_requests = 0
+        self.token_requests = 0
+        self._keys: dict[str, tuple[bytes, str]] = {}
+        self._codes: dict[str, tuple[str, str]] = {}
+        self.current_kid = self.rotate_key()
+        self.transport = _FakeOIDCTransport(self)
+
+    def client_config(self, client_id: str = "fake-client-id", client_secret: str = "fake-client-secret",
+                      redirect_uri: str = "http://localhost:8000/users/auth/google/callback") -> dict:
+        """
+        The client config (Google client secrets format) of a client of this issuer.
+        """
+        return {'web': {
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'auth_uri': self.AUTH_URL,
+            'token_uri': self.TOKEN_URL,
+            'redirect_uris': [redirect_uri],
+        }}
+
+    def authorize(self, email: str, name: str) -> str:
+        """
+        Simulates the user consenting on the authorization page: returns the code the callback would get.
+        """
+        code = secrets.token_urlsafe(16)
+        self._codes[code] = (email, name)
+        return code
+
+    def rotate_key(self) -> str:
+        """
+        Starts signing with a new key. The previous keys are still published (like Google does during a rotation).
+        """
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-oidc.local")])
+        now = datetime.now(timezone.utc)
+        certificate = (x509.CertificateBuilder()
+                       .subject_name(name)
+                       .issuer_name(name)
+                       .public_key(key.public_key())
+                       .serial_number(x509.random_serial_number())
+                       .not_valid_before(now - timedelta(days=1))
+                       .not_valid_after(now + timedelta(days=30))
+                       .sign(key, hashes.SHA256()))
+
+        kid = uuid.uuid4().hex
+        private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                        serialization.NoEncryption())
+        self._keys[kid] = (private_pem, certificate.public_bytes(serialization.Encoding.PEM).decode())
+        self.current_kid = kid
+        return kid
+
+    def issue_id_token(self, audience: str, email: str, name: str, expires_in: int = 3600) -> str:
+        private_pem, _ = self._keys[self.current_kid]
+        signer = crypt.RSASigner.from_string(private_pem, key_id=self.current_kid)
+        now = int(time.time())
+        payload = {
+            "iss": self.ISSUER,
+            "aud": audience,
+            "sub": uuid.uuid5(uuid.NAMESPACE_URL, email).hex,
+            "email": email,
+            "email_verified": True,
+            "name": name,
+            "iat": now,
+            "exp": now + expires_in,
+        }
+        return google_jwt.encode(signer, payload).decode()
+
+    def certs(self) -> dict[str, str]:
+        return {kid: certificate for kid, (_, certificate) in self._keys.items()}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if not self.available:
+            return httpx.Response(503)
+
+        if request.url.path == "/oauth2/v1/certs":
+            self.certs_requests += 1
+            return httpx.Response(200, json=self.certs(),
+                                  headers={"Cache-Control": f"public, max-age={self.max_age}, must-revalidate"})
+
+        if request.url.path == "/token" and request.method == "POST":
+            self.token_requests += 1
+            form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+            user = self._codes.pop(form.get("code"), None)
+            if form.get("grant_type") != "authorization_code" or user is None:
+                return httpx.Response(400, json={"error": "invalid_grant"})
+            email, name = user
+            return httpx.Response(200, json={
+                "access_token": secrets.token_urlsafe(32),
+                "expires_in": 3599,
+                "token_type": "Bearer",
+                "scope": "openid email profile",
+                "id_token": self.issue_id_token(form.get("client_id"), email, name),
+            })
+
+        return httpx.Response(404)
+
+class _FakeOIDCTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, issuer: FakeOIDCIssuer):
+        self.issuer = issuer
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.issuer.latency:
+            time.sleep(self.issuer.latency)
+        return self.issuer.handle(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.issuer.latency:
+            await asyncio.sleep(self.issuer.latency)
+        return self.issuer.handle(request)
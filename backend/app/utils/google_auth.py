@@ -1,14 +1,25 @@
 import os
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from google_auth_oauthlib.flow import Flow
-from fastapi import HTTPException
+import secrets
+import httpx
+import jwt
+from urllib.parse import urlencode
+from google.auth import jwt as google_jwt
+from starlette.concurrency import run_in_threadpool
+from typing import Tuple
+
+from app.utils.certs_cache import CertsCache
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_PROJECT_ID = os.getenv("GOOGLE_PROJECT_ID")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
 
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+
+# Google's signing certificates, shared by all the logins of the worker (see CertsCache)
+CERTS_CACHE = CertsCache(GOOGLE_CERTS_URL, client=httpx.Client(timeout=10))
+
 SCOPES = [
     "https://www.googleapis.com/auth/userinfo.email",
     "https://www.googleapis.com/auth/userinfo.profile",
@@ -20,35 +31,101 @@ CLIENT_CONFIG = {'web': {
     'project_id': GOOGLE_PROJECT_ID,
     'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
     'token_uri': 'https://oauth2.googleapis.com/token',
-    'auth_provider_x509_cert_url': 'https://www.googleapis.com/oauth2/v1/certs',
+    'auth_provider_x509_cert_url': GOOGLE_CERTS_URL,
     'client_secret': GOOGLE_CLIENT_SECRET,
     'redirect_uris': [GOOGLE_REDIRECT_URI],
 }}
 
-def get_authorization_url():
-    flow = Flow.from_client_config(
-        client_config=CLIENT_CONFIG,
-        scopes=SCOPES,
-        redirect_uri=GOOGLE_REDIRECT_URI
-    )
-    authorization_url, state = flow.authorization_url(prompt='consent')
-    return authorization_url, state
-
-def exchange_authorization_code(code: str):
-    flow = Flow.from_client_config(
-        client_config=CLIENT_CONFIG,
-        scopes=SCOPES,
-        redirect_uri=GOOGLE_REDIRECT_URI
-    )
-    flow.fetch_token(code=code)
-    credentials = flow.credentials
-    request = requests.Request()
-    
-    try:
-        id_info = id_token.verify_oauth2_token(
-            credentials.id_token, request, GOOGLE_CLIENT_ID, clock_skew_in_seconds=10
+class GoogleAuth:
+    """
+    The Google OAuth2 / OpenID Connect provider.
+
+    The client config is read once, and the code exchanges go through one pooled httpx.AsyncClient
+    (kept-alive TCP/TLS connections to the token endpoint), without holding a thread while waiting for Google.
+    """
+
+    def __init__(self, client_config: dict = CLIENT_CONFIG, scopes: list[str] = SCOPES,
+                 http_client: httpx.AsyncClient | None = None, certs_cache: CertsCache = CERTS_CACHE):
+        web_config = client_config['web']
+        self.client_id = web_config['client_id']
+        self.client_secret = web_config['client_secret']
+        self.auth_uri = web_config['auth_uri']
+        self.token_uri = web_config['token_uri']
+        self.redirect_uri = web_config['redirect_uris'][0]
+        self.scope = " ".join(scopes)
+        self.http_client = http_client or httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
         )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"Token verification failed: {e}")
-    
+        self.certs_cache = certs_cache
+
+    def get_authorization_url(self) -> Tuple[str, str]:
+        state = secrets.token_urlsafe(24)
+        params = {
+            'response_type': 'code',
+            'client_id': self.client_id,
+            'redirect_uri': self.redirect_uri,
+            'scope': self.scope,
+            'state': state,
+            'access_type': 'offline',
+            'prompt': 'consent',
+        }
+        return f"{self.auth_uri}?{urlencode(params)}", state
+
+    async def exchange_authorization_code(self, code: str) -> dict:
+        """
+        Exchanges the authorization code at the token endpoint and returns the verified ID token claims.
+        Raises ValueError if the exchange or the verification fails.
+        """
+        try:
+            response = await self.http_client.post(self.token_uri, data={
+                'grant_type': 'authorization_code',
+                'code': code,
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'redirect_uri': self.redirect_uri,
+            })
+        except httpx.HTTPError as e:
+            raise ValueError(f"Token endpoint unreachable: {e}")
+
+        if response.status_code != 200:
+            raise ValueError(f"Token exchange failed with status {response.status_code}")
+
+        token = response.json().get('id_token')
+        if not token:
+            raise ValueError("The token response has no ID token")
+
+        return await verify_id_token_async(token, audience=self.client_id, certs_cache=self.certs_cache)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+def verify_id_token(token: str, audience: str | None = GOOGLE_CLIENT_ID, certs_cache: CertsCache = CERTS_CACHE) -> dict:
+    """
+    Verifies a Google ID token against the cached signing certificates (what id_token.verify_oauth2_token
+    does, without fetching the certificates on every call).
+    """
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except jwt.PyJWTError as e:
+        raise ValueError(f"Malformed ID token: {e}")
+
+    certs = certs_cache.get(kid)
+    id_info = google_jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=10)
+
+    if id_info.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+
     return id_info
+
+async def verify_id_token_async(token: str, audience: str | None = GOOGLE_CLIENT_ID, certs_cache: CertsCache = CERTS_CACHE) -> dict:
+    # with the certificates in the cache the verification is pure CPU and runs on the event loop,
+    # only a certificates fetch is sent to the thread pool
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except jwt.PyJWTError as e:
+        raise ValueError(f"Malformed ID token: {e}")
+
+    if certs_cache.is_fresh(kid):
+        return verify_id_token(token, audience=audience, certs_cache=certs_cache)
+    return await run_in_threadpool(verify_id_token, token, audience, certs_cache)
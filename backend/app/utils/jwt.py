@@ -8,10 +8,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import users as schema_users
-from app.crud import users as users_crud
+from app.crud import users_async as users_crud
 from app.database import get_db
+from app.utils import principal_cache, signing_keys, token_cache
 
 CREDENTIALS_EXCEPTION = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,52 +26,109 @@ JWT_SIGN_ALGORITHM =  os.environ.get('JWT_SIGN_ALGORITHM','HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = 120
 REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30
 
+# the key that signs the tokens and the ones that verify them, by kid (see app.utils.signing_keys)
+SIGNING_KEYS = signing_keys.load_key_ring(JWT_SIGN_ALGORITHM, API_SECRET_KEY)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
-def create_access_token(data: str, expires_delta: timedelta = None):
-    to_encode = {"sub" : data}
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+def create_access_token(data: str, expires_delta: timedelta = None, token_type: str = ACCESS_TOKEN_TYPE):
+    to_encode = {"sub" : data, "type": token_type}
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({'exp': expire})
-    encoded_jwt = jwt.encode(to_encode, API_SECRET_KEY, algorithm=JWT_SIGN_ALGORITHM)
+    if token_type == REFRESH_TOKEN_TYPE:
+        # the id the rotation revokes (see POST /users/token/refresh)
+        to_encode["jti"] = str(uuid.uuid4())
+    key = SIGNING_KEYS.signing_key
+    headers = {"kid": key.kid} if key.kid else None
+    encoded_jwt = jwt.encode(to_encode, key.private_key, algorithm=key.algorithm, headers=headers)
     return encoded_jwt
 
 def create_refresh_token(data: str):
     expires = timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
-    return create_access_token(data=data, expires_delta=expires)
+    return create_access_token(data=data, expires_delta=expires, token_type=REFRESH_TOKEN_TYPE)
 
-def decode_token(token):
+def _verify(token):
     options = {
         'verify_exp': True,  # Verify expiration
         'verify_iss': True,  # Verify issuer
     }
-    return jwt.decode(token, API_SECRET_KEY, algorithms=[JWT_SIGN_ALGORITHM], options=options)
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is not None and not isinstance(kid, str):
+        raise jwt.InvalidTokenError('Malformed kid')
+    key = SIGNING_KEYS.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError('Unknown signing key')
+    # the algorithm is the key's, never the one named by the token
+    return jwt.decode(token, key.public_key, algorithms=[key.algorithm], options=options)
 
+def decode_token(token):
+    # Repeated tokens are answered from the verified-claims cache (the returned claims must not be modified)
+    claims = token_cache.get_claims(token)
+    if claims is not None:
+        return claims
+
+    claims = _verify(token)
+    token_cache.set_claims(token, claims)
+    return claims
 
-def get_user_from_token(db: Session = Depends(get_db), 
+def decode_refresh_token(token) -> tuple[uuid.UUID, uuid.UUID, datetime]:
+    """
+    Verifies a refresh token (not cached: each one is used once) and returns its user id, jti and expiration.
+    Raises a jwt.PyJWTError if it isn't a valid refresh token.
+    """
+    claims = _verify(token)
+    if claims.get('type') != REFRESH_TOKEN_TYPE:
+        raise jwt.InvalidTokenError('Not a refresh token')
+    try:
+        return (uuid.UUID(claims['sub']), uuid.UUID(claims['jti']),
+                datetime.fromtimestamp(claims['exp'], timezone.utc))
+    except (KeyError, TypeError, ValueError):
+        raise jwt.InvalidTokenError('Malformed refresh token')
+
+def principal_from_user(user_db) -> schema_users.Principal:
+    return schema_users.Principal(id=user_db.id,
+                                  name=user_db.name,
+                                  email=user_db.email,
+                                  created_date=user_db.created_date,
+                                  last_login_date=user_db.last_login_date,
+                                  notes_shard=user_db.notes_shard,
+                                  version=user_db.version)
+
+async def get_user_from_token(db: Session | AsyncSession = Depends(get_db), 
                      token: str = Depends(oauth2_scheme)
-                    )-> schema_users.User:
+                    )-> schema_users.Principal:
     try:
         payload = decode_token(token)
         user_id: str = payload.get('sub')
-        if user_id is None:
+        # a refresh token only buys new tokens (the tokens from before the type claim are access tokens)
+        if user_id is None or payload.get('type') == REFRESH_TOKEN_TYPE:
             raise CREDENTIALS_EXCEPTION
     except jwt.PyJWTError:
         raise CREDENTIALS_EXCEPTION
 	
-    user_db = users_crud.get_user_by_id(db, uuid.UUID(user_id))
-    if not user_db:
-        raise CREDENTIALS_EXCEPTION
+    return await get_principal(db, uuid.UUID(user_id))
+
+async def get_principal(db: Session | AsyncSession, user_id: uuid.UUID) -> schema_users.Principal:
+    """
+    The user a token was issued to, from the principal cache or the database.
+    Raises CREDENTIALS_EXCEPTION if the user doesn't exist anymore.
+    """
+    # The notes are not part of the principal, the routes that need them load them explicitly
+    user = principal_cache.get_principal(user_id)
+    if user is None:
+        user_db = await users_crud.get_user_by_id(db, user_id)
+        # an account being purged (see app.utils.account_purge) is already deleted for the API
+        if not user_db or user_db.deleted_at is not None:
+            raise CREDENTIALS_EXCEPTION
 
-    user_db_notes = [schema_users.Note(id=note.id, content=note.content) for note in user_db.notes]
+        user = principal_from_user(user_db)
+        principal_cache.set_principal(user)
 
-    user = schema_users.User(id=user_db.id,
-                             name=user_db.name,
-                             email=user_db.email,
-                             created_date=user_db.created_date,
-                             last_login_date=user_db.last_login_date,
-                             notes=user_db_notes)
     return user
     
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from uuid import UUID
+
+from app.crud import users_async as crud_users
+from app.database import open_db
+
+logger = logging.getLogger(__name__)
+
+# "true": the login callback only records the last login date in memory, a background task writes the
+# buffered dates in bulk UPDATEs at least every LAST_LOGIN_MAX_STALENESS seconds (and at shutdown)
+LAST_LOGIN_WRITE_BEHIND = os.getenv("LAST_LOGIN_WRITE_BEHIND", "false").lower() == "true"
+LAST_LOGIN_MAX_STALENESS = float(os.getenv("LAST_LOGIN_MAX_STALENESS", "5"))
+# users with a buffered login; when it is full the next flush starts at once and the login writes directly
+LAST_LOGIN_BUFFER_SIZE = int(os.getenv("LAST_LOGIN_BUFFER_SIZE", "10000"))
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer of the users' last login dates (one entry per user, the latest login wins).
+
+    Only used from the event loop, so there is no lock. Every worker process has its own buffer: a crash loses
+    at most LAST_LOGIN_MAX_STALENESS seconds of last login dates, which is what the mode trades for logins
+    without a write.
+    """
+
+    def __init__(self, max_size: int = LAST_LOGIN_BUFFER_SIZE, max_staleness: float = LAST_LOGIN_MAX_STALENESS):
+        self.max_size = max_size
+        self.max_staleness = max_staleness
+        self._pending: dict[UUID, datetime] = {}
+        self._full: asyncio.Event | None = None  # made by start(), on the loop of the flushes
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.flushed = 0
+        self.overflows = 0
+        self.dropped = 0
+
+    def record(self, user_id: UUID, login_date: datetime) -> bool:
+        """
+        Buffers a login. False if the buffer is full: the caller writes the date itself.
+        """
+        if user_id not in self._pending and len(self._pending) >= self.max_size:
+            self.overflows += 1
+            self._wake_up()
+            return False
+        self._pending[user_id] = login_date
+        if len(self._pending) >= self.max_size:
+            self._wake_up()
+        return True
+
+    def _wake_up(self):
+        if self._full is not None:
+            self._full.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if self._full is not None:
+            self._full.clear()
+        if not pending:
+            return
+        try:
+            async with open_db() as db:
+                await crud_users.update_last_login_dates(db, pending)
+        except BaseException as e:
+            # kept for the next flush (the logins recorded in the meantime are newer), up to max_size: while the
+            # database is down the oldest dates are dropped (they are best-effort) rather than the buffer growing
+            pending.update(self._pending)
+            dropped = len(pending) - self.max_size
+            if dropped > 0:
+                pending = dict(sorted(pending.items(), key=lambda item: item[1])[dropped:])
+                self.dropped += dropped
+            self._pending = pending
+            if not isinstance(e, Exception):  # cancelled
+                raise
+            logger.exception("Failed to write %d last login dates (%d older ones dropped)", len(pending), max(dropped, 0))
+            return
+        self.flushes += 1
+        self.flushed += len(pending)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.max_staleness)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the background flushes and writes what is left (at shutdown).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._full = None
+        await self.flush()
+
+LAST_LOGINS = LastLoginBuffer()
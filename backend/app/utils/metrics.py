@@ -0,0 +1,127 @@
+import bisect
+import time
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# route label of the requests that matched no route (404), so unknown paths don't make new series
+UNMATCHED_ROUTE = "<unmatched>"
+# method label of the requests with a non-standard method, for the same reason
+KNOWN_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+OTHER_METHOD = "other"
+
+class _RouteStats:
+    __slots__ = ("statuses", "buckets", "sum", "count")
+
+    def __init__(self):
+        self.statuses: dict[int, int] = {}  # by status class (2 for 2xx...)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # per bucket (not cumulative), the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+class Metrics:
+    """
+    Request metrics of the worker, in the Prometheus text format.
+
+    Only touched from the event loop (the middleware and the /metrics route), so there is no lock. With several
+    workers every process has its own counters: Prometheus scrapes and sums them per instance.
+    """
+
+    def __init__(self):
+        self.routes: dict[tuple[str, str], _RouteStats] = {}
+        self.in_progress: dict[str, int] = {}
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = _RouteStats()
+        status_class = status_code // 100
+        stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+        stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats.sum += seconds
+        stats.count += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests by method, route template and status class.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route), stats in sorted(self.routes.items()):
+            for status_class, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status_class}xx"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by method and route template.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), stats in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.sum}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        lines += [
+            "# HELP http_requests_in_progress Requests being handled, by method.",
+            "# TYPE http_requests_in_progress gauge",
+        ]
+        for method, count in sorted(self.in_progress.items()):
+            lines.append(f'http_requests_in_progress{{method="{method}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        self.routes.clear()
+        self.in_progress.clear()
+
+METRICS = Metrics()
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request in METRICS.
+
+    A plain ASGI middleware (not BaseHTTPMiddleware, which runs the app in another task and copies the response):
+    per request it only wraps `send` to see the status, and reads the route template that FastAPI leaves in the
+    scope once the request is routed.
+    """
+
+    def __init__(self, app, metrics: Metrics = METRICS):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in KNOWN_METHODS else OTHER_METHOD
+        status_code = 500  # if the app raises before starting the response
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = self.metrics.in_progress
+        in_progress[method] = in_progress.get(method, 0) + 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress[method] -= 1
+            self.metrics.observe(method, _route_template(scope), status_code, elapsed)
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # plain Starlette routes (/docs, /openapi.json) don't set "route": their path is the template if it has no parameters
+    if scope.get("endpoint") is not None and not scope.get("path_params"):
+        return scope["path"]
+    return UNMATCHED_ROUTE
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
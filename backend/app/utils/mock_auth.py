@@ -1,9 +1,15 @@
 from fastapi import HTTPException
+import os
 import uuid
 from typing import Tuple
 
+# the "test-code-<suffix>" codes, which log in as (or create) any number of test users: the TEST stage only,
+# unless a server is started with MOCK_AUTH_SUFFIXED_CODES=true to be measured by the load benchmark (--base-url)
+MOCK_AUTH_SUFFIXED_CODES = os.getenv("MOCK_AUTH_SUFFIXED_CODES", "false").lower() == "true" or os.getenv("STAGE") == "TEST"
+
 class MockAuth:
-    def __init__(self):
+    def __init__(self, suffixed_codes: bool = MOCK_AUTH_SUFFIXED_CODES):
+        self.suffixed_codes = suffixed_codes
         # Simulate some stored "user information" for testing purposes
         self.fake_user_data = {
             "email": f"testuser{str(uuid.uuid4())}@example.com",
@@ -23,19 +29,30 @@ class MockAuth:
         state = str(uuid.uuid4())  # Generate a unique state token
         return authorization_url, state
 
-    def exchange_authorization_code(self, code: str) -> dict:
+    async def exchange_authorization_code(self, code: str) -> dict:
         """
         Simulates exchanging an authorization code for user information.
 
         Parameters:
-            :param code: A mock authorization code.
+            :param code: A mock authorization code: "test-code", or "test-code-<suffix>" to log in
+                         as a distinct test user per suffix (the simulated users of the load benchmark,
+                         only with MOCK_AUTH_SUFFIXED_CODES).
 
         Returns:
             :return: A dictionary with user information.
         """
-        if code != "test-code":  # For testing, we expect a specific "test-code"
+        if code == "test-code":  # For testing, we expect a specific "test-code"
+            # Return the fake user data as if it was fetched from the provider
+            return self.fake_user_data
+
+        suffix = code.removeprefix("test-code-")
+        if not self.suffixed_codes or suffix == code or not suffix:
             raise ValueError("Invalid authorization code")
 
-        # Return the fake user data as if it was fetched from the provider
-        return self.fake_user_data
+        return {
+            "email": f"testuser-{suffix}@example.com",
+            "name": f"Test User {suffix}",
+        }
 
+    async def aclose(self):
+        pass
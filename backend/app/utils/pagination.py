@@ -0,0 +1,21 @@
+import base64
+import uuid
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(last_id: uuid.UUID) -> str:
+    """
+    Builds the opaque cursor of the page that starts after the row with the given id.
+    """
+    return base64.urlsafe_b64encode(last_id.bytes).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    """
+    Returns the id encoded in a cursor made by encode_cursor. Raises ValueError for anything else.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return uuid.UUID(bytes=raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
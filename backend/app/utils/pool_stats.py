@@ -0,0 +1,121 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool, StaticPool
+
+# Every instrumented pool, by name (the /internal/pool endpoint reports all of them)
+POOL_STATS: dict[str, "PoolStats"] = {}
+
+class PoolStats:
+    """
+    Live counters of a connection pool, kept up to date from the pool events.
+
+    The wait time is the time spent in Pool.connect(), i.e. queueing for a free connection
+    (plus opening it / pre-pinging it when needed), measured by the Instrumented*Pool classes.
+    """
+
+    def __init__(self, name: str, pool_size: int | None):
+        self.name = name
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def attach(self, pool: Pool):
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "close", self._on_close)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        pool.stats = self
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.opened += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.opened -= 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            overflow = max(0, self.opened - self.pool_size) if self.pool_size is not None else 0
+            return {
+                "pool_size": self.pool_size,
+                "opened": self.opened,
+                "checked_out": self.checked_out,
+                "idle": max(0, self.opened - self.checked_out),
+                "overflow": overflow,
+                "checkouts": self.checkouts,
+                "invalidated": self.invalidated,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.waits, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+class _TimedCheckoutMixin:
+    stats: PoolStats | None = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            if self.stats:
+                self.stats.record_timeout()
+            raise
+        finally:
+            if self.stats:
+                self.stats.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps the pool; the events are carried over by SQLAlchemy, the stats are not
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+class InstrumentedStaticPool(_TimedCheckoutMixin, StaticPool):
+    pass
+
+def instrument_pool(name: str, pool: Pool) -> PoolStats:
+    stats = PoolStats(name, pool.size() if isinstance(pool, QueuePool) else None)
+    stats.attach(pool)
+    POOL_STATS[name] = stats
+    return stats
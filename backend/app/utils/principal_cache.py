@@ -0,0 +1,40 @@
+import os
+import threading
+from uuid import UUID
+
+from cachetools import TTLCache
+
+from app.schemas import users as schema_users
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+# LRU + TTL cache of the authenticated users (without their notes), by user id.
+# It lives in the worker process: a write invalidates it only in the worker that handled the write,
+# the other workers pick up the change when their entry expires (at most PRINCIPAL_CACHE_TTL seconds).
+_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL) if PRINCIPAL_CACHE_SIZE > 0 else None
+_lock = threading.Lock()
+
+def get_principal(user_id: UUID) -> schema_users.Principal | None:
+    if _cache is None:
+        return None
+    with _lock:
+        return _cache.get(user_id)
+
+def set_principal(principal: schema_users.Principal):
+    if _cache is None:
+        return
+    with _lock:
+        _cache[principal.id] = principal
+
+def invalidate_principal(user_id: UUID):
+    if _cache is None:
+        return
+    with _lock:
+        _cache.pop(user_id, None)
+
+def clear():
+    if _cache is None:
+        return
+    with _lock:
+        _cache.clear()
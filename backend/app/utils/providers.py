@@ -0,0 +1,43 @@
+import importlib
+import threading
+
+# The OAuth2 providers by name, as "module:class". The module is imported and the provider made when it is first
+# used: the Google client (google.auth, httpx, an SSL context) costs nothing to the workers that never see a
+# Google login before it, and nothing to the tools that import the app without serving it.
+# Every provider has get_authorization_url() -> (url, state), async exchange_authorization_code(code) -> user info
+# (raising ValueError when the code is refused) and async aclose()
+PROVIDER_CLASSES = {
+    "google": "app.utils.google_auth:GoogleAuth",
+    "test": "app.utils.mock_auth:MockAuth",
+}
+
+_providers = {}
+_lock = threading.Lock()  # the login route is sync (thread pool), the callback async
+
+def get_provider(name: str):
+    """
+    The provider registered as `name` (made on first use), or None if there is none.
+    """
+    provider = _providers.get(name)
+    if provider is not None or name not in PROVIDER_CLASSES:
+        return provider
+    with _lock:
+        if name not in _providers:
+            module_name, class_name = PROVIDER_CLASSES[name].split(":")
+            _providers[name] = getattr(importlib.import_module(module_name), class_name)()
+        return _providers[name]
+
+def preload():
+    """
+    Makes every provider now (before the workers are forked, so their modules are shared).
+    """
+    for name in PROVIDER_CLASSES:
+        get_provider(name)
+
+async def aclose():
+    # only the providers that were made have clients to close
+    with _lock:
+        providers = list(_providers.values())
+        _providers.clear()
+    for provider in providers:
+        await provider.aclose()
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# statements slower than this are logged (WARNING) with their parameters and query plan
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# "true" adds X-DB-Query-Count / X-DB-Time-Ms to the responses (the counts of the statements run before the response starts)
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", "false").lower() == "true"
+
+class QueryStats:
+    """
+    The SQL statements run on behalf of one request (or of one capture_queries block).
+    """
+
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: list[str] | None = [] if keep_statements else None
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, seconds: float):
+        # the sync sessions run in the thread pool: one request's statements can come from several threads
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            if self.statements is not None:
+                self.statements.append(statement)
+
+_request_stats: ContextVar[QueryStats | None] = ContextVar("request_query_stats", default=None)
+_captures: set[QueryStats] = set()
+
+def instrument_engine(engine: Engine):
+    """
+    Counts and times every statement of the engine (for an AsyncEngine, pass its sync_engine).
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+    for capture in tuple(_captures):
+        capture.add(statement, elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        plan = _explain(conn, statement, parameters) if SLOW_QUERY_EXPLAIN and not executemany else None
+        logger.warning("Slow query (%.1f ms): %s\nParameters: %r\nPlan: %s", elapsed * 1000, statement,
+                       parameters, plan, extra={"db_time_ms": round(elapsed * 1000, 3)})
+
+def _explain(conn, statement: str, parameters) -> list | None:
+    if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        # a new cursor on the same DBAPI connection: not the statement's (its rows are not fetched yet)
+        # and not through SQLAlchemy (which would count and time the EXPLAIN itself)
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+
+@contextmanager
+def capture_queries(keep_statements: bool = True):
+    """
+    Collects every statement run (by any request, on any thread) inside the block, e.g. around a TestClient call.
+    """
+    stats = QueryStats(keep_statements)
+    _captures.add(stats)
+    try:
+        yield stats
+    finally:
+        _captures.discard(stats)
+
+@contextmanager
+def assert_max_queries(maximum: int):
+    """
+    Test helper: fails if the block runs more than `maximum` statements, so N+1 regressions fail CI.
+
+        with assert_max_queries(2):
+            client.get("/users/me", headers=headers)
+    """
+    with capture_queries() as stats:
+        yield stats
+    if stats.count > maximum:
+        statements = "\n".join(f"  {i}. {statement}" for i, statement in enumerate(stats.statements, 1))
+        raise AssertionError(f"{stats.count} queries, expected at most {maximum}:\n{statements}")
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting the statements and the database time of every HTTP request.
+
+    They are logged (DEBUG, with the db_queries / db_time_ms fields) when the request ends, and with
+    QUERY_STATS_HEADERS also sent as response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and QUERY_STATS_HEADERS:
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-db-query-count", str(stats.count).encode()),
+                    (b"x-db-time-ms", f"{stats.seconds * 1000:.3f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _request_stats.reset(token)
+            logger.debug("%s %s: %d queries in %.3f ms", scope["method"], scope["path"], stats.count,
+                         stats.seconds * 1000, extra={"db_queries": stats.count, "db_time_ms": round(stats.seconds * 1000, 3)})
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from itertools import count
+from uuid import UUID
+
+from cachetools import TTLCache
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.database import ASYNC_DB, open_db, replica_engines
+
+logger = logging.getLogger(__name__)
+
+# a replica further behind the primary than this (seconds) is not read from until it catches up
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "2"))
+# how often the replicas' state and lag are checked (seconds)
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+# after a write, the user's reads go to the primary for this long (seconds): it must exceed what a replica in
+# use can be behind, REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+READ_YOUR_WRITES_SIZE = int(os.getenv("READ_YOUR_WRITES_SIZE", "100000"))
+
+class Replica:
+    def __init__(self, name: str, engine: Engine, async_engine: AsyncEngine | None = None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.async_session_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) \
+            if async_engine is not None else None
+        # unusable until the first check
+        self.healthy = False
+        self.lag: float | None = None
+
+    def probe(self) -> float:
+        """
+        The replication lag in seconds (blocking). Raises if the replica is down or doesn't replicate.
+        """
+        with self.engine.connect() as connection:
+            if connection.dialect.name not in ("mysql", "mariadb"):
+                # the SQLite stand-ins of the tests don't replicate
+                connection.execute(text("SELECT 1"))
+                return 0.0
+            status = connection.execute(text("SHOW SLAVE STATUS")).mappings().first()
+            if status is None:
+                raise RuntimeError("Not a replica")
+            if status["Seconds_Behind_Master"] is None:
+                raise RuntimeError("The replication is stopped")
+            return float(status["Seconds_Behind_Master"])
+
+class ReplicaSet:
+    """
+    Routes the read-only sessions: to a replica (round robin) unless the user wrote in the last
+    `read_your_writes_window` seconds, or no replica is up and within `max_lag` of the primary.
+
+    The recent writers are known per worker, like the principal cache: a write made through another worker
+    doesn't make the user's reads here sticky, only the lag limit bounds what they can miss.
+    """
+
+    def __init__(self, replicas: list[Replica], max_lag: float = REPLICA_MAX_LAG,
+                 read_your_writes_window: float = READ_YOUR_WRITES_WINDOW, check_interval: float = REPLICA_CHECK_INTERVAL,
+                 clock=time.monotonic):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._writers = TTLCache(maxsize=READ_YOUR_WRITES_SIZE, ttl=read_your_writes_window, timer=clock)
+        self._lock = threading.Lock()
+        self._next = count()
+        self._task: asyncio.Task | None = None
+
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.fallback_reads = 0
+
+    def record_write(self, user_id: UUID):
+        if self.replicas:
+            with self._lock:
+                self._writers[user_id] = True
+
+    def wrote_recently(self, user_id: UUID) -> bool:
+        with self._lock:
+            return user_id in self._writers
+
+    def choose(self, user_id: UUID | None) -> Replica | None:
+        """
+        The replica to read from, or None for the primary.
+        """
+        if not self.replicas:
+            return None
+        if user_id is not None and self.wrote_recently(user_id):
+            self.sticky_reads += 1
+            return None
+        usable = [replica for replica in self.replicas if replica.healthy and replica.lag <= self.max_lag]
+        if not usable:
+            self.fallback_reads += 1
+            return None
+        self.replica_reads += 1
+        return usable[next(self._next) % len(usable)]
+
+    def check(self):
+        """
+        Probes every replica (blocking).
+        """
+        for replica in self.replicas:
+            try:
+                replica.lag = replica.probe()
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning("Replica %s is down, its reads go to the primary: %s", replica.name, e)
+                replica.healthy = False
+                continue
+            if not replica.healthy:
+                logger.info("Replica %s is up (%.1f s behind the primary)", replica.name, replica.lag)
+            replica.healthy = True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await run_in_threadpool(self.check)
+
+    async def start(self):
+        if self.replicas and self._task is None:
+            await run_in_threadpool(self.check)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @asynccontextmanager
+    async def open_read_db(self, user_id: UUID | None = None, primary: Session | AsyncSession | None = None):
+        """
+        Opens a session for reads only: on a replica when possible, on the primary otherwise (the `primary`
+        session of the request if there is one, so a request never holds two primary connections). A replica
+        that fails to give a connection is marked down (until its next check) and the primary is used.
+        """
+        replica = self.choose(user_id)
+        db = None
+        if replica is not None:
+            try:
+                db = await _connect(replica)
+            except DBAPIError as e:
+                logger.warning("Replica %s is down, its reads go to the primary: %s", replica.name, e)
+                replica.healthy = False
+                self.replica_reads -= 1
+                self.fallback_reads += 1
+
+        if db is None:
+            if primary is not None:
+                yield primary
+                return
+            async with open_db() as db:
+                yield db
+            return
+
+        if primary is not None and primary.in_transaction():
+            # the primary connection the authentication used goes back to the pool for the rest of the request
+            await _close(primary)
+        try:
+            yield db
+        finally:
+            await _close(db)
+
+    def stats(self) -> dict:
+        return {
+            "replicas": {replica.name: {"healthy": replica.healthy, "lag": replica.lag} for replica in self.replicas},
+            "replica_reads": self.replica_reads,
+            "sticky_reads": self.sticky_reads,
+            "fallback_reads": self.fallback_reads,
+        }
+
+async def _close(db: Session | AsyncSession):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+async def _connect(replica: Replica):
+    # the connection is checked out now, so a replica that is down is found before the route uses the session
+    if ASYNC_DB:
+        db = replica.async_session_factory()
+        try:
+            await db.connection()
+        except BaseException:
+            await db.close()
+            raise
+        return db
+    db = replica.session_factory()
+    try:
+        await run_in_threadpool(db.connection)
+    except BaseException:
+        await _close(db)
+        raise
+    return db
+
+REPLICAS = ReplicaSet([Replica(f"replica_{index}", engine, async_engine)
+                       for index, (engine, async_engine) in enumerate(replica_engines)])
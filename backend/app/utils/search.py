@@ -0,0 +1,34 @@
+import html
+import re
+
+MAX_SEARCH_TERMS = 10
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+def search_terms(query: str) -> list[str]:
+    """
+    Splits a search query into the words given to the full-text index (the operators of
+    MariaDB / FTS5 are not exposed to the users).
+    """
+    terms = []
+    for term in re.findall(r"\w+", query.lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_SEARCH_TERMS]
+
+def highlight(content: str, terms: list[str]) -> str:
+    """
+    Returns the HTML-escaped content with every whole-word occurrence of the terms wrapped in <mark></mark>.
+    """
+    if not terms:
+        return html.escape(content)
+
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+    parts = []
+    last_end = 0
+    for match in pattern.finditer(content):
+        parts.append(html.escape(content[last_end:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        last_end = match.end()
+    parts.append(html.escape(content[last_end:]))
+    return "".join(parts)
@@ -0,0 +1,117 @@
+import bisect
+import hashlib
+import os
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.database import ASYNC_DB, open_db, shard_engines
+from app.models.users import SHARD_METADATA
+
+# shards that get no new user, and that the rebalancing empties (before they are removed), comma-separated
+NOTES_SHARDS_DRAINING = [name.strip() for name in os.getenv("NOTES_SHARDS_DRAINING", "").split(",") if name.strip()]
+# points of every shard on the hash ring: more of them even out the shares of the shards
+HASH_RING_VNODES = int(os.getenv("HASH_RING_VNODES", "128"))
+
+class ShardMoved(Exception):
+    """
+    The notes of the user were moved to another shard after the session was routed (the write was rolled back).
+    """
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hashing over the shard names: every shard has `vnodes` points on a 64-bit ring, a key belongs to
+    the first point at or after its hash. Adding a shard only moves the keys it takes (about 1/N of them, all to
+    it), removing one only moves its own keys.
+    """
+
+    def __init__(self, nodes: list[str], vnodes: int = HASH_RING_VNODES):
+        points = sorted((_hash(f"{node}#{index}".encode()), node) for node in nodes for index in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: bytes) -> str | None:
+        if not self._nodes:
+            return None
+        return self._nodes[bisect.bisect_left(self._hashes, _hash(key)) % len(self._nodes)]
+
+class Shard:
+    def __init__(self, name: str, engine: Engine, async_engine: AsyncEngine | None = None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        # the shard is in the info of its sessions, so a write can check it is where the notes of the user are
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine, info={"shard": name})
+        self.async_session_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False,
+                                                        info={"shard": name}) if async_engine is not None else None
+
+class ShardSet:
+    """
+    Where the notes of a user are: on the shard named by users.notes_shard, or in the notes table of the primary
+    when it is NULL (the users from before the sharding, and every user when there is no shard).
+
+    The hash ring places the new users, and tells the resharding tool (app.tools.reshard) where every user
+    belongs: a change of the shards moves only the users whose shard on the ring changed, online.
+    """
+
+    def __init__(self, shards: list[Shard], draining: list[str] = ()):
+        self.shards = {shard.name: shard for shard in shards}
+        self.draining = [name for name in draining if name in self.shards]
+        self.ring = HashRing([name for name in self.shards if name not in self.draining])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shards)
+
+    def shard_for(self, user_id: UUID) -> str | None:
+        """
+        The shard where the user belongs (None: the primary, when no shard takes users).
+        """
+        return self.ring.node_for(user_id.bytes)
+
+    def get(self, name: str) -> Shard:
+        try:
+            return self.shards[name]
+        except KeyError:
+            raise RuntimeError(f"The notes shard {name} is not configured") from None
+
+    def create_schemas(self):
+        """
+        Creates the notes table on the shards that don't have it (blocking).
+        """
+        for shard in self.shards.values():
+            SHARD_METADATA.create_all(bind=shard.engine)
+
+    @asynccontextmanager
+    async def open_notes_db(self, shard_name: str | None, primary: Session | AsyncSession | None = None):
+        """
+        Opens a session on the shard named `shard_name`. None is the primary: the `primary` session (of the
+        request) if there is one, a new one otherwise.
+        """
+        if shard_name is None:
+            if primary is not None:
+                yield primary
+                return
+            async with open_db() as db:
+                yield db
+            return
+
+        shard = self.get(shard_name)
+        db = shard.async_session_factory() if ASYNC_DB else shard.session_factory()
+        try:
+            yield db
+        finally:
+            if isinstance(db, AsyncSession):
+                await db.close()
+            else:
+                await run_in_threadpool(db.close)
+
+SHARDS = ShardSet([Shard(name, engine, async_engine) for name, (engine, async_engine) in shard_engines.items()],
+                  NOTES_SHARDS_DRAINING)
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import orjson
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger(__name__)
+
+# RS256/EdDSA: a directory of PEM private keys named <kid>.pem. All of them verify tokens and are published
+# in /.well-known/jwks.json; JWT_SIGNING_KID (by default the last kid in name order) signs the new ones.
+# Rotation: add the new key, wait JWKS_MAX_AGE so the verifiers have it, then make it the signing key;
+# remove the old one when the last token it signed has expired.
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "")
+JWT_SIGNING_KID = os.getenv("JWT_SIGNING_KID", "")
+# how long the verifiers may cache the JWKS document
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+# RS256/EdDSA without keys in JWT_KEYS_DIR: sign with a key made at startup instead of refusing to start
+# (always allowed in the TEST stage)
+JWT_ALLOW_TEMPORARY_KEY = os.getenv("JWT_ALLOW_TEMPORARY_KEY", "false").lower() == "true" or os.getenv("STAGE") == "TEST"
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "EdDSA")
+
+class SigningKey:
+    """
+    A loaded key (parsed once: PyJWT would parse a PEM again on every signature and verification).
+    """
+    __slots__ = ("kid", "algorithm", "private_key", "public_key", "jwk")
+
+    def __init__(self, kid: str | None, algorithm: str, private_key, public_key, jwk: dict | None = None):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = public_key
+        self.jwk = jwk
+
+    @classmethod
+    def from_private_key(cls, kid: str, private_key) -> "SigningKey":
+        public_key = private_key.public_key()
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            algorithm, jwk = "RS256", RSAAlgorithm.to_jwk(public_key, as_dict=True)
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            algorithm, jwk = "EdDSA", OKPAlgorithm.to_jwk(public_key, as_dict=True)
+        else:
+            raise ValueError(f"Unsupported signing key type for kid {kid!r} (RSA or Ed25519 only)")
+        jwk.update({"kid": kid, "alg": algorithm, "use": "sig"})
+        return cls(kid, algorithm, private_key, public_key, jwk)
+
+class KeyRing:
+    """
+    The signing keys by kid. A token with a kid this worker doesn't know (a key added after it started, during
+    a rotation) reloads the directory, at most once every `min_reload_interval` seconds.
+    """
+
+    def __init__(self, keys: dict[str | None, SigningKey], signing_kid: str | None, keys_dir: str = "",
+                 min_reload_interval: float = 30, clock=time.monotonic):
+        self.keys_dir = keys_dir
+        self.min_reload_interval = min_reload_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._reloaded_at = clock()
+        self._set(keys, signing_kid)
+
+    def _set(self, keys: dict[str | None, SigningKey], signing_kid: str | None):
+        if signing_kid not in keys:
+            raise ValueError(f"The signing key {signing_kid!r} is not one of the keys")
+        jwks = orjson.dumps({"keys": [key.jwk for key in keys.values() if key.jwk is not None]})
+        # replaced together (readers take a reference, never a lock)
+        self._state = (keys, keys[signing_kid], jwks, f'"{hashlib.sha256(jwks).hexdigest()[:32]}"')
+
+    @property
+    def signing_key(self) -> SigningKey:
+        return self._state[1]
+
+    def get(self, kid: str | None) -> SigningKey | None:
+        key = self._state[0].get(kid)
+        if key is None and kid is not None and self.keys_dir and self.clock() - self._reloaded_at >= self.min_reload_interval:
+            self.reload()
+            key = self._state[0].get(kid)
+        return key
+
+    def reload(self):
+        with self._lock:
+            self._reloaded_at = self.clock()
+            try:
+                keys = load_keys_dir(self.keys_dir)
+                self._set(keys, JWT_SIGNING_KID or self.signing_key.kid)
+            except (OSError, ValueError):
+                logger.exception("Failed to reload the signing keys from %s", self.keys_dir)
+
+    def jwks(self) -> tuple[bytes, str]:
+        """
+        The JWKS document of the public keys and its ETag.
+        """
+        _, _, jwks, etag = self._state
+        return jwks, etag
+
+def load_keys_dir(keys_dir: str) -> dict[str, SigningKey]:
+    keys = {}
+    for path in sorted(Path(keys_dir).glob("*.pem")):
+        private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+        keys[path.stem] = SigningKey.from_private_key(path.stem, private_key)
+    return keys
+
+def generate_key(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return ed25519.Ed25519PrivateKey.generate()
+
+def load_key_ring(algorithm: str, secret_key: str, keys_dir: str = JWT_KEYS_DIR, signing_kid: str = JWT_SIGNING_KID,
+                  allow_temporary_key: bool = JWT_ALLOW_TEMPORARY_KEY) -> KeyRing:
+    """
+    HS256 (or another HMAC algorithm): the shared secret, without a kid and with nothing to publish.
+    RS256/EdDSA: the keys of keys_dir. Raises a ValueError if there is none, unless allow_temporary_key: then a
+    key is made at startup (development only: its tokens are refused by the other workers and after a restart).
+    """
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        return KeyRing({None: SigningKey(None, algorithm, secret_key, secret_key)}, None)
+
+    keys = load_keys_dir(keys_dir) if keys_dir else {}
+    if not keys:
+        if not allow_temporary_key:
+            raise ValueError(f"No signing keys in JWT_KEYS_DIR ({keys_dir!r}) for {algorithm}: add <kid>.pem keys "
+                             "or set JWT_ALLOW_TEMPORARY_KEY=true (development only)")
+        logger.warning("No signing keys in JWT_KEYS_DIR, signing the tokens with a temporary %s key", algorithm)
+        kid = f"temporary-{os.urandom(4).hex()}"
+        keys = {kid: SigningKey.from_private_key(kid, generate_key(algorithm))}
+    return KeyRing(keys, signing_kid or list(keys)[-1], keys_dir)
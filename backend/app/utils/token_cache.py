@@ -0,0 +1,58 @@
+import hashlib
+import os
+import threading
+import time
+
+from cachetools import TLRUCache
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+def _expires_at(key: bytes, claims: dict, now: float) -> float:
+    # an entry lives exactly as long as the token it verified
+    return claims["exp"]
+
+# Verified JWT claims by SHA-256 digest of the token (LRU, every entry expires at the token's exp)
+_cache = TLRUCache(maxsize=TOKEN_CACHE_SIZE, ttu=_expires_at, timer=time.time) if TOKEN_CACHE_SIZE > 0 else None
+_lock = threading.Lock()
+
+hits = 0
+misses = 0
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def get_claims(token: str) -> dict | None:
+    global hits, misses
+    if _cache is None:
+        return None
+    with _lock:
+        claims = _cache.get(token_digest(token))
+        if claims is None:
+            misses += 1
+        else:
+            hits += 1
+        return claims
+
+def set_claims(token: str, claims: dict):
+    # tokens without an expiration are never cached, so nothing can outlive its token
+    if _cache is None or not isinstance(claims.get("exp"), (int, float)):
+        return
+    with _lock:
+        _cache[token_digest(token)] = claims
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "size": len(_cache) if _cache is not None else 0,
+            "maxsize": TOKEN_CACHE_SIZE,
+            "hits": hits,
+            "misses": misses,
+        }
+
+def clear():
+    global hits, misses
+    with _lock:
+        if _cache is not None:
+            _cache.clear()
+        hits = 0
+        misses = 0
@@ -0,0 +1,30 @@
+# gunicorn -c gunicorn.conf.py app.main:app
+#
+# The master imports the app once (preload_app) and forks the workers: the modules, the models and the
+# providers made in when_ready are shared copy-on-write instead of being loaded again by every worker.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '80')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from app.utils import providers
+    providers.preload()
+    # the objects of the master are left out of the workers' garbage collections, which would otherwise
+    # write to (and so copy) the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # a connection of the master's pools (the primary's, the replicas' and the shards') can't be used by two
+    # processes (the import opens none, but a hook might)
+    from app import database
+    for engine, async_engine in [(database.engine, database.async_engine), *database.replica_engines,
+                                 *database.shard_engines.values()]:
+        engine.dispose(close=False)
+        if async_engine is not None:
+            async_engine.sync_engine.dispose(close=False)
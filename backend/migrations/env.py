@@ -0,0 +1,62 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database import Base, engine
+from app.models import users  # noqa: F401 (registers the tables on Base.metadata)
+
+config = context.config
+
+if config.config_file_name is not None:
+    # keeps the app's loggers (e.g. the slow query log) working when the migrations run in process
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # the FTS5 table standing in for the FULLTEXT index on SQLite (and its shadow tables) is not part of the models
+    if type_ == "table" and name.startswith("notes_fts"):
+        return False
+    # the FULLTEXT index only exists on MariaDB / MySQL (Index.ddl_if, which autogenerate does not look at)
+    if type_ == "index" and name == "ix_notes_content_fulltext":
+        return context.get_bind().dialect.name in ("mysql", "mariadb")
+    return True
+
+
+def run_migrations_offline() -> None:
+    """Emits the migrations as SQL to the script output, without connecting to the database."""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Runs the migrations with the engine of app.database, or with the connection given by the caller (tests)."""
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+
+    with engine.connect() as connection:
+        _run_migrations(connection)
+
+
+def _run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,50 @@
+"""initial schema (the tables create_all() used to make at startup)
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.UUID(as_uuid=True), nullable=False),
+        sa.Column('email', sa.String(length=100), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_date', sa.DateTime(), nullable=True),
+        sa.Column('last_login_date', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+
+    op.create_table(
+        'notes',
+        sa.Column('id', sa.UUID(as_uuid=True), nullable=False),
+        sa.Column('content', sa.String(length=100), nullable=False),
+        sa.Column('user_id', sa.UUID(as_uuid=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_notes_id', 'notes', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notes_id', table_name='notes')
+    op.drop_table('notes')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,31 @@
+"""index the notes by user
+
+(user_id, id) serves both the lookups by user_id (leftmost prefix) and the
+keyset pagination of GET /me/notes (WHERE user_id = ? AND id > ? ORDER BY id).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_notes_user_id_id', 'notes', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    # MariaDB refuses to drop the only index usable by the notes.user_id foreign key
+    op.create_index('ix_notes_user_id', 'notes', ['user_id'], unique=False)
+    op.drop_index('ix_notes_user_id_id', table_name='notes')
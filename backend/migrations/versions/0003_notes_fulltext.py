@@ -0,0 +1,53 @@
+"""full-text index on the notes content
+
+MariaDB gets a FULLTEXT index. SQLite gets an external content FTS5 table
+kept current by triggers, filled from the existing notes.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE notes_fts USING fts5(content, content='notes', content_rowid='rowid')",
+    "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END",
+    "CREATE TRIGGER notes_fts_update AFTER UPDATE OF content ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect in ("mysql", "mariadb"):
+        op.create_index('ix_notes_content_fulltext', 'notes', ['content'], unique=False,
+                        mysql_prefix='FULLTEXT', mariadb_prefix='FULLTEXT')
+    elif dialect == "sqlite":
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect in ("mysql", "mariadb"):
+        op.drop_index('ix_notes_content_fulltext', table_name='notes')
+    elif dialect == "sqlite":
+        for trigger in ("notes_fts_insert", "notes_fts_delete", "notes_fts_update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS notes_fts")
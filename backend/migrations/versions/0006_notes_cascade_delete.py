@@ -0,0 +1,68 @@
+"""notes deleted with their user by the database, accounts being purged
+
+The foreign key of notes.user_id gets ON DELETE CASCADE (and a name).
+users.deleted_at marks an account whose notes are purged in the background.
+SQLite rebuilds the notes table for the new foreign key, so the FTS5
+triggers are made again and the index is rebuilt.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_notes_user_id_users'
+# names the unnamed foreign key of 0001 in the SQLite batch (MariaDB named it itself, e.g. notes_ibfk_1)
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+SQLITE_FTS_TRIGGERS = [
+    "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END",
+    "CREATE TRIGGER notes_fts_update AFTER UPDATE OF content ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+    "INSERT INTO notes_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')",
+]
+
+
+def _replace_user_fk(ondelete: Union[str, None]) -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        with op.batch_alter_table('notes', naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+            batch_op.create_foreign_key(FK_NAME, 'users', ['user_id'], ['id'], ondelete=ondelete)
+        # the rebuilt table lost its triggers, and its rowids may differ from the ones the FTS index knows
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+        return
+
+    for foreign_key in sa.inspect(bind).get_foreign_keys('notes'):
+        if foreign_key['constrained_columns'] == ['user_id']:
+            op.drop_constraint(foreign_key['name'], 'notes', type_='foreignkey')
+    op.create_foreign_key(FK_NAME, 'notes', 'users', ['user_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_users_deleted_at', 'users', ['deleted_at'], unique=False)
+    _replace_user_fk('CASCADE')
+
+
+def downgrade() -> None:
+    _replace_user_fk(None)
+    op.drop_index('ix_users_deleted_at', table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,28 @@
+"""the shard holding a user's notes (sharding of the notes, see app.utils.shards)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL for every existing user: their notes stay in the notes table of the primary until the resharding tool
+    # moves them (python -m app.tools.reshard rebalance)
+    op.add_column('users', sa.Column('notes_shard', sa.String(length=50), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'notes_shard')
@@ -0,0 +1,98 @@
+"""users and notes keyed by 16-byte binary UUIDs
+
+users.id, notes.id and notes.user_id become BINARY(16) (app.models.types.BinaryUUID): the bytes of the UUID,
+in the order of its text form, so the time-ordered ids the application now makes (UUIDv7) are appended to the
+primary key index. The existing ids keep their values (the API, the tokens and the cursors don't change); they
+are only stored in the new format. revoked_tokens.jti and revoked_tokens.user_id follow, so the user ids are
+stored the same way everywhere.
+
+MariaDB: new columns are filled from the text form of the old ones, then swapped in with one ALTER TABLE per
+table (one rebuild), the foreign key is dropped meanwhile. SQLite: UUID and BINARY(16) have the same (NUMERIC)
+affinity, the declared type is kept and only the stored values change, from 32 hex characters to 16 bytes.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_notes_user_id_users'
+KEY_COLUMNS = {'users': ['id'], 'notes': ['id', 'user_id'], 'revoked_tokens': ['jti', 'user_id']}
+PRIMARY_KEYS = {'users': 'id', 'notes': 'id', 'revoked_tokens': 'jti'}
+# the indexes holding the key columns, made again with the new columns
+KEY_INDEXES = {'users': {'ix_users_id': ['id']}, 'notes': {'ix_notes_id': ['id'], 'ix_notes_user_id_id': ['user_id', 'id']},
+               'revoked_tokens': {}}
+# where the swapped columns go, so the tables look as before
+COLUMN_POSITIONS = {'users': {'id': 'FIRST'}, 'notes': {'id': 'FIRST', 'user_id': 'AFTER content'},
+                    'revoked_tokens': {'jti': 'FIRST', 'user_id': 'AFTER jti'}}
+SQLITE_BATCH_SIZE = 1000
+
+
+def _mariadb_convert(column_type: str, convert: str) -> None:
+    op.execute(f"ALTER TABLE notes DROP FOREIGN KEY {FK_NAME}")
+    for table, columns in KEY_COLUMNS.items():
+        op.execute(f"ALTER TABLE {table} " + ", ".join(f"ADD COLUMN {column}_new {column_type} NULL" for column in columns))
+        op.execute(f"UPDATE {table} SET " + ", ".join(f"{column}_new = {convert.format(column=column)}" for column in columns))
+        changes = ["DROP PRIMARY KEY", *(f"DROP INDEX {index}" for index in KEY_INDEXES[table])]
+        for column in columns:
+            changes += [f"DROP COLUMN {column}",
+                        f"CHANGE COLUMN {column}_new {column} {column_type} NOT NULL {COLUMN_POSITIONS[table][column]}"]
+        changes.append(f"ADD PRIMARY KEY ({PRIMARY_KEYS[table]})")
+        changes += [f"ADD INDEX {index} ({', '.join(index_columns)})" for index, index_columns in KEY_INDEXES[table].items()]
+        op.execute(f"ALTER TABLE {table} " + ", ".join(changes))
+    op.execute(f"ALTER TABLE notes ADD CONSTRAINT {FK_NAME} FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE")
+
+
+def _sqlite_convert(convert) -> None:
+    bind = op.get_bind()
+    # users.id and notes.user_id don't match until both are converted: the foreign key is checked at the commit.
+    # The PRAGMA lasts until the end of the transaction, which pysqlite only opens before the first DML.
+    if not bind.connection.dbapi_connection.in_transaction:
+        bind.exec_driver_sql("BEGIN")
+    op.execute("PRAGMA defer_foreign_keys = ON")
+    for table, columns in KEY_COLUMNS.items():
+        after_rowid = 0
+        while True:
+            rows = bind.execute(sa.text(f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE rowid > :after "
+                                        f"ORDER BY rowid LIMIT {SQLITE_BATCH_SIZE}"), {"after": after_rowid}).all()
+            if not rows:
+                break
+            bind.execute(sa.text(f"UPDATE {table} SET " + ", ".join(f"{column} = :{column}" for column in columns) +
+                                 " WHERE rowid = :rowid"),
+                         [{"rowid": row[0], **{column: convert(value) for column, value in zip(columns, row[1:])}}
+                          for row in rows])
+            after_rowid = rows[-1][0]
+
+
+def _to_bytes(value):
+    return uuid.UUID(value).bytes if isinstance(value, str) else value
+
+
+def _to_hex(value):
+    return uuid.UUID(bytes=bytes(value)).hex if isinstance(value, bytes) else value
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        _sqlite_convert(_to_bytes)
+        return
+    _mariadb_convert('BINARY(16)', "UNHEX(REPLACE(CAST({column} AS CHAR(36)), '-', ''))")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        _sqlite_convert(_to_hex)
+        return
+    _mariadb_convert('UUID', "HEX({column})")